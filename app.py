@@ -1,12 +1,37 @@
+import warnings
 import streamlit as st
-import numpy as np
-import pandas as pd
-import sympy as sp
-from utils.symbolic import SymbolicProcessor
-from utils.plotting import create_plot, create_results_dataframe
-from solvers.taylor import TaylorSolver
-from solvers.rk import RKF45Solver
-from solvers.multistep import ABM4Solver
+from utils.plotting import (create_plot, create_results_dataframe, error_summary, export_results,
+                            MAX_PLOT_POINTS)
+from utils.runner import solve_ode, make_exact_function
+from utils.cache import default_cache
+from utils.instrument import Instrumentation, CProfileHook, NULL_INSTRUMENT
+from solvers.trace import StepTrace
+from utils.trace_view import render_trace, render_instrumentation
+METHOD_KEYS = {
+    "Phương pháp Taylor (Bậc n)": "taylor",
+    "Runge-Kutta-Fehlberg (RKF45)": "rkf45",
+    "Adams-Bashforth-Moulton (ABM4)": "abm4",
+    "Adams PECE bậc/bước thay đổi (1-12)": "adams",
+    "BDF bậc 1-5 (ẩn, cho bài toán cứng)": "bdf",
+    "Rosenbrock 2(3) (ẩn, cho bài toán cứng)": "rosenbrock",
+}
+TAYLOR_BACKENDS = {
+    "Tượng trưng (SymPy)": "symbolic",
+    "Chuỗi lũy thừa (AD)": "ad",
+}
+DOWNSAMPLE_LABELS = {
+    "LTTB (giữ hình dạng)": "lttb",
+    "Min/Max theo nhóm": "minmax",
+}
+TABLE_PAGE_SIZE = 500
+TRACE_TITLES = {
+    "taylor": "Xem chi tiết tính toán từng bước của Taylor",
+    "rkf45": "Xem chi tiết tính toán từng bước của RKF45",
+    "abm4": "Xem chi tiết tính toán từng bước của ABM4 (Predictor-Corrector)",
+    "adams": "Xem chi tiết các bước của Adams PECE (bậc/bước thay đổi)",
+    "bdf": "Xem chi tiết các bước của BDF",
+    "rosenbrock": "Xem chi tiết các bước của Rosenbrock",
+}
 st.set_page_config(layout="wide", page_title="Máy tính ODE Nâng cao")
 st.title("Máy tính Phương pháp Số cho ODE Bậc 1")
 st.markdown("Một công cụ để giải và minh họa các phương pháp số cho các bài toán giá trị ban đầu (IVP) $y' = f(t,y)$.")
@@ -20,81 +45,189 @@ with settings_col:
             indep_var = st.text_input("Biến độc lập", "t")
         with col2:
             dep_var = st.text_input("Biến phụ thuộc", "y")
-        func_str = st.text_input(f"Nhập hàm f({indep_var}, {dep_var}):", f"{dep_var} - {indep_var}**2 + 1")
-        st.caption(f"Ví dụ: `-0.02*({dep_var} - 20)`")
+        func_str = st.text_input(f"Nhập hàm f({indep_var}, {dep_var}):", f"{dep_var} - {indep_var}**2 + 1", key="func_str")
+        st.caption(f"Ví dụ: `-0.02*({dep_var} - 20)`. Hệ phương trình: biến `x, v`, hàm `v; -x`, y0 `1, 0`.")
         st.markdown("**2. Điều kiện Ban đầu và Khoảng**")
         col1, col2 = st.columns(2)
         with col1:
             t0 = st.number_input(f"Giá trị {indep_var} ban đầu (t0)", value=0.0)
         with col2:
-            y0 = st.number_input(f"Giá trị {dep_var} ban đầu (y0)", value=0.5)
+            y0_str = st.text_input(f"Giá trị {dep_var} ban đầu (y0)", "0.5", key="y0")
         col1, col2 = st.columns(2)
         with col1:
             tend = st.number_input(f"Giá trị {indep_var} kết thúc (tend)", value=2.0)
         with col2:
             N = st.number_input("Số bước (N)", value=10, min_value=1, step=1)
-        exact_sol_str = st.text_input("Giải pháp giải tích (tùy chọn)", f"({indep_var}+1)**2 - 0.5*np.exp({indep_var})")
+        exact_sol_str = st.text_input("Giải pháp giải tích (tùy chọn)", f"({indep_var}+1)**2 - 0.5*np.exp({indep_var})", key="exact_sol_str")
         st.caption(f"Dùng 'np.' cho hàm, ví dụ: `np.exp({indep_var})`")
         st.markdown("**3. Lựa chọn Phương pháp**")
-        method_options = ["Phương pháp Taylor (Bậc n)", "Runge-Kutta-Fehlberg (RKF45)", "Adams-Bashforth-Moulton (ABM4)"]
-        method = st.selectbox("Chọn phương pháp giải:", options=method_options)
+        method = st.selectbox("Chọn phương pháp giải:", options=list(METHOD_KEYS))
         taylor_order = 4
+        taylor_backend = "symbolic"
+        adaptive = False
+        rtol, atol = 1e-6, 1e-9
         if method == "Phương pháp Taylor (Bậc n)":
-            taylor_order = st.slider("Chọn bậc Taylor (n)", 1, 10, 4)
+            taylor_order = st.slider("Chọn bậc Taylor (n)", 1, 30, 4)
+            taylor_backend = TAYLOR_BACKENDS[st.radio("Cách tính đạo hàm:", options=list(TAYLOR_BACKENDS), horizontal=True)]
+            if taylor_backend == "ad":
+                adaptive = st.checkbox("Bậc và bước thích nghi (n là bậc tối đa)", value=False)
+        if method == "Runge-Kutta-Fehlberg (RKF45)":
+            adaptive = st.checkbox("Bước thích nghi (kiểm soát sai số 4(5))", value=False)
+        if METHOD_KEYS[method] in ("rkf45", "adams", "bdf", "rosenbrock") or taylor_backend == "ad":
+            col1, col2 = st.columns(2)
+            with col1:
+                rtol = st.number_input("Sai số tương đối (rtol)", value=1e-6, format="%.1e")
+            with col2:
+                atol = st.number_input("Sai số tuyệt đối (atol)", value=1e-9, format="%.1e")
+        st.markdown("**4. Hiển thị Từng bước**")
+        trace_options = {
+            "Phân trang (mọi bước)": "paged",
+            "Mỗi k bước": "every",
+            "M bước đầu và cuối": "headtail",
+            "Tắt (chỉ kết quả)": "off",
+        }
+        trace_label = st.selectbox("Chế độ ghi vết:", options=list(trace_options))
+        col1, col2 = st.columns(2)
+        with col1:
+            trace_k = st.number_input("k (mỗi k bước) / M (đầu-cuối)", value=10, min_value=1, step=1)
+        with col2:
+            page_size = st.number_input("Số bước mỗi trang", value=50, min_value=1, step=1)
+        st.markdown("**5. Hiệu năng**")
+        col1, col2 = st.columns(2)
+        with col1:
+            instrumented = st.checkbox("Đo thời gian từng giai đoạn", value=False)
+        with col2:
+            profiled = st.checkbox("cProfile vòng lặp", value=False)
+        fused = st.checkbox("Vòng lặp hợp nhất (sinh hàm bước riêng cho f; dùng khi tắt ghi vết)", value=False)
         submitted = st.form_submit_button("Giải Phương trình")
 if submitted:
     with main_col:
         st.subheader("Kết quả Phân tích")
-        processor = SymbolicProcessor(indep_var, dep_var, func_str)
-        processor.standardize_expression()
-        processor.get_numeric_function()
-        if processor.f_numeric is None:
-            st.error("Không thể tiếp tục. Vui lòng sửa lỗi phương trình.")
+        st.session_state.pop("ode_run", None)
+        method_key = METHOD_KEYS[method]
+        if method_key == "taylor":
+            st.markdown(f"### Đang chạy: Phương pháp Taylor Bậc {taylor_order}")
         else:
-            solver = None
-            t_values = np.array([])
-            y_values = np.array([])
-            solutions_data = {}
-            try:
-                if method == "Phương pháp Taylor (Bậc n)":
-                    st.markdown(f"### Đang chạy: Phương pháp Taylor Bậc {taylor_order}")
-                    processor.generate_total_derivatives(taylor_order)
-                    if processor.deriv_funcs:
-                        solver = TaylorSolver(processor.deriv_funcs, taylor_order)
-                        t_values, y_values = solver.solve(t0, y0, tend, N)
-                        solutions_data[f'y_Taylor(Bậc {taylor_order})'] = y_values
-                elif method == "Runge-Kutta-Fehlberg (RKF45)":
-                    st.markdown("### Đang chạy: Runge-Kutta-Fehlberg (RKF45)")
-                    solver = RKF45Solver(processor.f_numeric)
-                    t_values, y_values = solver.solve(t0, y0, tend, N)
-                    solutions_data['y_RKF45'] = y_values
-                elif method == "Adams-Bashforth-Moulton (ABM4)":
-                    st.markdown("### Đang chạy: Adams-Bashforth-Moulton (ABM4)")
-                    solver = ABM4Solver(processor.f_numeric)
-                    t_values, y_values = solver.solve(t0, y0, tend, N)
-                    solutions_data['y_ABM4'] = y_values
-                exact_func = None
-                if exact_sol_str:
-                    try:
-                        safe_dict = {"np": np}
-                        exact_func = eval(f"lambda {indep_var}: {exact_sol_str}", safe_dict)
-                        exact_func(np.array([t0, tend]))
-                    except Exception as e:
-                        st.warning(f"Lỗi khi phân tích giải pháp giải tích: {e}. Bỏ qua soảng.")
-                        exact_func = None
-                if t_values.size > 0:
-                    df_results = create_results_dataframe(t_values, solutions_data, exact_func)
-                    st.markdown("**Kết quả Tóm tắt và Phân tích Lỗi**")
-                    st.dataframe(df_results.style.format("{:.6f}"))
-                    fig = create_plot(df_results, f"So sánh Giải pháp cho y' = {func_str}")
-                    st.pyplot(fig)
-                else:
-                    st.error("Bộ giải không trả về kết quả. (Nguyên nhân: ABM4 cần N >= 4 hoặc N quá nhỏ)")
-            except Exception as e:
-                st.error(f"Đã xảy ra lỗi trong quá trình chạy bộ giải: {e}")
-                import traceback
-                st.code(traceback.format_exc())
-else:
+            st.markdown(f"### Đang chạy: {method}")
+        trace = StepTrace(trace_options[trace_label], every=trace_k, head=trace_k, tail=trace_k, page_size=page_size)
+        instrument = Instrumentation() if instrumented or profiled else None
+        profiler = instrument.add_hook(CProfileHook()) if profiled else None
+        try:
+            y0 = [float(v) for v in y0_str.split(",")]
+            y0 = y0[0] if len(y0) == 1 else y0
+            result = solve_ode(func_str, t0, y0, tend, N, method=method_key, order=taylor_order,
+                               indep_var=indep_var, dep_var=dep_var,
+                               adaptive=adaptive, rtol=rtol, atol=atol, trace=trace, taylor_backend=taylor_backend,
+                               cache=None if instrument else default_cache(), instrument=instrument,
+                               fused="loop" if fused else None)
+        except ValueError as e:
+            st.error(str(e))
+            st.error("Không thể tiếp tục. Vui lòng sửa lỗi phương trình hoặc tham số.")
+        except Exception as e:
+            st.error(f"Đã xảy ra lỗi trong quá trình chạy bộ giải: {e}")
+            import traceback
+            st.code(traceback.format_exc())
+        else:
+            trace = result.trace or trace
+            solver = result.solver
+            if result.cached == "hit":
+                st.info(f"Kết quả lấy từ bộ nhớ đệm (lần giải gốc mất {result.elapsed:.4f} s).")
+            elif result.cached == "resumed":
+                st.info(f"Giải tiếp từ trạng thái cuối đã lưu trong bộ nhớ đệm; thống kê bên dưới chỉ tính "
+                        f"đoạn mới ({result.elapsed:.4f} s).")
+            if method_key == "taylor" and taylor_backend == "ad":
+                st.success(f"Hệ số Taylor được tính bằng số học chuỗi lũy thừa "
+                           f"({len(result.processor.series_tape)} phép toán trên băng).")
+                if adaptive and solver is not None:
+                    st.caption(f"Số bước: {solver.n_accepted}, bậc {solver.adaptive_order}. "
+                               f"Kết quả được đánh giá từ đa thức Taylor của từng bước trên lưới đều {N + 1} điểm.")
+            elif method_key == "taylor":
+                st.success(f"Đã tạo thành công {taylor_order} đạo hàm tượng trưng.")
+                with st.expander("Xem các đạo hàm tượng trưng đã được tạo"):
+                    program = result.processor.deriv_program
+                    st.markdown("Hệ thống đã tự động tính toán các đạo hàm toàn phần sau (sử dụng quy tắc chuỗi):")
+                    for line in result.processor.derivatives_latex():
+                        st.latex(line)
+                    st.caption(f"Chỉ hiển thị tối đa 4 bậc đầu. Bộ giải dùng một kernel duy nhất gồm "
+                               f"{len(program.assignments)} biến trung gian cho cả {program.order} bậc.")
+            if solver is not None and method_key == "rkf45" and adaptive:
+                st.caption(f"Bước chấp nhận: {solver.n_accepted}, bị loại: {solver.n_rejected}, "
+                           f"số lần gọi f: {solver.nfev}. Kết quả được nội suy lên lưới đều {N + 1} điểm.")
+            if solver is not None and method_key == "adams":
+                orders = f", bậc dùng: {min(solver.orders)}-{max(solver.orders)}" if solver.orders else ""
+                st.caption(f"Bước chấp nhận: {solver.n_accepted}, bị loại: {solver.n_rejected}, "
+                           f"số lần gọi f: {solver.nfev}{orders}. "
+                           f"Kết quả được nội suy lên lưới đều {N + 1} điểm.")
+            if solver is not None and method_key in ("bdf", "rosenbrock"):
+                st.caption(f"Bước chấp nhận: {solver.n_accepted}, bị loại: {solver.n_rejected}, "
+                           f"số lần gọi f: {solver.nfev}, Jacobian: {solver.njev}, phân tích ma trận: {solver.n_factor}. "
+                           f"Kết quả được nội suy lên lưới đều {N + 1} điểm.")
+            exact_func = None
+            if exact_sol_str:
+                try:
+                    exact_func = make_exact_function(exact_sol_str, indep_var)
+                except ValueError as e:
+                    st.warning(f"{e}. Bỏ qua so sánh.")
+            with warnings.catch_warnings(record=True) as caught, (instrument or NULL_INSTRUMENT).phase("dataframe"):
+                warnings.simplefilter("always")
+                df_results = create_results_dataframe(result.t_values, {result.label: result.y_values}, exact_func,
+                                                      components=result.processor.dep_var_names)
+            for w in caught:
+                st.warning(str(w.message))
+            trace_title = TRACE_TITLES[method_key]
+            if method_key == "taylor":
+                trace_title = f"{trace_title} (Bậc {taylor_order})"
+            elif adaptive:
+                trace_title = "Xem chi tiết các bước của RKF45 thích nghi"
+            st.session_state["ode_run"] = {
+                "df_results": df_results,
+                "func_str": func_str,
+                "trace": trace,
+                "trace_title": trace_title,
+                "instrument": instrument,
+                "profiler": profiler,
+            }
+if "ode_run" in st.session_state:
+    run = st.session_state["ode_run"]
+    with main_col:
+        if not submitted:
+            st.subheader("Kết quả Phân tích")
+        instrument = run["instrument"] or NULL_INSTRUMENT
+        render_trace(run["trace"], run["trace_title"], key="trace", instrument=instrument)
+        df_results = run["df_results"]
+        st.markdown("**Kết quả Tóm tắt và Phân tích Lỗi**")
+        df_errors = error_summary(df_results)
+        if not df_errors.empty:
+            st.dataframe(df_errors.style.format({"Sai số lớn nhất": "{:.3e}", "t tại sai số lớn nhất": "{:.6f}",
+                                                 "RMS": "{:.3e}", "Sai số tại tend": "{:.3e}"}))
+        n_rows = len(df_results)
+        rows = df_results
+        if n_rows > TABLE_PAGE_SIZE:
+            n_pages = -(-n_rows // TABLE_PAGE_SIZE)
+            page = st.number_input(f"Trang bảng (1 - {n_pages}, {TABLE_PAGE_SIZE} hàng mỗi trang, tổng {n_rows} hàng)",
+                                   min_value=1, max_value=n_pages, value=1, step=1, key="results_page")
+            start = (int(page) - 1) * TABLE_PAGE_SIZE
+            rows = df_results.iloc[start:start + TABLE_PAGE_SIZE]
+        st.dataframe(rows.style.format("{:.6f}"))
+        downsample = "lttb"
+        if n_rows > MAX_PLOT_POINTS:
+            downsample_label = st.radio(f"Rút gọn đồ thị còn {MAX_PLOT_POINTS} điểm mỗi chuỗi",
+                                        list(DOWNSAMPLE_LABELS), horizontal=True, key="downsample")
+            downsample = DOWNSAMPLE_LABELS[downsample_label]
+        with instrument.phase("plot"):
+            fig = create_plot(df_results, f"So sánh Giải pháp cho y' = {run['func_str']}", method=downsample)
+            st.pyplot(fig)
+        with st.expander("Xuất dữ liệu đầy đủ"):
+            st.caption("Ghi toàn bộ bảng (không rút gọn) ra tệp trên máy chủ thay vì gửi lên trình duyệt.")
+            export_path = st.text_input("Đường dẫn tệp (.csv, .parquet hoặc .npz)", "results.csv", key="export_path")
+            if st.button("Ghi tệp", key="export"):
+                try:
+                    st.success(f"Đã ghi {n_rows} hàng vào {export_results(df_results, export_path)}")
+                except (ValueError, OSError, ImportError) as e:
+                    st.error(str(e))
+        if instrument.enabled:
+            render_instrumentation(instrument, run["profiler"])
+elif not submitted:
     with main_col:
         st.info("Chào mừng! Vui lòng nhập các thông số của bạn vào biểu mẫu bên phải và nhấn 'Giải Phương trình'.")
         st.markdown("### Hướng dẫn sử dụng:")
@@ -0,0 +1,281 @@
+import argparse
+import sys
+import time
+import numpy as np
+import pandas as pd
+from utils.runner import (METHODS, TAYLOR_BACKENDS, FUSED_MODES, solve_ode, stream_ode, build_processor, make_exact_function,
+                          exact_values, ensemble_grid)
+from utils.symbolic import split_list
+from solvers.stream import BLOCK_SIZE, Reduction, spill_blocks
+from utils.cache import SolveCache
+from utils.instrument import Instrumentation, CProfileHook
+from utils.plotting import create_results_dataframe, error_summary, export_results
+from utils.benchmark import (BENCH_PROBLEMS, BENCH_CONFIGS, N_LADDER, TOL_LADDER, run_benchmark, observed_orders,
+                             work_precision_plot, save_baseline, load_baseline, compare_baseline)
+from utils.batch import load_spec, expand_spec, run_sweep, summary_frame, write_results
+from utils.parareal import parareal
+def parse_values(text):
+    """
+    Đọc một giá trị hoặc một dãy giá trị cho ensemble:
+    '0.5' -> số, '0,0.5,1' -> mảng, '0:1:101' -> np.linspace(0, 1, 101).
+    """
+    if ":" in text:
+        start, stop, num = text.split(":")
+        return np.linspace(float(start), float(stop), int(num))
+    if "," in text:
+        return np.array([float(v) for v in text.split(",")])
+    return float(text)
+def parse_params(items):
+    params = {}
+    for item in items or []:
+        name, sep, values = item.partition("=")
+        if not sep:
+            raise ValueError(f"Tham số phải có dạng TÊN=GIÁ_TRỊ, nhận được: {item!r}")
+        params[name.strip()] = parse_values(values)
+    return params
+def grid_params(args, params):
+    """Đặt các tham số quét trên lưới ngoài với y0 (xem ensemble_grid)."""
+    n_components = len(split_list(args.dep_var, ","))
+    return ensemble_grid(parse_values(args.y0), params, n_components if n_components > 1 else None)
+def write_ensemble(run, params, path):
+    if path.lower().endswith(".npz"):
+        np.savez_compressed(path, t=run.t_values, y=run.y_values, **params)
+    else:
+        y = run.y_values.reshape(len(run.t_values), -1)
+        df = pd.DataFrame(y, columns=[f"{run.label}[{j}]" for j in range(y.shape[1])])
+        df.insert(0, "t", run.t_values)
+        df.to_csv(path, index=False)
+def cmd_stream(args, grid):
+    if args.adaptive:
+        raise ValueError("Chế độ luồng (--reduce-only, --stream-to) chỉ dùng bước cố định, bỏ --adaptive.")
+    processor = build_processor(args.func, args.indep_var, args.dep_var,
+                                args.order if args.method == "taylor" else None, grid, args.taylor_backend)
+    blocks = stream_ode(args.func, args.t0, parse_values(args.y0), args.tend, args.N, method=args.method,
+                        order=args.order, block_size=args.block_size, processor=processor, params=grid,
+                        taylor_backend=args.taylor_backend, fused=args.fused)
+    exact_func = make_exact_function(args.exact, args.indep_var) if args.exact else None
+    reduction = Reduction((lambda t: exact_values(exact_func, t)) if exact_func else None)
+    start = time.perf_counter()
+    if args.stream_to:
+        t_values, y_values = spill_blocks(reduction.passthrough(blocks), args.stream_to, args.N + 1)
+        print(f"Đã ghi {len(t_values)} điểm vào {args.stream_to} (y) và *_t.npy (t)")
+    else:
+        reduction.consume(blocks)
+    elapsed = time.perf_counter() - start
+    for name, value in reduction.summary().items():
+        print(f"{name}: {value}")
+    print(f"Thời gian giải: {elapsed:.4f} s", file=sys.stderr)
+def print_instrumentation(instrument, profiler=None):
+    print(instrument.dataframe().to_string(index=False, float_format=lambda v: f"{v:.6f}"), file=sys.stderr)
+    for name, count in instrument.evaluations().items():
+        print(f"{name}: {count} lần gọi", file=sys.stderr)
+    for name, value in instrument.stats.items():
+        print(f"{name}: {value}", file=sys.stderr)
+    if profiler is not None:
+        print(profiler.report(20), file=sys.stderr)
+def cmd_solve(args):
+    params = parse_params(args.param)
+    grid = grid_params(args, params)
+    if args.reduce_only or args.stream_to:
+        return cmd_stream(args, grid)
+    instrument = Instrumentation() if args.instrument or args.profile else None
+    profiler = instrument.add_hook(CProfileHook()) if args.profile else None
+    run = solve_ode(args.func, args.t0, parse_values(args.y0), args.tend, args.N, method=args.method, order=args.order,
+                    indep_var=args.indep_var, dep_var=args.dep_var,
+                    adaptive=args.adaptive, rtol=args.rtol, atol=args.atol, params=grid,
+                    taylor_backend=args.taylor_backend,
+                    cache=SolveCache(directory=args.cache_dir) if args.cache_dir else None, instrument=instrument,
+                    fused=args.fused)
+    if instrument is not None:
+        print_instrumentation(instrument, profiler)
+    components = run.processor.dep_var_names if run.processor.is_system else None
+    if run.y_values.ndim > (2 if components else 1):
+        y_end = run.y_values[-1]
+        print(f"Ensemble {y_end.shape}: y(tend) trong [{np.min(y_end):.6f}, {np.max(y_end):.6f}], "
+              f"trung bình {np.mean(y_end):.6f}")
+        if args.output:
+            write_ensemble(run, params, args.output)
+            print(f"Đã ghi ensemble vào {args.output}")
+        print(f"Thời gian giải: {run.elapsed:.4f} s", file=sys.stderr)
+        return
+    exact_func = make_exact_function(args.exact, args.indep_var) if args.exact else None
+    df = create_results_dataframe(run.t_values, {run.label: run.y_values}, exact_func, components=components)
+    if args.output:
+        export_results(df, args.output)
+        print(f"Đã ghi {len(df)} hàng vào {args.output}")
+    else:
+        print(df.to_string(index=False, float_format=lambda v: f"{v:.6f}"))
+    df_errors = error_summary(df)
+    if not df_errors.empty:
+        print(df_errors.to_string(float_format=lambda v: f"{v:.3e}"), file=sys.stderr)
+    print(f"Thời gian giải: {run.elapsed:.4f} s" + (f" (bộ nhớ đệm: {run.cached})" if run.cached else ""),
+          file=sys.stderr)
+def cmd_parareal(args):
+    params = parse_params(args.param)
+    grid = grid_params(args, params)
+    instrument = Instrumentation() if args.instrument else None
+    run = parareal(args.func, args.t0, parse_values(args.y0), args.tend, args.N, args.slices, method=args.method,
+                   order=args.order, indep_var=args.indep_var, dep_var=args.dep_var, params=grid,
+                   taylor_backend=args.taylor_backend, fused=args.fused, coarse_method=args.coarse_method,
+                   coarse_order=args.coarse_order, coarse_steps=args.coarse_steps, tol=args.tol,
+                   max_iter=args.max_iter, workers=args.workers, instrument=instrument)
+    if instrument is not None:
+        print_instrumentation(instrument)
+    status = "hội tụ" if run.converged else "chưa hội tụ"
+    print(f"Parareal: {run.iterations} vòng lặp ({status}), {run.n_slices} lát, {run.workers} tiến trình")
+    for k, delta in enumerate(run.history, start=1):
+        print(f"  vòng {k}: max |U_mới - U_cũ| = {delta:.3e}")
+    print(f"Thời gian: {run.elapsed:.4f} s, ước lượng giải tuần tự: {run.serial_estimate:.4f} s, "
+          f"tăng tốc: {run.speedup:.2f}x")
+    if args.reference:
+        ref = solve_ode(args.func, args.t0, parse_values(args.y0), args.tend, args.N, method=args.method,
+                        order=args.order, indep_var=args.indep_var, dep_var=args.dep_var, params=grid,
+                        taylor_backend=args.taylor_backend, fused=args.fused)
+        print(f"Giải tuần tự: {ref.elapsed:.4f} s, tăng tốc thực: {ref.elapsed / run.elapsed:.2f}x, "
+              f"sai lệch lớn nhất: {np.max(np.abs(run.y_values - ref.y_values)):.3e}")
+    if args.output:
+        if run.y_values.ndim > (2 if run.processor.is_system else 1):
+            write_ensemble(run, params, args.output)
+        else:
+            exact_func = make_exact_function(args.exact, args.indep_var) if args.exact else None
+            components = run.processor.dep_var_names if run.processor.is_system else None
+            df = create_results_dataframe(run.t_values, {run.label: run.y_values}, exact_func, components=components)
+            export_results(df, args.output)
+        print(f"Đã ghi {len(run.t_values)} điểm vào {args.output}")
+def cmd_sweep(args):
+    configs = expand_spec(load_spec(args.spec))
+    print(f"Chạy {len(configs)} cấu hình...", file=sys.stderr)
+    results = run_sweep(configs, workers=args.workers, chunksize=args.chunksize)
+    paths = write_results(results, args.output, trajectories=not args.summary_only)
+    summary = summary_frame(results)
+    n_failed = int((summary["status"] != "ok").sum())
+    print(f"Hoàn thành: {len(results) - n_failed} thành công, {n_failed} lỗi. Đã ghi: {', '.join(paths)}", file=sys.stderr)
+    return 1 if n_failed else 0
+def cmd_bench(args):
+    progress = lambda problem, config, N, tol: print(f"  {problem} / {config} / " + (f"tol={tol:g}" if tol else f"N={N}"),
+                                                     file=sys.stderr)
+    df = run_benchmark(args.problems, args.configs, args.N, args.tols, repeat=args.repeat, memory=not args.no_memory,
+                       progress=progress if args.verbose else None)
+    print(df.to_string(index=False, float_format=lambda v: f"{v:.4g}"))
+    orders = observed_orders(df)
+    if len(orders):
+        print("\nBậc hội tụ quan sát được (bước cố định):")
+        print(orders.to_string(index=False, float_format=lambda v: f"{v:.2f}"))
+    if args.output:
+        df.to_csv(args.output, index=False)
+        print(f"Đã ghi {len(df)} hàng vào {args.output}", file=sys.stderr)
+    if args.plot:
+        for problem in df["problem"].unique():
+            for x in ("nfev", "time"):
+                path = f"{args.plot}_{problem}_{x}.png"
+                work_precision_plot(df, problem, x).savefig(path)
+                print(f"Đã ghi {path}", file=sys.stderr)
+    if args.save_baseline:
+        save_baseline(df, args.save_baseline)
+        print(f"Đã lưu baseline vào {args.save_baseline}", file=sys.stderr)
+    if args.baseline:
+        comparison = compare_baseline(df, load_baseline(args.baseline), time_ratio=args.time_ratio,
+                                      min_time=args.min_time)
+        regressions = comparison[comparison["regression"] != ""]
+        if len(regressions):
+            print(f"\n{len(regressions)} hồi quy so với {args.baseline}:")
+            print(regressions[["problem", "config", "N", "tol", "time_ratio", "nfev", "nfev_base", "error_ratio",
+                               "regression"]].to_string(index=False, float_format=lambda v: f"{v:.4g}"))
+            return 1
+        print(f"Không có hồi quy so với {args.baseline}.", file=sys.stderr)
+def build_parser():
+    parser = argparse.ArgumentParser(description="Giải IVP y' = f(t, y) bằng các phương pháp số (không cần giao diện).")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_solve = sub.add_parser("solve", help="Giải một bài toán và in/ghi bảng kết quả.")
+    p_solve.add_argument("func", help="Biểu thức f(t, y), ví dụ: 'y - t**2 + 1'")
+    p_solve.add_argument("--t0", type=float, default=0.0)
+    p_solve.add_argument("--y0", default="0.5", help="Số, danh sách 'a,b,c' hoặc 'start:stop:num' (ensemble)")
+    p_solve.add_argument("--tend", type=float, default=2.0)
+    p_solve.add_argument("-N", type=int, default=10)
+    p_solve.add_argument("--method", choices=METHODS, default="rkf45")
+    p_solve.add_argument("--order", type=int, default=4, help="Bậc Taylor")
+    p_solve.add_argument("--taylor-backend", choices=TAYLOR_BACKENDS, default="symbolic",
+                         help="Đạo hàm Taylor: kernel tượng trưng hoặc số học chuỗi lũy thừa (ad)")
+    p_solve.add_argument("--adaptive", action="store_true",
+                         help="Bước thích nghi (RKF45, hoặc Taylor với --taylor-backend ad; --order là bậc tối đa)")
+    p_solve.add_argument("--rtol", type=float, default=1e-6)
+    p_solve.add_argument("--atol", type=float, default=1e-9)
+    p_solve.add_argument("--indep-var", default="t")
+    p_solve.add_argument("--dep-var", default="y")
+    p_solve.add_argument("--param", action="append", metavar="NAME=VALUES",
+                         help="Giá trị tham số tự do trong f, ví dụ: k=0.1:1:50 (lặp lại được; mỗi tham số quét "
+                              "và y0 quét là một trục của lưới ensemble)")
+    p_solve.add_argument("--exact", help="Nghiệm giải tích (cú pháp np.), ví dụ: '(t+1)**2 - 0.5*np.exp(t)'")
+    p_solve.add_argument("-o", "--output", help="Tệp đầu ra .csv, .parquet hoặc .npz (đủ độ phân giải)")
+    p_solve.add_argument("--reduce-only", action="store_true",
+                         help="Không lưu quỹ đạo, chỉ in giá trị cuối, min/max và sai số (bước cố định)")
+    p_solve.add_argument("--stream-to", metavar="PATH.npy",
+                         help="Ghi quỹ đạo theo khối vào tệp .npy ánh xạ bộ nhớ (bước cố định)")
+    p_solve.add_argument("--block-size", type=int, default=BLOCK_SIZE, help="Số điểm mỗi khối ở chế độ luồng")
+    p_solve.add_argument("--fused", choices=FUSED_MODES,
+                         help="Taylor/RKF45/ABM4 bước cố định: hàm bước sinh riêng cho f (step) hoặc cả vòng lặp (loop)")
+    p_solve.add_argument("--instrument", action="store_true",
+                         help="In thời gian từng giai đoạn, số lần gọi f và thống kê bước")
+    p_solve.add_argument("--profile", action="store_true", help="Chạy cProfile quanh vòng lặp giải")
+    p_solve.add_argument("--cache-dir", help="Thư mục bộ nhớ đệm kết quả giữa các lần chạy (tăng --tend sẽ giải tiếp)")
+    p_solve.set_defaults(func_cmd=cmd_solve)
+    p_para = sub.add_parser("parareal", help="Giải song song theo thời gian (Parareal) trên process pool.")
+    p_para.add_argument("func", help="Biểu thức f(t, y)")
+    p_para.add_argument("--t0", type=float, default=0.0)
+    p_para.add_argument("--y0", default="0.5", help="Số, danh sách 'a,b,c' hoặc 'start:stop:num' (ensemble)")
+    p_para.add_argument("--tend", type=float, default=2.0)
+    p_para.add_argument("-N", type=int, default=100000, help="Tổng số bước của bộ lan truyền tinh")
+    p_para.add_argument("--slices", type=int, default=16, help="Số lát thời gian")
+    p_para.add_argument("--method", choices=METHODS, default="rkf45", help="Bộ lan truyền tinh")
+    p_para.add_argument("--order", type=int, default=4, help="Bậc Taylor (tinh)")
+    p_para.add_argument("--taylor-backend", choices=TAYLOR_BACKENDS, default="symbolic")
+    p_para.add_argument("--fused", choices=FUSED_MODES, help="Kernel hợp nhất cho cả hai bộ lan truyền")
+    p_para.add_argument("--coarse-method", choices=METHODS, default="rkf45", help="Bộ lan truyền thô")
+    p_para.add_argument("--coarse-order", type=int, default=2, help="Bậc Taylor (thô)")
+    p_para.add_argument("--coarse-steps", type=int, help="Số bước thô mỗi lát (mặc định: ~1%% số bước tinh, ít nhất 2)")
+    p_para.add_argument("--tol", type=float, default=1e-8, help="Dừng khi độ thay đổi tại các mốc nhỏ hơn tol")
+    p_para.add_argument("--max-iter", type=int, help="Số vòng lặp tối đa (mặc định: số lát)")
+    p_para.add_argument("-j", "--workers", type=int, default=None, help="Số tiến trình (mặc định: số CPU)")
+    p_para.add_argument("--indep-var", default="t")
+    p_para.add_argument("--dep-var", default="y")
+    p_para.add_argument("--param", action="append", metavar="NAME=VALUES")
+    p_para.add_argument("--exact", help="Nghiệm giải tích (cú pháp np.), dùng khi ghi -o")
+    p_para.add_argument("-o", "--output", help="Tệp đầu ra .csv, .parquet hoặc .npz")
+    p_para.add_argument("--reference", action="store_true",
+                        help="Giải thêm tuần tự để đo tăng tốc thực và sai lệch so với Parareal")
+    p_para.add_argument("--instrument", action="store_true", help="In thời gian các giai đoạn (coarse, fine, ...)")
+    p_para.set_defaults(func_cmd=cmd_parareal)
+    p_sweep = sub.add_parser("sweep", help="Quét tham số theo đặc tả JSON trên process pool.")
+    p_sweep.add_argument("spec", help="Tệp đặc tả JSON (xem utils.batch.expand_spec)")
+    p_sweep.add_argument("-o", "--output", required=True, help="Tệp đầu ra .csv, .parquet hoặc .npz")
+    p_sweep.add_argument("-j", "--workers", type=int, default=None, help="Số tiến trình (mặc định: số CPU)")
+    p_sweep.add_argument("--chunksize", type=int, default=1)
+    p_sweep.add_argument("--summary-only", action="store_true", help="Chỉ ghi bảng tóm tắt, không ghi quỹ đạo")
+    p_sweep.set_defaults(func_cmd=cmd_sweep)
+    p_bench = sub.add_parser("bench", help="Benchmark và nghiên cứu hội tụ trên các bài toán có nghiệm giải tích.")
+    p_bench.add_argument("--problems", nargs="+", choices=list(BENCH_PROBLEMS), help="Mặc định: tất cả")
+    p_bench.add_argument("--configs", nargs="+", choices=list(BENCH_CONFIGS), help="Mặc định: tất cả")
+    p_bench.add_argument("-N", nargs="+", type=int, default=list(N_LADDER), help="Thang N cho bước cố định")
+    p_bench.add_argument("--tols", nargs="+", type=float, default=list(TOL_LADDER),
+                         help="Thang rtol = atol cho bước thích nghi")
+    p_bench.add_argument("--repeat", type=int, default=3, help="Lấy thời gian tốt nhất trong số lần chạy này")
+    p_bench.add_argument("--no-memory", action="store_true", help="Không đo bộ nhớ đỉnh (tracemalloc)")
+    p_bench.add_argument("-o", "--output", help="Tệp CSV kết quả")
+    p_bench.add_argument("--plot", metavar="PREFIX", help="Ghi biểu đồ work-precision PREFIX_<bài toán>_<nfev|time>.png")
+    p_bench.add_argument("--baseline", help="So sánh với baseline CSV; mã thoát 1 nếu có hồi quy")
+    p_bench.add_argument("--save-baseline", metavar="PATH", help="Lưu kết quả làm baseline")
+    p_bench.add_argument("--time-ratio", type=float, default=1.5, help="Ngưỡng chậm hơn bao nhiêu lần thì báo hồi quy")
+    p_bench.add_argument("--min-time", type=float, default=1e-2,
+                         help="Bỏ qua hồi quy thời gian của các lần chạy ngắn hơn (giây)")
+    p_bench.add_argument("-v", "--verbose", action="store_true")
+    p_bench.set_defaults(func_cmd=cmd_bench)
+    return parser
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    try:
+        return args.func_cmd(args) or 0
+    except ValueError as e:
+        print(f"Lỗi: {e}", file=sys.stderr)
+        return 2
+if __name__ == "__main__":
+    sys.exit(main())
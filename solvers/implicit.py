@@ -0,0 +1,301 @@
+import numpy as np
+from .rk import hermite_interpolate, initial_step
+from .trace import fmt
+class IterationMatrix:
+    """
+    Ma trận lặp M = I - gamma * J của các phương pháp ẩn, được "phân tích"
+    một lần (nghịch đảo theo lô vì NumPy không có LU dùng lại được) rồi
+    dùng lại cho mọi lần giải M x = b cho đến khi gamma hoặc J thay đổi.
+    Với phương trình vô hướng (kể cả ensemble) J có dạng như y và M là
+    đường chéo; với hệ m phương trình J có dạng (m, m, ...).
+    """
+    def __init__(self, J, gamma, is_system=False):
+        self.is_system = is_system
+        if is_system:
+            J = np.asarray(J, dtype=float)
+            m = J.shape[0]
+            M = np.eye(m).reshape((m, m) + (1,) * (J.ndim - 2)) - gamma * J
+            inv = np.linalg.inv(np.moveaxis(M, (0, 1), (-2, -1)))
+            self.inv = np.moveaxis(inv, (-2, -1), (0, 1))
+        else:
+            self.inv = 1.0 / (1.0 - gamma * np.asarray(J, dtype=float))
+    def solve(self, b):
+        if self.is_system:
+            return np.einsum("ij...,j...->i...", self.inv, b)
+        return self.inv * b
+def error_norm(err, y, y_new, rtol, atol):
+    scale = atol + rtol * np.maximum(np.abs(y), np.abs(y_new))
+    return float(np.max(np.abs(err) / scale))
+class ImplicitSolver:
+    """
+    Phần chung của các bộ giải ẩn dùng Jacobian tượng trưng: thống kê,
+    lưới bước đã chấp nhận và dense output (Hermite bậc 5 như RKF45).
+    """
+    name = ""
+    def __init__(self, f_numeric, jacobian, dfdt=None, is_system=False):
+        self.f = f_numeric
+        self.jac = jacobian
+        self.dfdt = dfdt
+        self.is_system = is_system
+        self.n_accepted = 0
+        self.n_rejected = 0
+        self.nfev = 0
+        self.njev = 0
+        self.n_factor = 0
+    def fun(self, t, y):
+        self.nfev += 1
+        return np.real(self.f(t, y)) + np.zeros_like(y)
+    def jacobian(self, t, y):
+        self.njev += 1
+        return np.real(self.jac(t, y))
+    def factor(self, J, gamma):
+        self.n_factor += 1
+        return IterationMatrix(J, gamma, self.is_system)
+    def _start(self, t0, y0, tend, rtol, atol, order):
+        self.n_accepted = 0
+        self.n_rejected = 0
+        self.nfev = 0
+        self.njev = 0
+        self.n_factor = 0
+        y = np.real(np.asarray(y0, dtype=float))
+        fy = self.fun(t0, y)
+        h = initial_step(self.f, t0, y, fy, tend, rtol, atol, order)
+        self.nfev += 1
+        self.t_mesh = [float(t0)]
+        self.y_mesh = [y]
+        self.f_mesh = [fy]
+        return y, fy, h
+    def _finish(self, t0, tend, N):
+        self.t_mesh = np.array(self.t_mesh)
+        self.y_mesh = np.array(self.y_mesh)
+        self.f_mesh = np.array(self.f_mesh)
+        if N is None:
+            return self.t_mesh, self.y_mesh
+        t_values = np.linspace(t0, tend, N + 1)
+        return t_values, hermite_interpolate(self.t_mesh, self.y_mesh, self.f_mesh, t_values)
+    def columns(self):
+        return ["Step", "t_i", "h", "y_i", "Bậc", "err_norm", "Chấp nhận", "y_{i+1}"]
+    def format_step(self, row):
+        idx, t, h, y, order, err_norm, accepted, y_next = row
+        status = "chấp nhận" if accepted else "loại"
+        step_str = f"**Lần thử {idx+1} ({self.name} bậc {order}, t = {t:.6f}, h = {h:.6g}):**\n\n"
+        step_str += f"* $y_i = {fmt(y)}$, $y_{{i+1}} = {fmt(y_next)}$\n"
+        step_str += f"* Chuẩn sai số (đã chia tỉ lệ) $= {err_norm:.4g}$ → **{status}**\n\n---\n"
+        return step_str
+class BDFSolver(ImplicitSolver):
+    """
+    BDF bậc và bước thay đổi (bậc 1-5), biểu diễn bằng sai phân lùi
+    (Shampine-Reichelt, như ode15s/scipy BDF với kappa = 0). Mỗi bước giải
+    hệ ẩn bằng Newton rút gọn với ma trận lặp I - h/alpha_q J; Jacobian và
+    ma trận đã phân tích được giữ qua nhiều bước và chỉ tính lại khi Newton
+    hội tụ kém hoặc h, bậc thay đổi.
+    """
+    name = "BDF"
+    MAX_ORDER = 5
+    NEWTON_MAXITER = 4
+    MIN_FACTOR = 0.2
+    MAX_FACTOR = 10.0
+    def __init__(self, f_numeric, jacobian, dfdt=None, is_system=False):
+        super().__init__(f_numeric, jacobian, dfdt, is_system)
+        k = np.arange(self.MAX_ORDER + 1)
+        self.gamma = np.hstack((0, np.cumsum(1 / k[1:])))
+        self.alpha = self.gamma
+        self.error_const = 1 / (k + 1)
+    @staticmethod
+    def _compute_R(order, factor):
+        I = np.arange(1, order + 1)[:, None]
+        J = np.arange(1, order + 1)
+        M = np.zeros((order + 1, order + 1))
+        M[1:, 1:] = (I - 1 - factor * J) / I
+        M[0] = 1
+        return np.cumprod(M, axis=0)
+    def _change_D(self, D, order, factor):
+        """Đổi bảng sai phân lùi D khi bước h được nhân với factor."""
+        RU = self._compute_R(order, factor).dot(self._compute_R(order, 1))
+        D[:order + 1] = np.tensordot(RU.T, D[:order + 1], axes=1)
+    def _newton(self, t_new, y_predict, c, psi, lu, scale, tol):
+        d = np.zeros_like(y_predict)
+        y = y_predict.copy()
+        dy_norm_old = None
+        for k in range(self.NEWTON_MAXITER):
+            f = self.fun(t_new, y)
+            if not np.all(np.isfinite(f)):
+                break
+            dy = lu.solve(c * f - psi - d)
+            dy_norm = float(np.max(np.abs(dy) / scale))
+            rate = None if dy_norm_old is None else dy_norm / dy_norm_old
+            if rate is not None and (rate >= 1 or rate ** (self.NEWTON_MAXITER - k) / (1 - rate) * dy_norm > tol):
+                break
+            y = y + dy
+            d = d + dy
+            if dy_norm == 0 or (rate is not None and rate / (1 - rate) * dy_norm < tol):
+                return True, y, d
+            dy_norm_old = dy_norm
+        return False, y, d
+    def solve(self, t0, y0, tend, N=None, rtol=1e-6, atol=1e-9, max_steps=100000, trace=None):
+        """
+        Giải trên [t0, tend] với kiểm soát sai số rtol/atol. Lưới bước được
+        lưu ở self.t_mesh, self.y_mesh; nếu có N, kết quả được nội suy lên
+        lưới đều N + 1 điểm. Với tend < t0 bước h = direction * h_abs mang
+        dấu âm (tích phân lùi).
+        """
+        y, fy, h_abs = self._start(t0, y0, tend, rtol, atol, order=1)
+        t = float(t0)
+        direction = 1.0 if tend >= t0 else -1.0
+        D = np.zeros((self.MAX_ORDER + 3,) + y.shape)
+        D[0] = y
+        D[1] = fy * (direction * h_abs)
+        order = 1
+        n_equal_steps = 0
+        J = self.jacobian(t, y)
+        lu = None
+        newton_tol = max(10 * np.finfo(float).eps / rtol, min(0.03, rtol ** 0.5))
+        tracing = trace is not None and trace.active
+        if tracing:
+            trace.begin(self.columns(), self.format_step)
+        while (tend - t) * direction > 0:
+            if self.n_accepted + self.n_rejected >= max_steps:
+                raise RuntimeError(f"BDF vượt quá {max_steps} bước tại t = {t:.6g}.")
+            min_step = 10 * np.abs(np.nextafter(t, direction * np.inf) - t)
+            if h_abs < min_step:
+                raise RuntimeError(f"Bước h quá nhỏ ({h_abs:.3g}) tại t = {t:.6g}.")
+            h = direction * h_abs
+            if (t + h - tend) * direction > 0:
+                self._change_D(D, order, (tend - t) / h)
+                h_abs = abs(tend - t)
+                h = direction * h_abs
+                n_equal_steps = 0
+                lu = None
+            t_new = tend if (t + h - tend) * direction >= 0 else t + h
+            y_predict = np.sum(D[:order + 1], axis=0)
+            scale = atol + rtol * np.abs(y_predict)
+            psi = np.tensordot(self.gamma[1:order + 1], D[1:order + 1], axes=1) / self.alpha[order]
+            c = h / self.alpha[order]
+            current_jac = False
+            while True:
+                if lu is None:
+                    lu = self.factor(J, c)
+                converged, y_new, d = self._newton(t_new, y_predict, c, psi, lu, scale, newton_tol)
+                if converged or current_jac:
+                    break
+                J = self.jacobian(t_new, y_predict)
+                lu = None
+                current_jac = True
+            if not converged:
+                err_norm = np.inf
+            else:
+                err_norm = float(np.max(np.abs(self.error_const[order] * d) / (atol + rtol * np.abs(y_new))))
+            accepted = converged and err_norm <= 1
+            if tracing and trace.wants(self.n_accepted + self.n_rejected):
+                trace.record([self.n_accepted + self.n_rejected, t, h, y, order, err_norm, accepted, y_new])
+            if not accepted:
+                self.n_rejected += 1
+                factor = 0.5 if not converged else max(self.MIN_FACTOR, 0.9 * err_norm ** (-1 / (order + 1)))
+                h_abs *= factor
+                self._change_D(D, order, factor)
+                n_equal_steps = 0
+                lu = None
+                continue
+            self.n_accepted += 1
+            n_equal_steps += 1
+            t, y = t_new, y_new
+            self.t_mesh.append(t)
+            self.y_mesh.append(y)
+            if N is not None:
+                self.f_mesh.append(self.fun(t, y))
+            D[order + 2] = d - D[order + 1]
+            D[order + 1] = d
+            for i in reversed(range(order + 1)):
+                D[i] += D[i + 1]
+            if n_equal_steps < order + 1:
+                continue
+            scale = atol + rtol * np.abs(y)
+            err_m = np.max(np.abs(self.error_const[order - 1] * D[order]) / scale) if order > 1 else np.inf
+            err_p = np.max(np.abs(self.error_const[order + 1] * D[order + 2]) / scale) if order < self.MAX_ORDER else np.inf
+            with np.errstate(divide="ignore"):
+                factors = np.array([err_m, err_norm, err_p]) ** (-1 / np.arange(order, order + 3))
+            order += int(np.argmax(factors)) - 1
+            factor = min(self.MAX_FACTOR, 0.9 * np.max(factors))
+            h_abs *= factor
+            self._change_D(D, order, factor)
+            n_equal_steps = 0
+            lu = None
+        if tracing:
+            trace.end(self.n_accepted + self.n_rejected)
+        return self._finish(t0, tend, N)
+class RosenbrockSolver(ImplicitSolver):
+    """
+    Rosenbrock bậc 2(3), L-ổn định (ode23s của Shampine-Reichelt): mỗi bước
+    dùng Jacobian chính xác J và df/dt, một ma trận W = I - h d J được phân
+    tích một lần cho cả ba lần giải tuyến tính, không cần lặp Newton.
+    f tại điểm cuối được dùng lại cho bước kế tiếp (FSAL).
+    """
+    name = "Rosenbrock"
+    D = 1 / (2 + np.sqrt(2))
+    E32 = 6 + np.sqrt(2)
+    def columns(self):
+        return ["Step", "t_i", "h", "y_i", "k1", "k2", "err_norm", "Chấp nhận", "y_{i+1}"]
+    def format_step(self, row):
+        idx, t, h, y, k1, k2, err_norm, accepted, y_next = row
+        status = "chấp nhận" if accepted else "loại"
+        step_str = f"**Lần thử {idx+1} (t = {t:.6f}, h = {h:.6g}):**\n\n"
+        step_str += f"* $W = I - h d J$, $d = 1/(2+\\sqrt{{2}})$\n"
+        step_str += f"* $k_1 = W^{{-1}}(f(t_i, y_i) + h d f_t) = {fmt(k1)}$\n"
+        step_str += f"* $k_2 = W^{{-1}}(f(t_i + h/2, y_i + h k_1/2) - k_1) + k_1 = {fmt(k2)}$\n"
+        step_str += f"* $y_{{i+1}} = y_i + h k_2 = {fmt(y_next)}$\n"
+        step_str += f"* Chuẩn sai số $\\frac{{h}}{{6}}\\|k_1 - 2k_2 + k_3\\| = {err_norm:.4g}$ → **{status}**\n\n---\n"
+        return step_str
+    def solve(self, t0, y0, tend, N=None, rtol=1e-6, atol=1e-9, max_steps=100000, trace=None):
+        """
+        Giải trên [t0, tend] với kiểm soát sai số rtol/atol; cùng quy ước
+        đầu ra như BDFSolver.solve (h mang dấu âm khi tend < t0).
+        """
+        y, F0, h = self._start(t0, y0, tend, rtol, atol, order=2)
+        t = float(t0)
+        direction = 1.0 if tend >= t0 else -1.0
+        h = direction * h
+        d, e32 = self.D, self.E32
+        tracing = trace is not None and trace.active
+        if tracing:
+            trace.begin(self.columns(), self.format_step)
+        J = self.jacobian(t, y)
+        T = np.real(self.dfdt(t, y)) + np.zeros_like(y)
+        rejected = False
+        while (tend - t) * direction > 0:
+            if self.n_accepted + self.n_rejected >= max_steps:
+                raise RuntimeError(f"Rosenbrock vượt quá {max_steps} bước tại t = {t:.6g}.")
+            if abs(h) < 10 * np.abs(np.nextafter(t, direction * np.inf) - t):
+                raise RuntimeError(f"Bước h quá nhỏ ({h:.3g}) tại t = {t:.6g}.")
+            if (t + 1.01 * h - tend) * direction >= 0:
+                h = tend - t
+            W = self.factor(J, h * d)
+            k1 = W.solve(F0 + h * d * T)
+            F1 = self.fun(t + 0.5 * h, y + 0.5 * h * k1)
+            k2 = W.solve(F1 - k1) + k1
+            y_new = y + h * k2
+            t_new = tend if (t + h - tend) * direction >= 0 else t + h
+            F2 = self.fun(t_new, y_new)
+            k3 = W.solve(F2 - e32 * (k2 - F1) - 2 * (k1 - F0) + h * d * T)
+            err_norm = error_norm(h / 6 * (k1 - 2 * k2 + k3), y, y_new, rtol, atol)
+            accepted = err_norm <= 1
+            if tracing and trace.wants(self.n_accepted + self.n_rejected):
+                trace.record([self.n_accepted + self.n_rejected, t, h, y, k1, k2, err_norm, accepted, y_new])
+            factor = 5.0 if err_norm == 0 else min(5.0, max(0.2, 0.9 * err_norm ** (-1 / 3)))
+            if accepted:
+                t, y, F0 = t_new, y_new, F2
+                self.t_mesh.append(t)
+                self.y_mesh.append(y)
+                self.f_mesh.append(F2)
+                self.n_accepted += 1
+                if rejected:
+                    factor = min(factor, 1.0)
+                rejected = False
+                J = self.jacobian(t, y)
+                T = np.real(self.dfdt(t, y)) + np.zeros_like(y)
+            else:
+                self.n_rejected += 1
+                rejected = True
+            h *= factor
+        if tracing:
+            trace.end(self.n_accepted + self.n_rejected)
+        return self._finish(t0, tend, N)
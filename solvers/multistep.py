@@ -1,79 +1,260 @@
 import numpy as np
-import pandas as pd
-import streamlit as st
-from .rk import RKF45Solver 
-
+from math import factorial
+from .rk import RKF45Solver, hermite_interpolate, initial_step
+from .trace import fmt
+from .stream import BLOCK_SIZE, fixed_step_blocks, collect_blocks
+STARTUP_NOTE = "**Lưu ý:** 3 bước đầu tiên (để có $y_1, y_2, y_3$) được tính tự động bằng RKF45 để khởi động."
 class ABM4Solver:
-    def __init__(self, f_numeric):
+    def __init__(self, f_numeric, fused_step=None, fused_loop=None):
+        """
+        fused_step(t_i, y_i, h, t_{i+1}, history) -> (y_{i+1}, history) và
+        fused_loop(i0, y, h, t0, out, history, N, tend) -> (y, history) là
+        kernel hợp nhất P-E-C-E dùng cho solve() khi không ghi vết; 3 bước
+        khởi động RKF45 vẫn gọi f.
+        """
         self.f = f_numeric
-
-    def solve(self, t0, y0, tend, N):
+        self.fused_step = fused_step
+        self.fused_loop = fused_loop
+    def columns(self):
+        return ["Step (i)", "t_i", "h", "y_i", "f_i", "f_{i-1}", "f_{i-2}", "f_{i-3}", "y_pred", "f_pred", "y_new"]
+    def format_step(self, row):
+        i, ti, h, yi, f0, f1, f2, f3, p_next, f_predicted, y_next = row
+        t_next = ti + h
+        step_str = f"**Bước {i+1} (từ t = {ti:.4f} đến t = {t_next:.4f}):**\n\n"
+        step_str += f"* Các giá trị $f$ đã biết:\n"
+        step_str += f"    * $f_{i} = f({ti:.4f}, {fmt(yi)}) = {fmt(f0)}$\n"
+        step_str += f"    * $f_{i-1} = f(t_{{{i-1}}}, y_{{{i-1}}}) = {fmt(f1)}$\n"
+        step_str += f"    * $f_{i-2} = f(t_{{{i-2}}}, y_{{{i-2}}}) = {fmt(f2)}$\n"
+        step_str += f"    * $f_{i-3} = f(t_{{{i-3}}}, y_{{{i-3}}}) = {fmt(f3)}$\n"
+        step_str += f"\n* **(P) Dự đoán (Predictor):**\n"
+        step_str += f"    $p_{i+1} = y_i + \\frac{{h}}{{24}} (55f_i - 59f_{i-1} + 37f_{i-2} - 9f_{i-3})$\n"
+        step_str += f"    $p_{i+1} = {fmt(yi)} + \\frac{{{h:.4f}}}{{24}} (55 \\cdot ({fmt(f0)}) - \\dots) = {fmt(p_next)}$\n"
+        step_str += f"\n* **(E) Đánh giá (Evaluate):**\n"
+        step_str += f"    $f^p_{i+1} = f(t_{i+1}, p_{i+1}) = f({t_next:.4f}, {fmt(p_next)}) = {fmt(f_predicted)}$\n"
+        step_str += f"\n* **(C) Hiệu chỉnh (Corrector):**\n"
+        step_str += f"    $y_{i+1} = y_i + \\frac{{h}}{{24}} (9f^p_{i+1} + 19f_i - 5f_{i-1} + f_{i-2})$\n"
+        step_str += f"    $y_{i+1} = {fmt(yi)} + \\frac{{{h:.4f}}}{{24}} (9 \\cdot ({fmt(f_predicted)}) + \\dots)$\n"
+        step_str += f"    **$y_{i+1} = {fmt(y_next)}$**\n\n---\n"
+        return step_str
+    def solve(self, t0, y0, tend, N, trace=None):
         if N < 4:
             return np.array([]), np.array([])
-        t_values = np.linspace(t0, tend, N + 1)
-        y_values = np.zeros(N + 1)        
-        y_values[0] = y0  
+        return collect_blocks(self.iter_blocks(t0, y0, tend, N, block_size=N + 1, trace=trace))
+    def iter_blocks(self, t0, y0, tend, N, block_size=BLOCK_SIZE, trace=None):
+        """
+        Như solve() nhưng trả về dần từng khối (t_block, y_block) tối đa
+        block_size điểm; chỉ giữ 4 giá trị f gần nhất thay vì cả lịch sử.
+        """
         h = (tend - t0) / N
         rk_solver = RKF45Solver(self.f)
         _, y_startup = rk_solver.solve(t0, y0, t0 + 3*h, 3)
-        y_values[0:4] = np.real(y_startup)
-        f_values = np.zeros(N + 1)
-        for i in range(4):
-            f_values[i] = np.real(self.f(t_values[i], y_values[i]))   
-        step_data = [] 
-        step_explanations = []
-        columns = ["Step (i)", "t_i", "y_i", "y_pred", "f_pred", "y_new"]
-        for i in range(3, N):
-            ti = t_values[i]
-            yi = y_values[i]
-            step_str = f"**Bước {i+1} (từ t = {ti:.4f} đến t = {t_values[i+1]:.4f}):**\n\n"
-            step_str += f"* Các giá trị $f$ đã biết:\n"
-            step_str += f"    * $f_{i} = f({t_values[i]:.4f}, {y_values[i]:.6f}) = {f_values[i]:.6f}$\n"
-            step_str += f"    * $f_{i-1} = f({t_values[i-1]:.4f}, {y_values[i-1]:.6f}) = {f_values[i-1]:.6f}$\n"
-            step_str += f"    * $f_{i-2} = f({t_values[i-2]:.4f}, {y_values[i-2]:.6f}) = {f_values[i-2]:.6f}$\n"
-            step_str += f"    * $f_{i-3} = f({t_values[i-3]:.4f}, {y_values[i-3]:.6f}) = {f_values[i-3]:.6f}$\n"
-            p_next = yi + (h/24) * (
-                55 * f_values[i] 
-                - 59 * f_values[i-1] 
-                + 37 * f_values[i-2] 
-                - 9 * f_values[i-3]
-            )
-            step_str += f"\n* **(P) Dự đoán (Predictor):**\n"
-            step_str += f"    $p_{i+1} = y_i + \\frac{{h}}{{24}} (55f_i - 59f_{i-1} + 37f_{i-2} - 9f_{i-3})$\n"
-            step_str += f"    $p_{i+1} = {yi:.6f} + \\frac{{{h:.4f}}}{{24}} (55 \cdot ({f_values[i]:.6f}) - \dots) = {p_next:.6f}$\n"
-            t_next = t_values[i+1]
+        y_startup = np.real(y_startup)
+        history = [np.real(self.f(i * h + t0, y_startup[i])) for i in range(3, -1, -1)]
+        tracing = trace is not None and trace.active
+        if tracing:
+            trace.begin(self.columns(), self.format_step, n_steps=N - 3, note=STARTUP_NOTE)
+        elif self.fused_loop is not None:
+            def loop(i0, y, out):
+                j = 0
+                while j < len(out) and i0 + j < 3:
+                    y = out[j] = y_startup[i0 + j + 1]
+                    j += 1
+                if j < len(out):
+                    y, history[:] = self.fused_loop(i0 + j, y, h, t0, out[j:], history, N, tend)
+                return y
+            yield from fixed_step_blocks(None, t0, y0, tend, N, block_size, loop=loop)
+            return
+        elif self.fused_step is not None:
+            def fused(i, ti, yi):
+                if i < 3:
+                    return y_startup[i + 1]
+                y_next, history[:] = self.fused_step(ti, yi, h, tend if i == N - 1 else (i + 1) * h + t0, history)
+                return y_next
+            yield from fixed_step_blocks(fused, t0, y0, tend, N, block_size)
+            return
+        def step(i, ti, yi):
+            if i < 3:
+                return y_startup[i + 1]
+            f0, f1, f2, f3 = history
+            p_next = yi + (h/24) * (55 * f0 - 59 * f1 + 37 * f2 - 9 * f3)
+            t_next = tend if i == N - 1 else (i + 1) * h + t0
             f_predicted = np.real(self.f(t_next, p_next))
-            step_str += f"\n* **(E) Đánh giá (Evaluate):**\n"
-            step_str += f"    $f^p_{i+1} = f(t_{i+1}, p_{i+1}) = f({t_next:.4f}, {p_next:.6f}) = {f_predicted:.6f}$\n"
-            y_next = yi + (h/24) * (
-                9 * f_predicted     
-                + 19 * f_values[i]
-                - 5 * f_values[i-1]
-                + 1 * f_values[i-2]
-            )
-            step_str += f"\n* **(C) Hiệu chỉnh (Corrector):**\n"
-            step_str += f"    $y_{i+1} = y_i + \\frac{{h}}{{24}} (9f^p_{i+1} + 19f_i - 5f_{i-1} + f_{i-2})$\n"
-            step_str += f"    $y_{i+1} = {yi:.6f} + \\frac{{{h:.4f}}}{{24}} (9 \cdot ({f_predicted:.6f}) + \dots)$\n"
-            step_str += f"    **$y_{i+1} = {y_next:.6f}$**\n\n---\n"
-            y_values[i+1] = y_next
-            f_values[i+1] = np.real(self.f(t_next, y_next))
-            step_data.append([i, ti, yi, p_next, f_predicted, y_next])
-            step_explanations.append(step_str)
-        with st.expander("Xem chi tiết tính toán từng bước của ABM4 (Predictor-Corrector)"):
-            tab1, tab2 = st.tabs(["Giải thích từng bước", "Bảng dữ liệu chi tiết"]) 
-            with tab1:
-                tab1.markdown(f"**Lưu ý:** 3 bước đầu tiên (để có $y_1, y_2, y_3$) được tính tự động bằng RKF45 để khởi động.")
-                if step_data:
-                    tab1.markdown("\n".join(step_explanations))
-                else:
-                    tab1.info("Chưa đủ dữ liệu để hiển thị bước ABM4 (cần N >= 4).")
-
-            with tab2:
-                tab2.markdown(f"**Lưu ý:** 3 bước đầu tiên (để có $y_1, y_2, y_3$) được tính tự động bằng RKF45 để khởi động.")
-                if step_data:
-                    df_steps = pd.DataFrame(step_data, columns=columns)
-                    tab2.dataframe(df_steps.style.format("{:.6f}"))
+            y_next = yi + (h/24) * (9 * f_predicted + 19 * f0 - 5 * f1 + 1 * f2)
+            history[:] = [np.real(self.f(t_next, y_next)), f0, f1, f2]
+            if tracing and trace.wants(i - 3):
+                trace.record([i, ti, h, yi, f0, f1, f2, f3, p_next, f_predicted, y_next])
+            return y_next
+        yield from fixed_step_blocks(step, t0, y0, tend, N, block_size)
+        if tracing:
+            trace.end(N - 3)
+def adams_coefficients(max_order):
+    """
+    Với mỗi bậc q = 1..max_order + 1: vector l của Adams-Moulton dạng
+    Nordsieck (hệ số của Lambda(x) = int_{-1}^{x} prod_{i<q}(u + i) du / (q-1)!)
+    và hằng số sai số của Adams-Bashforth / Adams-Moulton bậc q.
+    """
+    gamma = [1.0]
+    gamma_star = [1.0]
+    for j in range(1, max_order + 2):
+        gamma.append(1 - sum(gamma[i] / (j + 1 - i) for i in range(j)))
+        gamma_star.append(-sum(gamma_star[i] / (j + 1 - i) for i in range(j)))
+    ls = {}
+    for q in range(1, max_order + 2):
+        poly = np.poly1d([1.0])
+        for i in range(1, q):
+            poly = poly * np.poly1d([1.0, i])
+        integral = poly.integ()
+        lam = (integral - integral(-1.0)) / factorial(q - 1)
+        ls[q] = lam.coeffs[::-1].copy()
+    return ls, np.array(gamma), np.array(gamma_star)
+class AdamsSolver:
+    """
+    Adams PECE bước và bậc thay đổi (bậc 1 đến max_order, mặc định 12).
+    Lịch sử được lưu dạng Nordsieck z = [y, h y', h^2 y''/2!, ..., h^q y^(q)/q!]
+    nên đổi bước chỉ là nhân z_j với (h_new/h)^j. Mỗi bước:
+      P: z_p = Pascal * z (ngoại suy, tương đương Adams-Bashforth bậc q)
+      E: f(t_{n+1}, y_p)
+      C: y_c = y_p + l_0 e với e = h f(t_{n+1}, y_p) - h y'_p (Adams-Moulton)
+      E: f(t_{n+1}, y_c), cập nhật các thành phần đạo hàm của z.
+    Hiệu y_c - y_p cho ước lượng sai số Milne, dùng để chọn h và bậc
+    (so sánh với bậc q - 1 và q + 1). Khởi động tự nhất quán ở bậc 1,
+    không cần RKF45; chỉ cần 2 lần gọi f cho mỗi bước.
+    """
+    def __init__(self, f_numeric, max_order=12):
+        self.f = f_numeric
+        self.max_order = max_order
+        self.ls, self.gamma, self.gamma_star = adams_coefficients(max_order)
+        self.n_accepted = 0
+        self.n_rejected = 0
+        self.nfev = 0
+        self.orders = []
+    def columns(self):
+        return ["Step", "t_i", "h", "y_i", "Bậc q", "y_pred", "y_corr", "err_norm", "Chấp nhận"]
+    def format_step(self, row):
+        idx, t, h, y, q, y_pred, y_corr, err_norm, accepted = row
+        status = "chấp nhận" if accepted else "loại"
+        step_str = f"**Lần thử {idx+1} (Adams bậc {q}, t = {t:.6f}, h = {h:.6g}):**\n\n"
+        step_str += f"* $y_i = {fmt(y)}$\n"
+        step_str += f"* **(P)** Ngoại suy Nordsieck: $p_{{i+1}} = {fmt(y_pred)}$\n"
+        step_str += f"* **(E, C)** Adams-Moulton: $y_{{i+1}} = p_{{i+1}} + l_0 (h f(t_{{i+1}}, p_{{i+1}}) - h p'_{{i+1}}) = {fmt(y_corr)}$\n"
+        step_str += f"* **(E)** Tính $f(t_{{i+1}}, y_{{i+1}})$ cho lịch sử.\n"
+        step_str += f"* Ước lượng Milne $\\left|\\frac{{C_q^*}}{{C_q - C_q^*}}\\right| \\|y_{{i+1}} - p_{{i+1}}\\| = {err_norm:.4g}$ → **{status}**\n\n---\n"
+        return step_str
+    @staticmethod
+    def _rescale(z, q, factor):
+        """Đổi bước h -> factor * h: z_j *= factor^j."""
+        z[:q + 1] *= factor ** np.arange(q + 1).reshape((-1,) + (1,) * (z.ndim - 1))
+    def _milne(self, q):
+        return abs(self.gamma_star[q] / (self.gamma[q] - self.gamma_star[q]))
+    def solve(self, t0, y0, tend, N=None, rtol=1e-6, atol=1e-9, max_steps=100000, trace=None):
+        """
+        Giải trên [t0, tend] với kiểm soát sai số rtol/atol. Lưới bước đã chấp
+        nhận được lưu ở self.t_mesh, self.y_mesh (và bậc ở self.orders); nếu có
+        N, kết quả được nội suy Hermite lên lưới đều N + 1 điểm. Với tend < t0
+        bước h mang dấu âm (tích phân lùi).
+        """
+        self.n_accepted = 0
+        self.n_rejected = 0
+        self.nfev = 0
+        t = float(t0)
+        y = np.real(np.asarray(y0, dtype=float))
+        fy = np.real(self.f(t, y)) + np.zeros_like(y)
+        direction = 1.0 if tend >= t0 else -1.0
+        h = direction * initial_step(self.f, t, y, fy, tend, rtol, atol, order=1)
+        self.nfev += 2
+        q = 1
+        z = np.zeros((self.max_order + 2,) + y.shape)
+        z[0], z[1] = y, h * fy
+        t_mesh, y_mesh, f_mesh, orders = [t], [y], [fy], []
+        steps_since_change = 0
+        n_fail = 0
+        prev_diff = None
+        tracing = trace is not None and trace.active
+        if tracing:
+            trace.begin(self.columns(), self.format_step)
+        while (tend - t) * direction > 0:
+            if self.n_accepted + self.n_rejected >= max_steps:
+                raise RuntimeError(f"Adams vượt quá {max_steps} bước tại t = {t:.6g}.")
+            if abs(h) < 10 * np.abs(np.nextafter(t, direction * np.inf) - t):
+                raise RuntimeError(f"Bước h quá nhỏ ({h:.3g}) tại t = {t:.6g}; bài toán có thể cứng (stiff).")
+            if (t + 1.01 * h - tend) * direction >= 0:
+                self._rescale(z, q, (tend - t) / h)
+                h = tend - t
+            t_new = tend if (t + h - tend) * direction >= 0 else t + h
+            zp = z[:q + 1].copy()
+            for k in range(q):
+                for j in range(q, k, -1):
+                    zp[j - 1] += zp[j]
+            f_pred = np.real(self.f(t_new, zp[0])) + np.zeros_like(y)
+            l = self.ls[q]
+            y_corr = zp[0] + l[0] * (h * f_pred - zp[1])
+            f_corr = np.real(self.f(t_new, y_corr)) + np.zeros_like(y)
+            self.nfev += 2
+            diff = y_corr - zp[0]
+            scale = atol + rtol * np.maximum(np.abs(y), np.abs(y_corr))
+            err_norm = self._milne(q) * float(np.max(np.abs(diff) / scale))
+            accepted = err_norm <= 1.0
+            if tracing and trace.wants(self.n_accepted + self.n_rejected):
+                trace.record([self.n_accepted + self.n_rejected, t, h, y, q, zp[0], y_corr, err_norm, accepted])
+            if not accepted:
+                self.n_rejected += 1
+                n_fail += 1
+                steps_since_change = 0
+                prev_diff = None
+                if n_fail >= 3:
+                    q = 1
+                    z[1] = h * fy
+                    factor = 0.1
                 else:
-                    tab2.info("Chưa đủ dữ liệu để hiển thị bước ABM4 (cần N >= 4).")
-
-        return t_values, y_values
\ No newline at end of file
+                    if n_fail == 2 and q > 1:
+                        q -= 1
+                    factor = max(0.2, 0.9 * err_norm ** (-1 / (q + 1)))
+                self._rescale(z, q, factor)
+                h *= factor
+                continue
+            e = h * f_corr - zp[1]
+            z[:q + 1] = zp + l[:q + 1].reshape((-1,) + (1,) * y.ndim) * e
+            z[0] = y_corr
+            t, y, fy = t_new, y_corr, f_corr
+            t_mesh.append(t)
+            y_mesh.append(y)
+            f_mesh.append(fy)
+            orders.append(q)
+            self.n_accepted += 1
+            n_fail = 0
+            steps_since_change += 1
+            d_q1 = diff / (self.gamma[q] - self.gamma_star[q])
+            if steps_since_change <= q:
+                prev_diff = d_q1
+                continue
+            # Sau q + 1 bước với cùng h và q: so sánh bước đề xuất cho các bậc
+            # q - 1 (sai số từ z_q), q, và q + 1 (từ hiệu hai ước lượng Milne liên tiếp).
+            factors = [0.0, 0.9 / 1.2 * max(err_norm, 1e-10) ** (-1 / (q + 1)), 0.0]
+            if q > 1:
+                err_m = abs(self.gamma_star[q - 1]) * factorial(q) * float(np.max(np.abs(z[q]) / scale))
+                factors[0] = 0.9 / 1.3 * max(err_m, 1e-10) ** (-1 / q)
+            if q < self.max_order and prev_diff is not None:
+                err_p = abs(self.gamma_star[q + 1]) * float(np.max(np.abs(d_q1 - prev_diff) / scale))
+                factors[2] = 0.9 / 1.4 * max(err_p, 1e-10) ** (-1 / (q + 2))
+            prev_diff = d_q1
+            choice = int(np.argmax(factors)) - 1
+            factor = min(5.0, factors[choice + 1])
+            if factor < 1.1:
+                continue
+            if choice == 1:
+                z[q + 1] = d_q1 / factorial(q + 1)
+            q += choice
+            self._rescale(z, q, factor)
+            h *= factor
+            steps_since_change = 0
+            prev_diff = None
+        self.t_mesh = np.array(t_mesh)
+        self.y_mesh = np.array(y_mesh)
+        self.f_mesh = np.array(f_mesh)
+        self.orders = orders
+        if tracing:
+            trace.end(self.n_accepted + self.n_rejected)
+        if N is None:
+            return self.t_mesh, self.y_mesh
+        t_values = np.linspace(t0, tend, N + 1)
+        return t_values, hermite_interpolate(self.t_mesh, self.y_mesh, self.f_mesh, t_values)
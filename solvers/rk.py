@@ -1,54 +1,224 @@
 import numpy as np
-import pandas as pd
-import streamlit as st
+from .trace import fmt
+from .stream import BLOCK_SIZE, fixed_step_blocks, collect_blocks
+def hermite_interpolate(t_mesh, y_mesh, f_mesh, t_query):
+    """
+    Nội suy Hermite (dense output) trên lưới bước đã chấp nhận, dùng y và
+    f = y' tại ba nút liên tiếp (đa thức bậc 5, cùng bậc với RKF45).
+    Nếu lưới chỉ có một bước thì dùng Hermite bậc ba; lưới giảm dần (tích
+    phân lùi, tend < t0) cũng được hỗ trợ.
+    """
+    t_query = np.asarray(t_query, dtype=float)
+    n_steps = len(t_mesh) - 1
+    if n_steps == 0:
+        return np.broadcast_to(y_mesh[0], t_query.shape + y_mesh.shape[1:]).copy()
+    direction = 1.0 if t_mesh[-1] >= t_mesh[0] else -1.0
+    idx = np.clip(np.searchsorted(direction * t_mesh, direction * t_query, side='right') - 1, 0, n_steps - 1)
+    shape = (-1,) + (1,) * (y_mesh.ndim - 1)
+    if n_steps == 1:
+        nodes = np.stack([idx, idx + 1])
+    else:
+        left = np.clip(idx - 1, 0, n_steps - 2)
+        nodes = np.stack([left, left + 1, left + 2])
+    z = np.repeat(t_mesh[nodes], 2, axis=0)
+    zs = [z[j].reshape(shape) for j in range(len(z))]
+    coeffs = []
+    for j in range(len(nodes)):
+        coeffs.append(y_mesh[nodes[j]])
+        coeffs.append(f_mesh[nodes[j]])
+    table = list(coeffs[0::2])
+    first = []
+    for j in range(len(z) - 1):
+        if j % 2 == 0:
+            first.append(coeffs[j + 1])
+        else:
+            first.append((table[(j + 1) // 2] - table[j // 2]) / (zs[j + 1] - zs[j]))
+    diffs = [table[0], first[0]]
+    level = first
+    for order in range(2, len(z)):
+        level = [(level[i + 1] - level[i]) / (zs[i + order] - zs[i]) for i in range(len(level) - 1)]
+        diffs.append(level[0])
+    tq = t_query.reshape(shape)
+    result = diffs[-1]
+    for k in range(len(z) - 2, -1, -1):
+        result = result * (tq - zs[k]) + diffs[k]
+    return result
+def initial_step(f, t0, y0, f0, tend, rtol, atol, order=4):
+    """
+    Ước lượng bước đầu (Hairer-Wanner) cho phương pháp có sai số địa
+    phương O(h^(order+1)); gọi f thêm một lần. Trả về độ lớn |h|, bước
+    thật đi theo chiều từ t0 tới tend.
+    """
+    direction = 1.0 if tend >= t0 else -1.0
+    scale = atol + rtol * np.abs(y0)
+    d0 = np.max(np.abs(y0) / scale)
+    d1 = np.max(np.abs(f0) / scale)
+    if d0 < 1e-5 or d1 < 1e-5:
+        h0 = 1e-6
+    else:
+        h0 = 0.01 * d0 / d1
+    h0 = min(h0, abs(tend - t0))
+    if h0 == 0.0:
+        return 0.0
+    f1 = np.real(f(t0 + direction * h0, y0 + direction * h0 * f0))
+    d2 = np.max(np.abs(f1 - f0) / scale) / h0
+    if max(d1, d2) <= 1e-15:
+        h1 = max(1e-6, h0 * 1e-3)
+    else:
+        h1 = (0.01 / max(d1, d2)) ** (1 / (order + 1))
+    return min(100 * h0, h1, abs(tend - t0))
 class RKF45Solver:
-    def __init__(self, f_numeric):
+    def __init__(self, f_numeric, fused_step=None, fused_loop=None):
+        """
+        fused_step(t_i, y_i, h) / fused_loop(i0, y, h, t0, out) là kernel
+        hợp nhất (SymbolicProcessor.generate_step_kernel) dùng cho solve()
+        khi không ghi vết; cho cùng kết quả với các lời gọi f từng stage.
+        """
         self.f = f_numeric
-    def solve(self, t0, y0, tend, N):
-        t_values = np.linspace(t0, tend, N + 1)
-        y_values = np.zeros(N + 1)      
-        y_values[0] = y0   
+        self.fused_step = fused_step
+        self.fused_loop = fused_loop
+        self.t_mesh = None
+        self.y_mesh = None
+        self.f_mesh = None
+        self.n_accepted = 0
+        self.n_rejected = 0
+        self.nfev = 0
+    def columns(self):
+        return ["Step", "t_i", "h", "y_i", "k1", "k2", "k3", "k4", "k5", "k6", "y_next"]
+    def format_step(self, row):
+        i, ti, h, yi, k1, k2, k3, k4, k5, k6, y_next = row
+        step_str = f"**Bước {i+1} (từ t = {ti:.4f} đến t = {ti + h:.4f}):**\n\n"
+        step_str += f"* Giá trị ban đầu: $y_{i} = y({ti:.4f}) = {fmt(yi)}$\n"
+        step_str += f"* $h = {h:.4f}$\n"
+        step_str += "* Tính 6 hệ số $k$:\n"
+        step_str += f"    * $k_1 = h \\cdot f(t_i, y_i) = {h:.4f} \\cdot f({ti:.4f}, {fmt(yi)}) = {fmt(k1)}$\n"
+        step_str += f"    * $k_2 = h \\cdot f(t_i + h/4, y_i + k_1/4) = {fmt(k2)}$\n"
+        step_str += f"    * $k_3 = h \\cdot f(t_i + 3h/8, y_i + 3k_1/32 + 9k_2/32) = {fmt(k3)}$\n"
+        step_str += f"    * $k_4 = h \\cdot f(t_i + 12h/13, y_i + \\dots) = {fmt(k4)}$\n"
+        step_str += f"    * $k_5 = h \\cdot f(t_i + h, y_i + \\dots) = {fmt(k5)}$\n"
+        step_str += f"    * $k_6 = h \\cdot f(t_i + h/2, y_i + \\dots) = {fmt(k6)}$\n"
+        step_str += f"\n* Cộng các hệ số (công thức bậc 5):\n"
+        step_str += f"    $y_{i+1} = y_i + \\frac{{16}}{{135}}k_1 + \\frac{{6656}}{{12825}}k_3 + \\dots$\n"
+        step_str += f"    **$y_{i+1} = {fmt(y_next)}$**\n\n---\n"
+        return step_str
+    def solve(self, t0, y0, tend, N, trace=None):
+        return collect_blocks(self.iter_blocks(t0, y0, tend, N, block_size=N + 1, trace=trace))
+    def iter_blocks(self, t0, y0, tend, N, block_size=BLOCK_SIZE, trace=None):
+        """Như solve() nhưng trả về dần từng khối (t_block, y_block) tối đa block_size điểm."""
         h = (tend - t0) / N
-        step_data = [] 
-        step_explanations = []
-        columns = ["Step", "t_i", "y_i", "k1", "k2", "k3", "k4", "k5", "k6", "y_next"]
-        for i in range(N):
-            ti = t_values[i]
-            yi = y_values[i]
-            step_str = f"**Bước {i+1} (từ t = {ti:.4f} đến t = {t_values[i+1]:.4f}):**\n\n"
-            step_str += f"* Giá trị ban đầu: $y_{i} = y({ti:.4f}) = {yi:.6f}$\n"
-            step_str += f"* $h = {h:.4f}$\n"
-            step_str += "* Tính 6 hệ số $k$:\n"
+        tracing = trace is not None and trace.active
+        if tracing:
+            trace.begin(self.columns(), self.format_step, n_steps=N)
+        elif self.fused_loop is not None:
+            yield from fixed_step_blocks(None, t0, y0, tend, N, block_size,
+                                         loop=lambda i0, y, out: self.fused_loop(i0, y, h, t0, out))
+            return
+        elif self.fused_step is not None:
+            yield from fixed_step_blocks(lambda i, ti, yi: self.fused_step(ti, yi, h), t0, y0, tend, N, block_size)
+            return
+        def step(i, ti, yi):
             k1 = h * np.real(self.f(ti, yi))
-            step_str += f"    * $k_1 = h \cdot f(t_i, y_i) = {h:.4f} \cdot f({ti:.4f}, {yi:.6f}) = {k1:.6f}$\n"
             k2 = h * np.real(self.f(ti + h/4, yi + k1/4))
-            step_str += f"    * $k_2 = h \cdot f(t_i + h/4, y_i + k_1/4) = {k2:.6f}$\n"
             k3 = h * np.real(self.f(ti + 3*h/8, yi + 3*k1/32 + 9*k2/32))
-            step_str += f"    * $k_3 = h \cdot f(t_i + 3h/8, y_i + 3k_1/32 + 9k_2/32) = {k3:.6f}$\n" 
             k4 = h * np.real(self.f(ti + 12*h/13, yi + 1932*k1/2197 - 7200*k2/2197 + 7296*k3/2197))
-            step_str += f"    * $k_4 = h \cdot f(t_i + 12h/13, y_i + \dots) = {k4:.6f}$\n"
             k5 = h * np.real(self.f(ti + h, yi + 439*k1/216 - 8*k2 + 3680*k3/513 - 845*k4/4104))
-            step_str += f"    * $k_5 = h \cdot f(t_i + h, y_i + \dots) = {k5:.6f}$\n"
             k6 = h * np.real(self.f(ti + h/2, yi - 8*k1/27 + 2*k2 - 3544*k3/2565 + 1859*k4/4104 - 11*k5/40))
-            step_str += f"    * $k_6 = h \cdot f(t_i + h/2, y_i + \dots) = {k6:.6f}$\n"
             y_next = yi + (16/135)*k1 + (6656/12825)*k3 + (28561/56430)*k4 - (9/50)*k5 + (2/55)*k6
-            step_str += f"\n* Cộng các hệ số (công thức bậc 5):\n"
-            step_str += f"    $y_{i+1} = y_i + \\frac{{16}}{{135}}k_1 + \\frac{{6656}}{{12825}}k_3 + \dots$\n"
-            step_str += f"    **$y_{i+1} = {y_next:.6f}$**\n\n---\n"
-            y_values[i+1] = y_next
-            step_data.append([i, ti, yi, k1, k2, k3, k4, k5, k6, y_next])
-            step_explanations.append(step_str)
-        with st.expander("Xem chi tiết tính toán từng bước của RKF45"):
-            tab1, tab2 = st.tabs(["Giải thích từng bước", "Bảng dữ liệu chi tiết"])
-            with tab1:
-                if step_data:
-                    tab1.markdown("\n".join(step_explanations))
-                else:
-                    tab1.info("Không có dữ liệu bước để hiển thị.")
-            with tab2:
-                if step_data:
-                    df_steps = pd.DataFrame(step_data, columns=columns)
-                    tab2.dataframe(df_steps.style.format("{:.6f}"))
-                else:
-                    tab2.info("Không có dữ liệu bước để hiển thị.")
+            if tracing and trace.wants(i):
+                trace.record([i, ti, h, yi, k1, k2, k3, k4, k5, k6, y_next])
+            return y_next
+        yield from fixed_step_blocks(step, t0, y0, tend, N, block_size)
+        if tracing:
+            trace.end(N)
+    def adaptive_columns(self):
+        return ["Step", "t_i", "h", "y_i", "Err/Tol", "Chấp nhận", "y_next"]
+    def format_adaptive_step(self, row):
+        i, ti, h, yi, err_norm, accepted, y_next = row
+        step_str = f"**Lần thử {i+1} (t = {ti:.6f}, h = {h:.6g}):**\n\n"
+        step_str += f"* $y_i = {fmt(yi)}$, nghiệm bậc 5: $y_{{i+1}} = {fmt(y_next)}$\n"
+        step_str += f"* Sai số ước lượng (chuẩn hóa theo rtol/atol): ${err_norm:.3g}$\n"
+        if accepted:
+            step_str += "* **Chấp nhận bước.**\n\n---\n"
+        else:
+            step_str += "* **Loại bước**, thử lại với $h$ nhỏ hơn.\n\n---\n"
+        return step_str
+    def solve_adaptive(self, t0, y0, tend, N=None, rtol=1e-6, atol=1e-9, h0=None,
+                       safety=0.9, fac_min=0.2, fac_max=5.0, max_steps=100000, trace=None):
+        """
+        RKF45 thích nghi: dùng hiệu giữa nghiệm bậc 5 và bậc 4 làm ước lượng
+        sai số địa phương, chấp nhận/loại bước theo rtol/atol và điều chỉnh h.
+        Lưới bước đã chấp nhận được lưu ở self.t_mesh, self.y_mesh. Nếu có N,
+        kết quả được nội suy (dense output) lên lưới đều N + 1 điểm. Với
+        tend < t0 bước h mang dấu âm (tích phân lùi); h0 là độ lớn bước đầu.
+        """
+        self.n_accepted = 0
+        self.n_rejected = 0
+        self.nfev = 0
+        t = float(t0)
+        y = np.real(np.asarray(y0, dtype=float))
+        fy = np.real(self.f(t, y)) + np.zeros_like(y)
+        self.nfev += 1
+        if h0 is None:
+            h0 = initial_step(self.f, t, y, fy, tend, rtol, atol)
+            self.nfev += 1
+        direction = 1.0 if tend >= t0 else -1.0
+        h = direction * abs(h0)
+        h_min = 16 * np.finfo(float).eps * max(abs(t0), abs(tend), 1.0)
+        t_mesh = [t]
+        y_mesh = [y]
+        f_mesh = [fy]
+        tracing = trace is not None and trace.active
+        if tracing:
+            trace.begin(self.adaptive_columns(), self.format_adaptive_step)
+        rejected = False
+        while (tend - t) * direction > 0:
+            if self.n_accepted + self.n_rejected >= max_steps:
+                raise RuntimeError(f"RKF45 thích nghi vượt quá {max_steps} bước tại t = {t:.6g}.")
+            if (t + 1.01 * h - tend) * direction >= 0:
+                h = tend - t
+            k1 = h * fy
+            k2 = h * np.real(self.f(t + h/4, y + k1/4))
+            k3 = h * np.real(self.f(t + 3*h/8, y + 3*k1/32 + 9*k2/32))
+            k4 = h * np.real(self.f(t + 12*h/13, y + 1932*k1/2197 - 7200*k2/2197 + 7296*k3/2197))
+            k5 = h * np.real(self.f(t + h, y + 439*k1/216 - 8*k2 + 3680*k3/513 - 845*k4/4104))
+            k6 = h * np.real(self.f(t + h/2, y - 8*k1/27 + 2*k2 - 3544*k3/2565 + 1859*k4/4104 - 11*k5/40))
+            self.nfev += 5
+            y_next = y + (16/135)*k1 + (6656/12825)*k3 + (28561/56430)*k4 - (9/50)*k5 + (2/55)*k6
+            err = k1/360 - 128*k3/4275 - 2197*k4/75240 + k5/50 + 2*k6/55
+            scale = atol + rtol * np.maximum(np.abs(y), np.abs(y_next))
+            err_norm = float(np.max(np.abs(err) / scale))
+            accepted = err_norm <= 1.0
+            if tracing and trace.wants(self.n_accepted + self.n_rejected):
+                trace.record([self.n_accepted + self.n_rejected, t, h, y, err_norm, accepted, y_next])
+            if err_norm == 0.0:
+                factor = fac_max
+            else:
+                factor = min(fac_max, max(fac_min, safety * err_norm ** (-1 / 5)))
+            if accepted:
+                t = tend if (t + h - tend) * direction >= 0 else t + h
+                y = y_next
+                fy = np.real(self.f(t, y)) + np.zeros_like(y)
+                self.nfev += 1
+                t_mesh.append(t)
+                y_mesh.append(y)
+                f_mesh.append(fy)
+                self.n_accepted += 1
+                if rejected:
+                    factor = min(factor, 1.0)
+                rejected = False
+            else:
+                self.n_rejected += 1
+                rejected = True
+            h = h * factor
+            if abs(h) < h_min and (tend - t) * direction > 0:
+                raise RuntimeError(f"Bước h quá nhỏ ({h:.3g}) tại t = {t:.6g}; bài toán có thể cứng (stiff).")
+        self.t_mesh = np.array(t_mesh)
+        self.y_mesh = np.array(y_mesh)
+        self.f_mesh = np.array(f_mesh)
+        if tracing:
+            trace.end(self.n_accepted + self.n_rejected)
+        if N is None:
+            return self.t_mesh, self.y_mesh
+        t_values = np.linspace(t0, tend, N + 1)
+        y_values = hermite_interpolate(self.t_mesh, self.y_mesh, self.f_mesh, t_values)
         return t_values, y_values
\ No newline at end of file
@@ -0,0 +1,94 @@
+import numpy as np
+from math import factorial
+class SeriesTape:
+    """
+    Băng (tape) các phép toán trên chuỗi lũy thừa cắt cụt, dùng để tính
+    số học (không tượng trưng) các hệ số Taylor y_k = y^(k)(t0) / k! của
+    nghiệm y(t0 + s) = sum_k y_k s^k.
+    Mỗi ô (slot) giữ các hệ số của một biểu thức con: ô 0 là t, ô 1..m là
+    các thành phần của y; các ô còn lại được tính bởi ops theo thứ tự, mỗi
+    phép toán là một bộ (tên, ô_ra, ô_vào...) với công thức truy hồi chuẩn
+    cho +, *, /, exp, log, sin/cos, lũy thừa. Hệ số bậc k của f cho
+    y_{k+1} = f_k / (k + 1), nên chi phí là O(order^2) cho mỗi phép toán
+    thay vì biểu thức phình to theo bậc.
+    """
+    def __init__(self, n_components, ops, outputs, n_slots, is_system=False):
+        self.n_components = n_components
+        self.const_ops = [op for op in ops if op[0] == "const"]
+        self.ops = [op for op in ops if op[0] != "const"]
+        self.outputs = outputs
+        self.n_slots = n_slots
+        self.is_system = is_system
+    def __len__(self):
+        return len(self.ops)
+    def coefficients(self, t, y, order):
+        """
+        Trả về mảng (order + 1, *shape(y)) các hệ số Taylor chuẩn hóa
+        y_0 = y, y_1 = f, y_2 = f'/2, ..., y_order = f^(order-1)/order!.
+        """
+        y = np.asarray(y, dtype=float)
+        ens_shape = y.shape[1:] if self.is_system else y.shape
+        c = np.zeros((self.n_slots, order + 1) + ens_shape)
+        c[0, 0] = t
+        if order >= 1:
+            c[0, 1] = 1.0
+        if self.is_system:
+            c[1:self.n_components + 1, 0] = y
+        else:
+            c[1, 0] = y
+        for _, out, value in self.const_ops:
+            c[out, 0] = value
+        expand = (slice(None),) + (None,) * len(ens_shape)
+        for k in range(order):
+            j = np.arange(1, k + 1, dtype=float)[expand]
+            for op in self.ops:
+                self._step(c, k, j, op)
+            for i, out in enumerate(self.outputs):
+                c[i + 1, k + 1] = c[out, k] / (k + 1)
+        coeffs = c[1:self.n_components + 1]
+        return np.moveaxis(coeffs, 0, 1) if self.is_system else coeffs[0]
+    def derivatives(self, t, y, order):
+        """f, f', ..., f^(order-1) tại (t, y), cùng dạng với kernel tượng trưng."""
+        coeffs = self.coefficients(t, y, order)[1:]
+        scale = np.array([factorial(k + 1) for k in range(order)], dtype=float)
+        return coeffs * scale.reshape((-1,) + (1,) * (coeffs.ndim - 1))
+    @staticmethod
+    def _step(c, k, j, op):
+        """Tính hệ số bậc k của ô ra từ các hệ số 0..k của ô vào."""
+        name, out = op[0], op[1]
+        w = c[out]
+        if name == "add":
+            w[k] = c[op[2], k] + c[op[3], k]
+        elif name == "scale":
+            w[k] = c[op[3], 0] * c[op[2], k]
+        elif name == "mul":
+            a, b = c[op[2]], c[op[3]]
+            w[k] = (a[:k + 1] * b[k::-1]).sum(axis=0)
+        elif name == "div":
+            a, b = c[op[2]], c[op[3]]
+            w[k] = (a[k] - (b[1:k + 1] * w[k - 1::-1][:k]).sum(axis=0)) / b[0]
+        elif name == "exp":
+            a = c[op[2]]
+            w[k] = np.exp(a[0]) if k == 0 else (j * a[1:k + 1] * w[k - 1::-1][:k]).sum(axis=0) / k
+        elif name == "log":
+            a = c[op[2]]
+            if k == 0:
+                w[0] = np.log(a[0])
+            else:
+                w[k] = (a[k] - (j[:-1] * w[1:k] * a[k - 1:0:-1]).sum(axis=0) / k) / a[0]
+        elif name == "sincos":
+            a, s = c[op[2]], w
+            co = c[op[3]]
+            if k == 0:
+                s[0], co[0] = np.sin(a[0]), np.cos(a[0])
+            else:
+                s[k] = (j * a[1:k + 1] * co[k - 1::-1][:k]).sum(axis=0) / k
+                co[k] = -(j * a[1:k + 1] * s[k - 1::-1][:k]).sum(axis=0) / k
+        elif name == "pow":
+            a, p = c[op[2]], op[3]
+            if k == 0:
+                w[0] = a[0] ** p
+            else:
+                w[k] = (((p + 1) * j - k) * a[1:k + 1] * w[k - 1::-1][:k]).sum(axis=0) / (k * a[0])
+        else:
+            raise ValueError(f"Phép toán chuỗi không hợp lệ: {name!r}")
@@ -0,0 +1,124 @@
+import numpy as np
+BLOCK_SIZE = 65536
+def fixed_step_blocks(step, t0, y0, tend, N, block_size=BLOCK_SIZE, loop=None):
+    """
+    Vòng lặp bước cố định dạng generator: gọi step(i, t_i, y_i) -> y_{i+1}
+    và trả về từng khối (t_block, y_block) tối đa block_size điểm trên lưới
+    đều N + 1 điểm (cùng giá trị với np.linspace(t0, tend, N + 1)). Chỉ giữ
+    một khối trong bộ nhớ nên N rất lớn vẫn chạy với bộ nhớ không đổi.
+    Với loop(i0, y, out) (kernel vòng lặp hợp nhất), cả khối được tính
+    trong một lời gọi: các bước i0, i0 + 1, ... ghi y_{i+1} vào out và
+    loop trả về trạng thái cuối.
+    """
+    h = (tend - t0) / N
+    block_size = max(1, int(block_size))
+    y = y0
+    for start in range(0, N + 1, block_size):
+        stop = min(start + block_size, N + 1)
+        t_block = np.arange(start, stop) * h + t0
+        if stop == N + 1:
+            t_block[-1] = tend
+        y_block = np.empty((stop - start,) + np.shape(y0))
+        if loop is not None:
+            first = 0
+            if start == 0:
+                y_block[0] = y
+                first = 1
+            if stop - start > first:
+                y = loop(start + first - 1, y, y_block[first:])
+            yield t_block, y_block
+            continue
+        for j in range(stop - start):
+            i = start + j
+            if i > 0:
+                y = step(i - 1, (i - 1) * h + t0, y)
+            y_block[j] = y
+        yield t_block, y_block
+def collect_blocks(blocks):
+    """Ghép các khối thành (t_values, y_values) như solve()."""
+    t_parts, y_parts = [], []
+    for t_block, y_block in blocks:
+        t_parts.append(t_block)
+        y_parts.append(y_block)
+    if len(t_parts) == 1:
+        return t_parts[0], y_parts[0]
+    return np.concatenate(t_parts), np.concatenate(y_parts)
+def spill_blocks(blocks, path, n_points):
+    """
+    Ghi các khối thẳng vào tệp .npy ánh xạ bộ nhớ (np.lib.format.open_memmap):
+    y vào path, t vào <path>_t.npy. Trả về (t, y) dạng memmap chỉ đọc.
+    """
+    stem = path[:-4] if path.lower().endswith(".npy") else path
+    y_path, t_path = stem + ".npy", stem + "_t.npy"
+    t_out = np.lib.format.open_memmap(t_path, mode="w+", dtype=float, shape=(n_points,))
+    y_out = None
+    pos = 0
+    for t_block, y_block in blocks:
+        if y_out is None:
+            y_out = np.lib.format.open_memmap(y_path, mode="w+", dtype=float, shape=(n_points,) + y_block.shape[1:])
+        t_out[pos:pos + len(t_block)] = t_block
+        y_out[pos:pos + len(t_block)] = y_block
+        pos += len(t_block)
+    t_out.flush()
+    y_out.flush()
+    del t_out, y_out
+    return np.load(t_path, mmap_mode="r"), np.load(y_path, mmap_mode="r")
+class Reduction:
+    """
+    Thống kê chạy theo khối mà không lưu quỹ đạo: giá trị cuối, min/max theo
+    thời gian (từng thành phần) và, nếu có exact_func, sai số lớn nhất và
+    sai số RMS so với nghiệm giải tích (exact_func(t_block) trả về mảng
+    (len(t_block), ...) broadcast được với y_block).
+    """
+    def __init__(self, exact_func=None):
+        self.exact_func = exact_func
+        self.n_points = 0
+        self.t_final = None
+        self.y_final = None
+        self.y_min = None
+        self.y_max = None
+        self.max_error = None
+        self._sq_error = None
+    def update(self, t_block, y_block):
+        block_min = np.min(y_block, axis=0)
+        block_max = np.max(y_block, axis=0)
+        if self.n_points == 0:
+            self.y_min, self.y_max = block_min, block_max
+        else:
+            self.y_min = np.minimum(self.y_min, block_min)
+            self.y_max = np.maximum(self.y_max, block_max)
+        self.n_points += len(t_block)
+        self.t_final = float(t_block[-1])
+        self.y_final = y_block[-1].copy()
+        if self.exact_func is not None:
+            exact = np.asarray(self.exact_func(t_block))
+            err = np.abs(y_block - exact.reshape(exact.shape + (1,) * (y_block.ndim - exact.ndim)))
+            block_err = np.max(err, axis=0)
+            block_sq = np.sum(err ** 2, axis=0)
+            if self.max_error is None:
+                self.max_error, self._sq_error = block_err, block_sq
+            else:
+                self.max_error = np.maximum(self.max_error, block_err)
+                self._sq_error = self._sq_error + block_sq
+        return self
+    def consume(self, blocks):
+        for t_block, y_block in blocks:
+            self.update(t_block, y_block)
+        return self
+    def passthrough(self, blocks):
+        """Cập nhật thống kê và trả lại từng khối (để vừa ghi ra tệp vừa thống kê)."""
+        for t_block, y_block in blocks:
+            self.update(t_block, y_block)
+            yield t_block, y_block
+    @property
+    def rms_error(self):
+        if self._sq_error is None:
+            return None
+        return np.sqrt(self._sq_error / self.n_points)
+    def summary(self):
+        result = {"n_points": self.n_points, "t_final": self.t_final, "y_final": self.y_final,
+                  "y_min": self.y_min, "y_max": self.y_max}
+        if self.max_error is not None:
+            result["max_error"] = self.max_error
+            result["rms_error"] = self.rms_error
+        return result
@@ -1,60 +1,158 @@
 import numpy as np
-import pandas as pd
-import streamlit as st
+from math import factorial, ceil, log
+from .series import SeriesTape
+from .trace import fmt
+from .stream import BLOCK_SIZE, fixed_step_blocks, collect_blocks
+def series_interpolate(t_mesh, coeff_mesh, t_query):
+    """
+    Dense output: đánh giá đa thức Taylor của bước chứa mỗi điểm t_query
+    (hệ số coeff_mesh[i] quanh t_mesh[i]) theo sơ đồ Horner; t_mesh có thể
+    giảm dần (tích phân lùi).
+    """
+    direction = 1.0 if t_mesh[-1] >= t_mesh[0] else -1.0
+    idx = np.clip(np.searchsorted(direction * t_mesh, direction * t_query, side="right") - 1, 0, len(coeff_mesh) - 1)
+    s = (t_query - t_mesh[idx]).reshape((-1,) + (1,) * (coeff_mesh.ndim - 2))
+    values = coeff_mesh[idx, -1]
+    for k in range(coeff_mesh.shape[1] - 2, -1, -1):
+        values = values * s + coeff_mesh[idx, k]
+    return values
 class TaylorSolver:
-    def __init__(self, derivative_functions, order):
-        self.deriv_funcs = derivative_functions
+    def __init__(self, derivative_kernel, order, fused_step=None, fused_loop=None):
+        """
+        derivative_kernel(t, y) trả về mảng (order, *shape(y)) gồm
+        f, f', ..., f^(order-1) trong một lần gọi. Vẫn chấp nhận danh sách
+        các hàm đạo hàm riêng lẻ như trước, hoặc một SeriesTape (chế độ AD:
+        hệ số Taylor tính bằng số học chuỗi lũy thừa, cho phép bậc cao và
+        solve_adaptive).
+        fused_step(t_i, y_i, h, coeffs) / fused_loop(i0, y, h, t0, out, coeffs)
+        (coeffs dạng hàng (1, order)) là kernel hợp nhất (đạo hàm và tổng
+        chuỗi trong một hàm) dùng cho solve() khi không ghi vết.
+        """
+        self.series = None
+        if isinstance(derivative_kernel, SeriesTape):
+            self.series = derivative_kernel
+            self.kernel = lambda t, y: derivative_kernel.derivatives(t, y, order)
+        elif callable(derivative_kernel):
+            self.kernel = derivative_kernel
+        else:
+            funcs = list(derivative_kernel)
+            self.kernel = lambda t, y: np.array([np.broadcast_to(func(t, y), np.shape(y)) for func in funcs[:order]])
         self.order = order
-    def solve(self, t0, y0, tend, N):
-        t_values = np.linspace(t0, tend, N + 1)
-        y_values = np.zeros(N + 1)
-        y_values[0] = y0
-        h = (tend - t0) / N
-        columns = ["Step", "t_i", "y_i"]
+        self.fused_step = fused_step
+        self.fused_loop = fused_loop
+    def columns(self):
+        columns = ["Step", "t_i", "h", "y_i"]
         for k in range(self.order):
             columns.append(f'Term (h^{k+1})')
         columns.append('y_{i+1}')
-        step_data = []
-        step_explanations = []
-        for i in range(N):
-            ti = t_values[i]
-            yi = y_values[i]
-            y_next = yi
-            h_power = 1.0
-            factorial = 1.0
-            row_data = [i, ti, yi]
-            step_str = f"**Bước {i+1} (từ t = {ti:.4f} đến t = {t_values[i+1]:.4f}):**\n\n"
-            step_str += f"* Giá trị ban đầu: $y_{i} = y({ti:.4f}) = {yi:.6f}$\n"
-            step_str += "* Tính các số hạng (terms) của chuỗi Taylor:\n"
-            terms_str_list = []
-            for k in range(self.order):
-                f_k_value = np.real(self.deriv_funcs[k](ti, yi))
-                h_power *= h
-                factorial *= (k + 1)
-                term = (h_power / factorial) * f_k_value
-                y_next += term
-                row_data.append(term)
-                step_str += f"    * Bậc {k+1}: $\\frac{{h^{k+1}}}{{(k+1)!}} f^{{({k})}}(t_i, y_i) = \\frac{{{h:.4f}^{k+1}}}{{{int(factorial)}}} ({f_k_value:.6f}) = {term:.6f}$\n"
-                terms_str_list.append(f"{term:.6f}")
-            y_values[i+1] = y_next
-            row_data.append(y_next)
-            step_data.append(row_data)
-            step_str += f"\n* Cộng các số hạng để tìm $y_{i+1}$:\n"
-            step_str += f"    $y_{i+1} = y_i + (Term_1) + (Term_2) + \dots$\n"
-            step_str += f"    $y_{i+1} = {yi:.6f} + {' + '.join(terms_str_list)}$\n"
-            step_str += f"    **$y_{i+1} = {y_next:.6f}$**\n\n---\n"
-            step_explanations.append(step_str)
-        with st.expander(f"Xem chi tiết tính toán từng bước của Taylor (Bậc {self.order})"):
-            tab1, tab2 = st.tabs(["Giải thích từng bước", "Bảng dữ liệu chi tiết"])
-            with tab1:
-                if step_data:
-                    tab1.markdown("\n".join(step_explanations))
-                else:
-                    tab1.info("Không có dữ liệu bước để hiển thị.")
-            with tab2:
-                if step_data:
-                    df_steps = pd.DataFrame(step_data, columns=columns)
-                    tab2.dataframe(df_steps.style.format("{:.6f}"))
-                else:
-                    tab2.info("Không có dữ liệu bước để hiển thị.")           
-        return t_values, y_values
\ No newline at end of file
+        return columns
+    def format_step(self, row):
+        i, ti, h, yi = row[:4]
+        terms = row[4:-1]
+        y_next = row[-1]
+        step_str = f"**Bước {i+1} (từ t = {ti:.4f} đến t = {ti + h:.4f}):**\n\n"
+        step_str += f"* Giá trị ban đầu: $y_{i} = y({ti:.4f}) = {fmt(yi)}$\n"
+        step_str += "* Tính các số hạng (terms) của chuỗi Taylor:\n"
+        for k, term in enumerate(terms):
+            fact = factorial(k + 1)
+            f_k_value = term * fact / h**(k + 1)
+            step_str += f"    * Bậc {k+1}: $\\frac{{h^{k+1}}}{{(k+1)!}} f^{{({k})}}(t_i, y_i) = \\frac{{{h:.4f}^{k+1}}}{{{fact}}} ({fmt(f_k_value)}) = {fmt(term)}$\n"
+        step_str += f"\n* Cộng các số hạng để tìm $y_{i+1}$:\n"
+        step_str += f"    $y_{i+1} = y_i + (Term_1) + (Term_2) + \\dots$\n"
+        step_str += f"    $y_{i+1} = {fmt(yi)} + {' + '.join(fmt(term) for term in terms)}$\n"
+        step_str += f"    **$y_{i+1} = {fmt(y_next)}$**\n\n---\n"
+        return step_str
+    def solve(self, t0, y0, tend, N, trace=None):
+        return collect_blocks(self.iter_blocks(t0, y0, tend, N, block_size=N + 1, trace=trace))
+    def iter_blocks(self, t0, y0, tend, N, block_size=BLOCK_SIZE, trace=None):
+        """Như solve() nhưng trả về dần từng khối (t_block, y_block) tối đa block_size điểm."""
+        h = (tend - t0) / N
+        coeffs = np.array([h**(k + 1) / factorial(k + 1) for k in range(self.order)])
+        tracing = trace is not None and trace.active
+        if tracing:
+            trace.begin(self.columns(), self.format_step, n_steps=N)
+        elif self.fused_loop is not None:
+            row = coeffs.reshape(1, -1)
+            yield from fixed_step_blocks(None, t0, y0, tend, N, block_size,
+                                         loop=lambda i0, y, out: self.fused_loop(i0, y, h, t0, out, row))
+            return
+        elif self.fused_step is not None:
+            row = coeffs.reshape(1, -1)
+            yield from fixed_step_blocks(lambda i, ti, yi: self.fused_step(ti, yi, h, row), t0, y0, tend, N,
+                                         block_size)
+            return
+        def step(i, ti, yi):
+            derivs = np.real(self.kernel(ti, yi))
+            y_next = yi + np.tensordot(coeffs, derivs, axes=1)
+            if tracing and trace.wants(i):
+                terms = [coeffs[k] * derivs[k] for k in range(self.order)]
+                trace.record([i, ti, h, yi] + terms + [y_next])
+            return y_next
+        yield from fixed_step_blocks(step, t0, y0, tend, N, block_size)
+        if tracing:
+            trace.end(N)
+    def adaptive_columns(self):
+        return ["Step", "t_i", "h", "y_i", "Bậc p", "y_{i+1}"]
+    def format_adaptive_step(self, row):
+        i, ti, h, yi, p, y_next = row
+        step_str = f"**Bước {i+1} (từ t = {ti:.4f} đến t = {ti + h:.4f}):**\n\n"
+        step_str += f"* Hệ số Taylor $y_0, \\dots, y_{{{p}}}$ tại $y_{i} = {fmt(yi)}$ được tính bằng số học chuỗi lũy thừa.\n"
+        step_str += f"* Bước $h = \\min\\left((tol/\\|y_{{{p-1}}}\\|)^{{1/{p-1}}}, (tol/\\|y_{{{p}}}\\|)^{{1/{p}}}\\right) = {h:.6g}$\n"
+        step_str += f"    **$y_{i+1} = \\sum_k y_k h^k = {fmt(y_next)}$**\n\n---\n"
+        return step_str
+    def solve_adaptive(self, t0, y0, tend, N=None, rtol=1e-12, atol=1e-12, safety=0.9,
+                       max_steps=100000, trace=None):
+        """
+        Taylor bậc và bước thích nghi (Jorba-Zou), cần chế độ AD (SeriesTape).
+        Bậc p = ceil(-ln(tol)/2) + 1 (tối đa self.order); bước h lấy từ hai
+        hệ số cuối: h = safety * min((tol/|y_{p-1}|)^(1/(p-1)), (tol/|y_p|)^(1/p)),
+        với tol = atol + rtol * |y|. Lưới bước được lưu ở self.t_mesh và
+        self.coeff_mesh; nếu có N, kết quả được đánh giá từ đa thức Taylor của
+        từng bước (dense output) trên lưới đều N + 1 điểm. Với tend < t0 bước
+        h mang dấu âm (tích phân lùi).
+        """
+        if self.series is None:
+            raise ValueError("Taylor thích nghi cần chế độ chuỗi lũy thừa (AD).")
+        p = max(2, min(self.order, ceil(-0.5 * log(min(rtol, atol))) + 1))
+        self.n_accepted = 0
+        t = float(t0)
+        y = np.asarray(y0, dtype=float)
+        direction = 1.0 if tend >= t0 else -1.0
+        t_mesh = [t]
+        coeff_mesh = []
+        tracing = trace is not None and trace.active
+        if tracing:
+            trace.begin(self.adaptive_columns(), self.format_adaptive_step)
+        while (tend - t) * direction > 0:
+            if self.n_accepted >= max_steps:
+                raise RuntimeError(f"Taylor thích nghi vượt quá {max_steps} bước tại t = {t:.6g}.")
+            coeffs = self.series.coefficients(t, y, p)
+            tol = atol + rtol * np.max(np.abs(y))
+            with np.errstate(divide="ignore"):
+                rho = min((tol / np.max(np.abs(coeffs[p - 1]))) ** (1 / (p - 1)),
+                          (tol / np.max(np.abs(coeffs[p]))) ** (1 / p))
+            h = direction * min(safety * rho, abs(tend - t))
+            if not np.isfinite(h) or abs(h) <= 16 * np.finfo(float).eps * max(abs(t), 1.0):
+                raise RuntimeError(f"Bước h không hợp lệ ({h:.3g}) tại t = {t:.6g}.")
+            y_next = coeffs[p]
+            for k in range(p - 1, -1, -1):
+                y_next = y_next * h + coeffs[k]
+            if tracing and trace.wants(self.n_accepted):
+                trace.record([self.n_accepted, t, h, y, p, y_next])
+            t = tend if (t + h - tend) * direction >= 0 else t + h
+            y = y_next
+            t_mesh.append(t)
+            coeff_mesh.append(coeffs)
+            self.n_accepted += 1
+        self.t_mesh = np.array(t_mesh)
+        self.coeff_mesh = np.array(coeff_mesh).reshape((-1, p + 1) + y.shape)
+        self.y_mesh = np.concatenate([self.coeff_mesh[:, 0], [y]])
+        self.adaptive_order = p
+        if tracing:
+            trace.end(self.n_accepted)
+        if N is None:
+            return self.t_mesh, self.y_mesh
+        t_values = np.linspace(t0, tend, N + 1)
+        if self.n_accepted == 0:
+            return t_values, np.broadcast_to(y, t_values.shape + y.shape).copy()
+        return t_values, series_interpolate(self.t_mesh, self.coeff_mesh, t_values)
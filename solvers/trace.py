@@ -0,0 +1,119 @@
+from collections import deque
+import numpy as np
+import pandas as pd
+TRACE_MODES = ("off", "all", "every", "headtail", "paged")
+def fmt(value, spec=".6f", max_items=3, ellipsis="\\dots"):
+    """
+    Định dạng một giá trị trong chuỗi giải thích. Với trạng thái dạng mảng
+    (ensemble/hệ phương trình) chỉ hiện vài phần tử đầu.
+    """
+    arr = np.asarray(value)
+    if arr.ndim == 0:
+        return format(float(arr), spec)
+    items = ", ".join(format(float(v), spec) for v in arr.ravel()[:max_items])
+    if arr.size > max_items:
+        items += f", {ellipsis}"
+    return f"[{items}]"
+class StepTrace:
+    """
+    Bộ ghi vết các bước tính toán, tách khỏi vòng lặp số học.
+    Bộ giải chỉ ghi các hàng số liệu thô; chuỗi giải thích (markdown/LaTeX)
+    chỉ được định dạng khi hiển thị, và chỉ cho các hàng được yêu cầu.
+    Các chế độ:
+      - "off": không ghi gì.
+      - "all": ghi mọi bước.
+      - "every": ghi mỗi k bước (luôn giữ bước cuối; khi chưa biết số bước,
+        như với bộ giải thích nghi, bước cuối được giữ tạm và ghi ở end()).
+      - "headtail": ghi M bước đầu và M bước cuối.
+      - "paged": ghi mọi bước nhưng hiển thị từng trang page_size bước.
+    """
+    def __init__(self, mode="off", every=1, head=10, tail=10, page_size=50):
+        if mode not in TRACE_MODES:
+            raise ValueError(f"Chế độ ghi vết không hợp lệ: {mode!r}. Chọn một trong {TRACE_MODES}.")
+        self.mode = mode
+        self.every = max(1, int(every))
+        self.head = max(0, int(head))
+        self.tail = max(0, int(tail))
+        self.page_size = max(1, int(page_size))
+        self.columns = []
+        self.formatter = None
+        self.notes = []
+        self.n_steps = None
+        self.total_steps = 0
+        self._head_rows = []
+        self._tail_rows = deque(maxlen=self.tail or None)
+        self._rows = []
+        self._pending = False
+        self._last = None
+    @property
+    def active(self):
+        return self.mode != "off"
+    def begin(self, columns, formatter=None, n_steps=None, note=None):
+        """Được bộ giải gọi một lần trước vòng lặp."""
+        self.columns = list(columns)
+        self.formatter = formatter
+        self.n_steps = n_steps
+        self.total_steps = 0
+        self._head_rows = []
+        self._tail_rows = deque(maxlen=self.tail or None)
+        self._rows = []
+        self._pending = False
+        self._last = None
+        if note:
+            self.notes.append(note)
+    def wants(self, i):
+        """Cho biết bước i có cần được ghi lại hay không."""
+        if self.mode == "every":
+            if i % self.every == 0 or (self.n_steps is not None and i == self.n_steps - 1):
+                return True
+            self._pending = self.n_steps is None
+            return self._pending
+        if self.mode == "headtail":
+            if i < self.head:
+                return True
+            return self.n_steps is None or i >= self.n_steps - self.tail
+        return self.mode != "off"
+    def record(self, row):
+        if self.mode == "headtail":
+            if len(self._head_rows) < self.head:
+                self._head_rows.append(row)
+            elif self.tail:
+                self._tail_rows.append(row)
+        elif self._pending:
+            self._pending = False
+            self._last = row
+        else:
+            self._rows.append(row)
+            self._last = None
+    def end(self, total_steps):
+        """Được bộ giải gọi sau vòng lặp với tổng số bước đã thực hiện."""
+        self.total_steps = total_steps
+        if self._last is not None:
+            self._rows.append(self._last)
+            self._last = None
+    def rows(self):
+        if self.mode == "headtail":
+            return self._head_rows + list(self._tail_rows)
+        return self._rows
+    def __len__(self):
+        return len(self.rows())
+    @property
+    def n_pages(self):
+        return max(1, -(-len(self) // self.page_size))
+    def page(self, p):
+        rows = self.rows()
+        start = p * self.page_size
+        return rows[start:start + self.page_size]
+    def explanations(self, rows=None):
+        """Định dạng (lười) chuỗi giải thích cho các hàng được chọn."""
+        if rows is None:
+            rows = self.rows()
+        if self.formatter is None:
+            return []
+        return [self.formatter(row) for row in rows]
+    def dataframe(self, rows=None):
+        if rows is None:
+            rows = self.rows()
+        rows = [[fmt(v, ellipsis="...") if np.ndim(v) > 0 else (v.item() if isinstance(v, np.ndarray) else v)
+                 for v in row] for row in rows]
+        return pd.DataFrame(rows, columns=self.columns)
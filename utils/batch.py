@@ -0,0 +1,150 @@
+import itertools
+import json
+import os
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from .runner import METHODS, solve_ode, make_exact_function, exact_values
+SUMMARY_COLUMNS = ["run_id", "equation", "method", "order", "adaptive", "t0", "y0", "tend", "N",
+                   "status", "error", "elapsed", "y_final", "max_error", "final_error"]
+def load_spec(path):
+    with open(path, encoding="utf-8") as fh:
+        return json.load(fh)
+def expand_spec(spec):
+    """
+    Khai triển một đặc tả quét tham số thành danh sách cấu hình chạy.
+    Đặc tả (JSON) gồm:
+      - "equations": danh sách chuỗi f(t, y) hoặc {"f": ..., "exact": ...}
+      - "ivps": danh sách [t0, y0, tend] (y0 là danh sách với hệ phương trình)
+      - "N": danh sách số bước
+      - "methods": tập con của METHODS (mặc định: tất cả)
+      - "taylor_orders": các bậc Taylor (chỉ dùng cho "taylor")
+      - tùy chọn: "indep_var", "dep_var", "adaptive", "rtol", "atol",
+        "taylor_backend" ("symbolic" hoặc "ad"; adaptive áp dụng cho
+        "rkf45" và cho "taylor" ở chế độ "ad"; "adams", "bdf", "rosenbrock" luôn
+        dùng bước thích nghi theo rtol/atol)
+    """
+    equations = [eq if isinstance(eq, dict) else {"f": eq} for eq in spec["equations"]]
+    ivps = spec["ivps"]
+    n_values = spec["N"] if isinstance(spec["N"], list) else [spec["N"]]
+    methods = spec.get("methods", list(METHODS))
+    orders = spec.get("taylor_orders", [4])
+    backend = spec.get("taylor_backend", "symbolic")
+    for method in methods:
+        if method not in METHODS:
+            raise ValueError(f"Phương pháp không hợp lệ: {method!r}. Chọn một trong {METHODS}.")
+    configs = []
+    for eq, (t0, y0, tend), N, method in itertools.product(equations, ivps, n_values, methods):
+        for order in (orders if method == "taylor" else [None]):
+            configs.append({
+                "run_id": len(configs),
+                "equation": eq["f"],
+                "exact": eq.get("exact"),
+                "method": method,
+                "order": order,
+                "adaptive": method in ("adams", "bdf", "rosenbrock") or (bool(spec.get("adaptive", False))
+                                                               and (method == "rkf45" or (method == "taylor" and backend == "ad"))),
+                "taylor_backend": backend,
+                "rtol": spec.get("rtol", 1e-6),
+                "atol": spec.get("atol", 1e-9),
+                "indep_var": spec.get("indep_var", "t"),
+                "dep_var": spec.get("dep_var", "y"),
+                "t0": float(t0),
+                "y0": y0,
+                "tend": float(tend),
+                "N": int(N),
+            })
+    return configs
+def run_config(config):
+    """
+    Chạy một cấu hình (dùng được trong process pool). Lỗi được ghi vào
+    kết quả thay vì làm dừng cả lần quét.
+    """
+    result = {key: config.get(key) for key in SUMMARY_COLUMNS if key in config}
+    result.update({"status": "ok", "error": "", "elapsed": np.nan, "y_final": np.nan,
+                   "max_error": np.nan, "final_error": np.nan,
+                   "t": np.array([]), "y": np.array([])})
+    try:
+        run = solve_ode(config["equation"], config["t0"], config["y0"], config["tend"], config["N"],
+                        method=config["method"], order=config["order"] or 4,
+                        indep_var=config["indep_var"], dep_var=config["dep_var"],
+                        adaptive=config["adaptive"], rtol=config["rtol"], atol=config["atol"],
+                        taylor_backend=config.get("taylor_backend", "symbolic"))
+        result["t"] = np.asarray(run.t_values)
+        result["y"] = np.asarray(run.y_values)
+        result["elapsed"] = run.elapsed
+        y_final = result["y"][-1]
+        result["y_final"] = float(y_final) if y_final.ndim == 0 else y_final.tolist()
+        if config.get("exact"):
+            exact_func = make_exact_function(config["exact"], config["indep_var"])
+            err = np.abs(result["y"] - exact_values(exact_func, result["t"]))
+            result["max_error"] = float(np.max(err))
+            result["final_error"] = float(np.max(err[-1]))
+    except Exception as e:
+        result["status"] = "error"
+        result["error"] = f"{e}\n{traceback.format_exc(limit=1)}".strip()
+    return result
+def run_sweep(configs, workers=None, chunksize=1):
+    """
+    Chạy danh sách cấu hình song song trên một process pool.
+    workers=1 chạy tuần tự trong tiến trình hiện tại.
+    """
+    if workers == 1:
+        return [run_config(config) for config in configs]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_config, configs, chunksize=chunksize))
+def summary_frame(results):
+    frame = pd.DataFrame([{key: res.get(key) for key in SUMMARY_COLUMNS} for res in results], columns=SUMMARY_COLUMNS)
+    frame["order"] = frame["order"].astype("Int64")
+    return frame
+def trajectories_frame(results):
+    frames = []
+    for res in results:
+        if res["status"] != "ok":
+            continue
+        y = res["y"].reshape(len(res["t"]), -1)
+        if y.shape[1] == 1:
+            frame = pd.DataFrame({"t": res["t"], "y": y[:, 0]})
+        else:
+            frame = pd.DataFrame(y, columns=[f"y[{j}]" for j in range(y.shape[1])])
+            frame.insert(0, "t", res["t"])
+        frame.insert(0, "run_id", res["run_id"])
+        frames.append(frame)
+    if not frames:
+        return pd.DataFrame(columns=["run_id", "t", "y"])
+    return pd.concat(frames, ignore_index=True)
+def write_results(results, path, trajectories=True):
+    """
+    Ghi kết quả quét ra CSV, Parquet hoặc NPZ (theo đuôi tệp).
+    Với CSV/Parquet: bảng tóm tắt ghi vào <tên>_summary<đuôi>, quỹ đạo
+    (dạng dài: run_id, t, y) ghi vào path; nếu trajectories=False thì
+    chỉ ghi bảng tóm tắt vào path. NPZ chứa cả hai trong một tệp.
+    """
+    stem, ext = os.path.splitext(path)
+    ext = ext.lower()
+    summary = summary_frame(results)
+    if ext == ".npz":
+        arrays = {}
+        for col in SUMMARY_COLUMNS:
+            values = summary[col].to_numpy()
+            arrays[f"summary_{col}"] = values.astype(str) if values.dtype == object else values
+        if trajectories:
+            for res in results:
+                arrays[f"t_{res['run_id']}"] = res["t"]
+                arrays[f"y_{res['run_id']}"] = res["y"]
+        np.savez_compressed(path, **arrays)
+        return [path]
+    if ext == ".csv":
+        writer = lambda frame, target: frame.to_csv(target, index=False)
+    elif ext == ".parquet":
+        writer = lambda frame, target: frame.to_parquet(target, index=False)
+    else:
+        raise ValueError(f"Định dạng đầu ra không hỗ trợ: {ext!r} (dùng .csv, .parquet hoặc .npz).")
+    if not trajectories:
+        writer(summary, path)
+        return [path]
+    summary_path = f"{stem}_summary{ext}"
+    writer(trajectories_frame(results), path)
+    writer(summary, summary_path)
+    return [path, summary_path]
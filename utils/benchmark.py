@@ -0,0 +1,189 @@
+import tracemalloc
+import numpy as np
+import pandas as pd
+import matplotlib.pyplot as plt
+from .runner import build_processor, solve_ode, make_exact_function, exact_values, IMPLICIT_SOLVERS
+from .instrument import Instrumentation
+BENCH_PROBLEMS = {
+    "default": {"f": "y - t**2 + 1", "y0": 0.5, "tend": 2.0, "exact": "(t+1)**2 - 0.5*np.exp(t)"},
+    "exp_sin": {"f": "y*cos(t)", "y0": 1.0, "tend": 10.0, "exact": "np.exp(np.sin(t))"},
+    "logistic": {"f": "y*(1 - y)", "y0": 0.1, "tend": 10.0, "exact": "1/(1 + 9*np.exp(-t))"},
+    "oscillator": {"f": "v; -x", "dep_var": "x, v", "y0": [1.0, 0.0], "tend": 10.0, "exact": "np.cos(t); -np.sin(t)"},
+    "stiff": {"f": "-50*(y - cos(t))", "y0": 0.0, "tend": 2.0,
+              "exact": "(2500*np.cos(t) + 50*np.sin(t) - 2500*np.exp(-50*t))/2501"},
+}
+BENCH_CONFIGS = {
+    "taylor2": {"method": "taylor", "order": 2},
+    "taylor4": {"method": "taylor", "order": 4},
+    "taylor6": {"method": "taylor", "order": 6},
+    "rkf45": {"method": "rkf45"},
+    "abm4": {"method": "abm4"},
+    "rkf45-adaptive": {"method": "rkf45", "adaptive": True},
+    "taylor-ad": {"method": "taylor", "order": 20, "taylor_backend": "ad", "adaptive": True},
+    "adams": {"method": "adams", "adaptive": True},
+    "bdf": {"method": "bdf", "adaptive": True},
+    "rosenbrock": {"method": "rosenbrock", "adaptive": True},
+}
+EXPECTED_ORDERS = {"rkf45": 5, "abm4": 4}
+N_LADDER = (10, 20, 40, 80, 160, 320)
+TOL_LADDER = (1e-3, 1e-5, 1e-7, 1e-9)
+ADAPTIVE_N = 50
+BENCH_COLUMNS = ["problem", "config", "method", "N", "tol", "time", "nfev", "peak_mb", "error", "status"]
+KEY_COLUMNS = ["problem", "config", "N", "tol"]
+def _evaluations(instrument):
+    """
+    Số lần đánh giá vế phải: f với RK/Adams/bộ giải ẩn, kernel đạo hàm với
+    Taylor bước cố định, số bước (mỗi bước một lần tính chuỗi lũy thừa) với
+    Taylor AD thích nghi.
+    """
+    evaluations = instrument.evaluations()
+    if "f" in evaluations or "taylor_kernel" in evaluations:
+        return evaluations.get("f", 0) + evaluations.get("taylor_kernel", 0)
+    return instrument.stats.get("n_accepted", 0)
+def bench_run(problem_name, config_name, processor, N, tol=None, repeat=3, memory=True):
+    """
+    Chạy một điểm trên thang N (bước cố định) hoặc tol (bước thích nghi):
+    thời gian tốt nhất trong repeat lần, số lần gọi f (đếm bằng
+    Instrumentation ở lần chạy khởi động, không tính giờ), bộ nhớ đỉnh (một
+    lần chạy riêng dưới tracemalloc để không làm sai thời gian) và sai số
+    lớn nhất so với nghiệm giải tích trên lưới đầu ra.
+    """
+    problem = BENCH_PROBLEMS[problem_name]
+    config = BENCH_CONFIGS[config_name]
+    row = {"problem": problem_name, "config": config_name, "method": config["method"], "N": N,
+           "tol": np.nan if tol is None else tol, "time": np.nan, "nfev": np.nan, "peak_mb": np.nan,
+           "error": np.nan, "status": "ok"}
+    def run(instrument=None):
+        return solve_ode(problem["f"], problem.get("t0", 0.0), problem["y0"], problem["tend"], N,
+                         method=config["method"], order=config.get("order", 4), dep_var=problem.get("dep_var", "y"),
+                         adaptive=config.get("adaptive", False), rtol=tol or 1e-6, atol=tol or 1e-9,
+                         processor=processor, taylor_backend=config.get("taylor_backend", "symbolic"),
+                         instrument=instrument)
+    try:
+        with np.errstate(all="ignore"):
+            instrument = Instrumentation()
+            run(instrument)
+            row["nfev"] = _evaluations(instrument)
+            times = []
+            for _ in range(max(1, repeat)):
+                result = run()
+                times.append(result.elapsed)
+            row["time"] = min(times)
+            exact_func = make_exact_function(problem["exact"])
+            row["error"] = float(np.max(np.abs(result.y_values - exact_values(exact_func, result.t_values))))
+            if memory:
+                tracemalloc.start()
+                try:
+                    run()
+                    row["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2**20
+                finally:
+                    tracemalloc.stop()
+    except Exception as e:
+        row["status"] = f"error: {e}"
+    return row
+def run_benchmark(problems=None, configs=None, n_ladder=N_LADDER, tol_ladder=TOL_LADDER, repeat=3, memory=True,
+                  progress=None):
+    """
+    Chạy bộ benchmark: mỗi bài toán trong problems (mặc định: BENCH_PROBLEMS)
+    với mỗi cấu hình trong configs (mặc định: BENCH_CONFIGS), trên thang N
+    cho phương pháp bước cố định và thang tol (rtol = atol, lưới đầu ra
+    ADAPTIVE_N bước) cho phương pháp thích nghi. Trả về DataFrame BENCH_COLUMNS.
+    """
+    rows = []
+    for problem_name in problems or list(BENCH_PROBLEMS):
+        problem = BENCH_PROBLEMS[problem_name]
+        for config_name in configs or list(BENCH_CONFIGS):
+            config = BENCH_CONFIGS[config_name]
+            method = config["method"]
+            try:
+                processor = build_processor(problem["f"], "t", problem.get("dep_var", "y"),
+                                            config.get("order") if method == "taylor" else None,
+                                            taylor_backend=config.get("taylor_backend", "symbolic"),
+                                            jacobian=method in IMPLICIT_SOLVERS)
+            except ValueError as e:
+                rows.append({"problem": problem_name, "config": config_name, "method": method, "status": f"error: {e}"})
+                continue
+            if config.get("adaptive"):
+                ladder = [(ADAPTIVE_N, tol) for tol in tol_ladder]
+            else:
+                ladder = [(N, None) for N in n_ladder if method != "abm4" or N >= 4]
+            for N, tol in ladder:
+                if progress is not None:
+                    progress(problem_name, config_name, N, tol)
+                rows.append(bench_run(problem_name, config_name, processor, N, tol, repeat, memory))
+    return pd.DataFrame(rows, columns=BENCH_COLUMNS)
+def expected_order(config_name):
+    config = BENCH_CONFIGS[config_name]
+    if config.get("adaptive"):
+        return np.nan
+    if config["method"] == "taylor":
+        return config["order"]
+    return EXPECTED_ORDERS.get(config["method"], np.nan)
+def observed_orders(df, floor=1e-11, ceiling=1e-1):
+    """
+    Bậc hội tụ quan sát được của các cấu hình bước cố định: độ dốc của
+    log(sai số) theo log(N) (bình phương tối thiểu) và theo cặp N cuối.
+    Chỉ dùng các sai số trong (floor, ceiling) để bỏ vùng sai số làm tròn
+    và vùng mất ổn định.
+    """
+    rows = []
+    fixed = df[df["tol"].isna() & (df["status"] == "ok")]
+    for (problem_name, config_name), group in fixed.groupby(["problem", "config"], sort=False):
+        group = group.sort_values("N")
+        err = group["error"].to_numpy(dtype=float)
+        n_values = group["N"].to_numpy(dtype=float)
+        keep = np.isfinite(err) & (err > floor) & (err < ceiling)
+        observed = last_pair = np.nan
+        if keep.sum() >= 2:
+            log_n, log_err = np.log(n_values[keep]), np.log(err[keep])
+            observed = -np.polyfit(log_n, log_err, 1)[0]
+            last_pair = -(log_err[-1] - log_err[-2]) / (log_n[-1] - log_n[-2])
+        rows.append({"problem": problem_name, "config": config_name, "expected_order": expected_order(config_name),
+                     "observed_order": observed, "last_pair_order": last_pair, "points": int(keep.sum())})
+    return pd.DataFrame(rows, columns=["problem", "config", "expected_order", "observed_order", "last_pair_order",
+                                       "points"])
+def work_precision_plot(df, problem_name, x="nfev"):
+    """
+    Biểu đồ work-precision (log-log) cho một bài toán: sai số theo số lần
+    gọi f (x="nfev") hoặc thời gian (x="time"), mỗi cấu hình một đường.
+    """
+    fig, ax = plt.subplots(figsize=(10, 6))
+    data = df[(df["problem"] == problem_name) & (df["status"] == "ok")]
+    for config_name, group in data.groupby("config", sort=False):
+        group = group[np.isfinite(group["error"]) & (group["error"] > 0)].sort_values(x)
+        if len(group):
+            ax.loglog(group[x], group["error"], 'o-', label=config_name, markersize=4)
+    ax.set_title(f"Work-precision: {problem_name} ({BENCH_PROBLEMS[problem_name]['f']})", fontsize=14)
+    ax.set_xlabel("Số lần gọi f" if x == "nfev" else "Thời gian (s)", fontsize=12)
+    ax.set_ylabel("Sai số lớn nhất", fontsize=12)
+    ax.legend()
+    ax.grid(True, which="both", linestyle=':')
+    return fig
+def save_baseline(df, path):
+    df.to_csv(path, index=False)
+    return path
+def load_baseline(path):
+    return pd.read_csv(path, keep_default_na=True)
+def compare_baseline(df, baseline, time_ratio=1.5, error_ratio=10.0, min_time=1e-2):
+    """
+    So sánh với một lần chạy cơ sở trên cùng (problem, config, N, tol).
+    Cột "regression" liệt kê các hồi quy: "time" (chậm hơn time_ratio lần,
+    bỏ qua các lần chạy dưới min_time giây), "nfev" (nhiều lần gọi f hơn),
+    "error" (sai số tăng quá error_ratio lần) hoặc "status" (trước chạy
+    được, nay lỗi). Chuỗi rỗng nghĩa là không hồi quy.
+    """
+    keys = lambda frame: frame.assign(tol=frame["tol"].fillna(0.0))
+    merged = keys(df).merge(keys(baseline)[KEY_COLUMNS + ["time", "nfev", "error", "status"]],
+                            on=KEY_COLUMNS, how="left", suffixes=("", "_base"))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        merged["time_ratio"] = merged["time"] / merged["time_base"]
+        merged["error_ratio"] = merged["error"] / np.maximum(merged["error_base"], 1e-15)
+    flags = pd.DataFrame({
+        "time": (merged["time_ratio"] > time_ratio) & (merged["time"] > min_time),
+        "nfev": merged["nfev"] > merged["nfev_base"],
+        "error": merged["error_ratio"] > error_ratio,
+        "status": (merged["status_base"] == "ok") & (merged["status"] != "ok"),
+    })
+    merged["regression"] = flags.apply(lambda row: ",".join(name for name, flag in row.items() if flag), axis=1)
+    merged["tol"] = df["tol"].to_numpy()
+    return merged
@@ -0,0 +1,119 @@
+import hashlib
+import os
+import pickle
+from collections import OrderedDict
+import numpy as np
+def _normalize(value):
+    """Đưa một phần của khóa về dạng có thể pickle ổn định (mảng -> bytes)."""
+    if isinstance(value, np.ndarray):
+        arr = np.ascontiguousarray(value, dtype=float)
+        return ("ndarray", arr.shape, arr.tobytes())
+    if isinstance(value, dict):
+        return tuple(sorted((str(k), _normalize(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple)):
+        return tuple(_normalize(v) for v in value)
+    if isinstance(value, (np.floating, np.integer)):
+        return value.item()
+    return value
+def make_key(*parts):
+    """Khóa băm (sha1) cho một bộ giá trị: chuỗi, số, mảng NumPy, dict."""
+    return hashlib.sha1(pickle.dumps(_normalize(parts))).hexdigest()
+class LRUCache:
+    """
+    Bộ nhớ đệm LRU giới hạn maxsize mục trong bộ nhớ, tùy chọn lưu xuống
+    đĩa (mỗi mục một tệp pickle trong directory, giữ tối đa disk_maxsize
+    tệp mới nhất). Chỉ các giá trị pickle được (biểu thức SymPy, mảng
+    NumPy) mới nên lưu xuống đĩa; put(..., persist=False) để chỉ giữ
+    trong bộ nhớ.
+    """
+    def __init__(self, maxsize=64, directory=None, disk_maxsize=256):
+        self.maxsize = maxsize
+        self.directory = directory
+        self.disk_maxsize = disk_maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.pkl")
+    def get(self, key, default=None):
+        if key in self._data:
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._data[key]
+        if self.directory and os.path.exists(self._path(key)):
+            try:
+                with open(self._path(key), "rb") as fh:
+                    value = pickle.load(fh)
+            except Exception:
+                value = None
+            if value is not None:
+                self.hits += 1
+                self._store(key, value)
+                return value
+        self.misses += 1
+        return default
+    def _store(self, key, value):
+        self._data[key] = value
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+    def put(self, key, value, persist=True):
+        self._store(key, value)
+        if self.directory and persist:
+            tmp = self._path(key) + ".tmp"
+            with open(tmp, "wb") as fh:
+                pickle.dump(value, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._path(key))
+            self._evict_disk()
+    def _evict_disk(self):
+        files = [os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith(".pkl")]
+        if len(files) > self.disk_maxsize:
+            files.sort(key=os.path.getmtime)
+            for path in files[:len(files) - self.disk_maxsize]:
+                os.remove(path)
+    def __contains__(self, key):
+        return key in self._data or bool(self.directory and os.path.exists(self._path(key)))
+    def __len__(self):
+        return len(self._data)
+    def clear(self):
+        self._data.clear()
+        if self.directory:
+            for name in os.listdir(self.directory):
+                if name.endswith(".pkl"):
+                    os.remove(os.path.join(self.directory, name))
+class SolveCache:
+    """
+    Bộ nhớ đệm giữa các lần chạy cho solve_ode / build_processor:
+      - expressions: biểu thức đã phân tích, theo (func_str, biến) (lưu đĩa được)
+      - processors: bộ xử lý kèm hàm lambdify, kernel đạo hàm Taylor, băng
+        chuỗi lũy thừa, Jacobian, theo (biểu thức, bậc, chế độ, tham số)
+        (chỉ trong bộ nhớ vì hàm lambdify không pickle được)
+      - results: lưới t và nghiệm theo toàn bộ định nghĩa bài toán (lưu đĩa được)
+      - finals: lần giải từ đầu dài nhất của mỗi bài toán (không tính tend, N),
+        để khi tăng tend chỉ cần giải tiếp từ trạng thái cuối.
+    """
+    def __init__(self, maxsize=64, directory=None):
+        sub = (lambda name: os.path.join(directory, name)) if directory else (lambda name: None)
+        self.expressions = LRUCache(maxsize, sub("expressions"))
+        self.processors = LRUCache(maxsize)
+        self.results = LRUCache(maxsize, sub("results"))
+        self.finals = LRUCache(maxsize, sub("finals"))
+    def clear(self):
+        for cache in (self.expressions, self.processors, self.results, self.finals):
+            cache.clear()
+    def stats(self):
+        return {name: (cache.hits, cache.misses, len(cache))
+                for name, cache in (("expressions", self.expressions), ("processors", self.processors),
+                                    ("results", self.results), ("finals", self.finals))}
+_default_cache = None
+def default_cache():
+    """
+    Bộ nhớ đệm dùng chung trong tiến trình (ví dụ giữa các lần chạy lại của
+    Streamlit). Đặt biến môi trường ODE_CACHE_DIR để lưu xuống đĩa.
+    """
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = SolveCache(directory=os.environ.get("ODE_CACHE_DIR") or None)
+    return _default_cache
@@ -0,0 +1,144 @@
+import linecache
+import numpy as np
+import sympy as sp
+from sympy.printing.numpy import NumPyPrinter
+FUSED_METHODS = ("taylor", "rkf45", "abm4")
+FUSED_MODES = ("step", "loop")
+def stack_components(values, shape):
+    """
+    Ghép danh sách thành phần thành mảng (len(values), *shape) như
+    vector_function: mỗi thành phần được broadcast theo các trục ensemble.
+    """
+    values = [np.broadcast_to(value, shape) for value in values]
+    try:
+        return np.array(values, dtype=float)
+    except TypeError:
+        return np.stack(values)
+class StepKernel:
+    """
+    Hàm bước (và vòng lặp nhiều bước) sinh mã riêng cho một cặp (phương
+    pháp, f): f được in bằng cùng máy in NumPy với lambdify và chép thẳng
+    vào từng stage, các biểu thức con chung được tách bằng sp.cse, các hằng
+    theo h được tính một lần. Các phép tổ hợp giữ nguyên thứ tự như trong
+    bộ giải nên kết quả trùng với đường gọi f từng stage (Taylor cộng chuỗi
+    bằng đúng phép dot mà np.tensordot dùng trong TaylorSolver).
+      - step(t_i, y_i, h, *extra) -> y_{i+1} (abm4: (y_{i+1}, lịch sử f))
+      - loop(i0, y, h, t0, out, *extra): chạy len(out) bước từ bước i0,
+        ghi y_{i+1} vào out[j], trả về trạng thái cuối.
+    """
+    def __init__(self, method, source, namespace, param_values):
+        filename = f"<step_kernel {method} {id(self):x}>"
+        linecache.cache[filename] = (len(source), None, source.splitlines(True), filename)
+        exec(compile(source, filename, "exec"), namespace)
+        self.method = method
+        self.source = source
+        self._step = namespace["_step"]
+        self._loop = namespace["_loop"]
+        self.values = param_values
+    def step(self, *args):
+        return self._step(*args, *self.values)
+    def loop(self, *args):
+        return self._loop(*args, *self.values)
+class StepKernelBuilder:
+    """
+    Sinh mã nguồn cho StepKernel từ biểu thức f (và chương trình đạo hàm
+    toàn phần với Taylor) của một SymbolicProcessor.
+    """
+    def __init__(self, processor):
+        self.processor = processor
+        self.printer = NumPyPrinter({'fully_qualified_modules': False, 'inline': True,
+                                     'allow_unknown_functions': True, 'user_functions': {}})
+        self.y_names = [str(sym) for sym in processor.y_syms]
+    def _bind(self, t_code, y_code, indent):
+        """Gán biến t, y (hoặc y_0, ..., y_{m-1}) của f cho một stage."""
+        lines = [f"{indent}t = {t_code}"]
+        if self.processor.is_system:
+            lines.append(f"{indent}_ys = {y_code}")
+            lines.append(f"{indent}{', '.join(self.y_names)} = _ys")
+        else:
+            lines.append(f"{indent}y = {y_code}")
+        return lines
+    def _value(self, exprs):
+        codes = [self.printer.doprint(expr) for expr in exprs]
+        if self.processor.is_system:
+            return f"_stack([{', '.join(codes)}], _shape(_ys)[1:])"
+        return codes[0]
+    def f_lines(self, target, t_code, y_code, indent, scale=None):
+        """Các dòng tính target = [scale *] real(f(t_code, y_code))."""
+        components = list(self.processor.f_expr) if self.processor.is_system else [self.processor.f_expr]
+        replacements, reduced = sp.cse(components, symbols=sp.numbered_symbols("_s"))
+        lines = self._bind(t_code, y_code, indent)
+        lines += [f"{indent}{self.printer.doprint(sym)} = {self.printer.doprint(expr)}" for sym, expr in replacements]
+        value = f"({self._value(reduced)}).real"
+        lines.append(f"{indent}{target} = {scale} * {value}" if scale else f"{indent}{target} = {value}")
+        return lines
+    def taylor_lines(self, indent):
+        """Bước Taylor: kernel đạo hàm (các biến trung gian dùng chung) + tổng chuỗi."""
+        program = self.processor.deriv_program
+        lines = self._bind("_ti", "_yi", indent)
+        lines += [f"{indent}{self.printer.doprint(sym)} = {self.printer.doprint(expr)}"
+                  for sym, expr in program.assignments]
+        codes = ", ".join(self.printer.doprint(expr) for level in program.outputs for expr in level)
+        if self.processor.is_system:
+            shape = (program.order, self.processor.n_components)
+            lines.append(f"{indent}_d = _stack([{codes}], _shape(_yi)[1:]).reshape({shape} + _shape(_yi)[1:]).real")
+        else:
+            lines.append(f"{indent}_d = _stack([{codes}], _shape(_yi)).real")
+        lines.append(f"{indent}_yn = _yi + _dot(_c, _d.reshape({program.order}, -1)).reshape(_d.shape[1:])")
+        return lines
+    def rkf45_lines(self, indent):
+        lines = []
+        lines += self.f_lines("_k1", "_ti", "_yi", indent, "_h")
+        lines += self.f_lines("_k2", "_ti + _h4", "_yi + _k1/4", indent, "_h")
+        lines += self.f_lines("_k3", "_ti + _h38", "_yi + 3*_k1/32 + 9*_k2/32", indent, "_h")
+        lines += self.f_lines("_k4", "_ti + _h1213", "_yi + 1932*_k1/2197 - 7200*_k2/2197 + 7296*_k3/2197", indent, "_h")
+        lines += self.f_lines("_k5", "_ti + _h", "_yi + 439*_k1/216 - 8*_k2 + 3680*_k3/513 - 845*_k4/4104", indent, "_h")
+        lines += self.f_lines("_k6", "_ti + _h2",
+                              "_yi - 8*_k1/27 + 2*_k2 - 3544*_k3/2565 + 1859*_k4/4104 - 11*_k5/40", indent, "_h")
+        lines.append(f"{indent}_yn = _yi + (16/135)*_k1 + (6656/12825)*_k3 + (28561/56430)*_k4 - (9/50)*_k5 + (2/55)*_k6")
+        return lines
+    def abm4_lines(self, indent):
+        lines = [f"{indent}_p = _yi + (_h/24) * (55 * _f0 - 59 * _f1 + 37 * _f2 - 9 * _f3)"]
+        lines += self.f_lines("_fp", "_tn", "_p", indent)
+        lines.append(f"{indent}_yn = _yi + (_h/24) * (9 * _fp + 19 * _f0 - 5 * _f1 + 1 * _f2)")
+        lines += self.f_lines("_fn", "_tn", "_yn", indent)
+        lines.append(f"{indent}_f0, _f1, _f2, _f3 = _fn, _f0, _f1, _f2")
+        return lines
+    def source(self, method):
+        params = "".join(f", {name}" for name in self.processor.params)
+        if method == "rkf45":
+            consts = ["    _h4 = _h/4", "    _h38 = 3*_h/8", "    _h1213 = 12*_h/13", "    _h2 = _h/2"]
+            step = ([f"def _step(_ti, _yi, _h{params}):"] + consts + self.rkf45_lines("    ")
+                    + ["    return _yn"])
+            loop = ([f"def _loop(_i0, _y, _h, _t0, _out{params}):"] + consts
+                    + ["    for _j in range(len(_out)):", "        _ti = (_i0 + _j) * _h + _t0", "        _yi = _y"]
+                    + self.rkf45_lines("        ") + ["        _y = _yn", "        _out[_j] = _y", "    return _y"])
+        elif method == "taylor":
+            step = ([f"def _step(_ti, _yi, _h, _c{params}):"] + self.taylor_lines("    ")
+                    + ["    return _yn"])
+            loop = ([f"def _loop(_i0, _y, _h, _t0, _out, _c{params}):",
+                     "    for _j in range(len(_out)):", "        _ti = (_i0 + _j) * _h + _t0", "        _yi = _y"]
+                    + self.taylor_lines("        ") + ["        _y = _yn", "        _out[_j] = _y", "    return _y"])
+        elif method == "abm4":
+            step = ([f"def _step(_ti, _yi, _h, _tn, _hist{params}):", "    _f0, _f1, _f2, _f3 = _hist"]
+                    + self.abm4_lines("    ") + ["    return _yn, (_f0, _f1, _f2, _f3)"])
+            loop = ([f"def _loop(_i0, _y, _h, _t0, _out, _hist, _N, _tend{params}):", "    _f0, _f1, _f2, _f3 = _hist",
+                     "    for _j in range(len(_out)):", "        _i = _i0 + _j", "        _yi = _y",
+                     "        _tn = _tend if _i == _N - 1 else (_i + 1) * _h + _t0"]
+                    + self.abm4_lines("        ") + ["        _y = _yn", "        _out[_j] = _y",
+                                                     "    return _y, (_f0, _f1, _f2, _f3)"])
+        else:
+            raise ValueError(f"Không sinh được kernel cho {method!r}. Chọn một trong {FUSED_METHODS}.")
+        return "\n".join(step + loop) + "\n"
+    def build(self, method):
+        source = self.source(method)
+        namespace = dict(sp.lambdify([], 0, modules="numpy").__globals__)
+        for module, names in self.printer.module_imports.items():
+            exec(f"from {module} import {', '.join(sorted(names))}", namespace)
+        namespace.update({"_stack": stack_components, "_shape": np.shape, "_dot": np.dot})
+        processor = self.processor
+        missing = [name for name in processor.params if name not in processor.param_values]
+        if missing:
+            raise ValueError(f"Thiếu giá trị cho tham số: {', '.join(missing)}")
+        values = [np.asarray(processor.param_values[name], dtype=float) for name in processor.params]
+        return StepKernel(method, source, namespace, values)
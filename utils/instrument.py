@@ -0,0 +1,117 @@
+import cProfile
+import io
+import pstats
+import time
+from contextlib import contextmanager, nullcontext
+import pandas as pd
+SOLVER_STATS = ("n_accepted", "n_rejected", "nfev", "njev", "n_factor", "adaptive_order")
+class CallCounter:
+    """Bọc một hàm số học (f, kernel đạo hàm Taylor, Jacobian) để đếm số lần gọi."""
+    def __init__(self, func):
+        self.func = func
+        self.count = 0
+    def __call__(self, *args):
+        self.count += 1
+        return self.func(*args)
+class Instrumentation:
+    """
+    Đo đạc một lần chạy: thời gian từng giai đoạn (parse, lambdify,
+    taylor_derivatives, jacobian, codegen, solve, trace_format, dataframe, plot),
+    số lần gọi các hàm số học, thống kê bước của bộ giải, và các hook bao
+    quanh giai đoạn (mặc định chỉ vòng lặp "solve"), ví dụ CProfileHook.
+    Một hook là hàm hook(phase) trả về context manager.
+    """
+    enabled = True
+    def __init__(self, hooks=None):
+        self.timings = {}
+        self.calls = {}
+        self.counters = {}
+        self.stats = {}
+        self.hooks = []
+        for hook in hooks or []:
+            self.add_hook(hook)
+    def add_hook(self, hook, phases=("solve",)):
+        self.hooks.append((hook, tuple(phases)))
+        return hook
+    @contextmanager
+    def phase(self, name):
+        hooks = [hook(name) for hook, phases in self.hooks if name in phases]
+        for ctx in hooks:
+            ctx.__enter__()
+        start = time.perf_counter()
+        try:
+            yield self
+        finally:
+            elapsed = time.perf_counter() - start
+            for ctx in reversed(hooks):
+                ctx.__exit__(None, None, None)
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+            self.calls[name] = self.calls.get(name, 0) + 1
+    def count(self, name, func):
+        """Trả về func được bọc bởi bộ đếm name (None giữ nguyên)."""
+        if func is None:
+            return None
+        counter = self.counters.get(name)
+        if counter is None or counter.func is not func:
+            counter = CallCounter(func)
+            if name in self.counters:
+                counter.count = self.counters[name].count
+            self.counters[name] = counter
+        return counter
+    def record_solver(self, solver):
+        """Lưu các thống kê bước có trên bộ giải (chấp nhận/loại, nfev, bậc...)."""
+        for name in SOLVER_STATS:
+            value = getattr(solver, name, None)
+            if value is not None:
+                self.stats[name] = value
+        orders = getattr(solver, "orders", None)
+        if orders:
+            self.stats["orders"] = f"{min(orders)}-{max(orders)}"
+    def evaluations(self):
+        """Số lần gọi mỗi hàm được đếm (bỏ các hàm không được gọi, ví dụ f khi dùng kernel hợp nhất)."""
+        return {name: counter.count for name, counter in self.counters.items() if counter.count}
+    def summary(self):
+        return {"timings": dict(self.timings), "calls": dict(self.calls), "evaluations": self.evaluations(),
+                "stats": dict(self.stats)}
+    def dataframe(self):
+        """Bảng thời gian các giai đoạn (giây, số lần, tỉ lệ)."""
+        total = sum(self.timings.values()) or 1.0
+        return pd.DataFrame([{"phase": name, "seconds": seconds, "calls": self.calls[name], "share": seconds / total}
+                             for name, seconds in self.timings.items()],
+                            columns=["phase", "seconds", "calls", "share"])
+class NullInstrumentation:
+    """Bản tắt: không đo gì, chi phí gần bằng không."""
+    enabled = False
+    def phase(self, name):
+        return nullcontext(self)
+    def count(self, name, func):
+        return func
+    def record_solver(self, solver):
+        pass
+NULL_INSTRUMENT = NullInstrumentation()
+class CProfileHook:
+    """Hook chạy cProfile quanh các giai đoạn được đăng ký; report() in các hàm tốn thời gian nhất."""
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+    def __call__(self, phase):
+        return self
+    def __enter__(self):
+        self.profiler.enable()
+        return self
+    def __exit__(self, *exc):
+        self.profiler.disable()
+        return False
+    def report(self, limit=20, sort="cumulative"):
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats(sort).print_stats(limit)
+        return out.getvalue()
+def sink_hook(sink):
+    """Hook gọi sink(phase, seconds) sau mỗi giai đoạn (ghi log, gửi số liệu...)."""
+    @contextmanager
+    def hook(phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            sink(phase, time.perf_counter() - start)
+    return hook
@@ -0,0 +1,141 @@
+import os
+import time
+from math import ceil
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from .runner import (METHODS, RunResult, build_processor, ensemble_initial_state, run_solver, solution_label,
+                     IMPLICIT_SOLVERS)
+from .instrument import NULL_INSTRUMENT
+_FINE = {}
+class PararealResult(RunResult):
+    """
+    Kết quả Parareal: quỹ đạo tinh trên lưới N + 1 điểm như solve_ode, cùng
+    số vòng lặp, lịch sử độ thay đổi tại các mốc lát cắt, thời gian CPU từng
+    lát tinh, ước lượng thời gian giải tuần tự (tổng thời gian các lát tinh ở
+    vòng đầu, không bị phóng đại khi số tiến trình vượt số lõi) và tăng tốc
+    = ước lượng tuần tự / thời gian thực.
+    """
+    def __init__(self, t_values, y_values, label, method, processor, elapsed, iterations, converged, history,
+                 n_slices, workers, slice_times, instrument=None):
+        super().__init__(t_values, y_values, label, method, processor, None, elapsed, instrument=instrument)
+        self.iterations = iterations
+        self.converged = converged
+        self.history = history
+        self.n_slices = n_slices
+        self.workers = workers
+        self.slice_times = slice_times
+        self.serial_estimate = float(np.sum(slice_times))
+        self.speedup = self.serial_estimate / elapsed if elapsed > 0 else np.nan
+def _propagator(spec, instrument=None):
+    """Bộ xử lý cho một bộ lan truyền (thô hoặc tinh) mô tả bởi spec."""
+    method = spec["method"]
+    return build_processor(spec["func_str"], spec["indep_var"], spec["dep_var"],
+                           spec["order"] if method == "taylor" else None, spec["params"], spec["taylor_backend"],
+                           jacobian=method in IMPLICIT_SOLVERS, instrument=instrument)
+def _propagate(spec, processor, t_start, y_start, t_stop, n_steps, instrument=None):
+    y_start = y_start if np.ndim(y_start) else float(y_start)
+    _, t_values, y_values = run_solver(spec["method"], processor, t_start, y_start, t_stop, n_steps, spec["order"],
+                                       spec["adaptive"], spec["rtol"], spec["atol"], None, spec["taylor_backend"],
+                                       instrument, spec["fused"])
+    return t_values, y_values
+def _init_fine(spec):
+    """Khởi tạo tiến trình con: dựng bộ lan truyền tinh một lần cho mọi lát."""
+    _FINE["spec"] = spec
+    _FINE["processor"] = _propagator(spec)
+def _fine_slice(task):
+    t_start, y_start, t_stop, n_steps = task
+    start = time.process_time()
+    t_values, y_values = _propagate(_FINE["spec"], _FINE["processor"], t_start, y_start, t_stop, n_steps)
+    return t_values, y_values, time.process_time() - start
+def _spec(func_str, indep_var, dep_var, params, method, order, taylor_backend, adaptive=False, rtol=1e-6, atol=1e-9,
+          fused=None):
+    if method not in METHODS:
+        raise ValueError(f"Phương pháp không hợp lệ: {method!r}. Chọn một trong {METHODS}.")
+    return {"func_str": func_str, "indep_var": indep_var, "dep_var": dep_var, "params": params or {},
+            "method": method, "order": order, "taylor_backend": taylor_backend, "adaptive": adaptive,
+            "rtol": rtol, "atol": atol, "fused": fused}
+def parareal(func_str, t0, y0, tend, N, n_slices, method="rkf45", order=4, indep_var="t", dep_var="y",
+             params=None, taylor_backend="symbolic", fused=None, coarse_method="rkf45", coarse_order=2,
+             coarse_steps=None, tol=1e-8, max_iter=None, workers=None, instrument=None):
+    """
+    Giải y' = f(t, y) trên [t0, tend] bằng Parareal: chia thành n_slices lát
+    thời gian (mốc trên lưới tinh N bước). Bộ lan truyền thô G (coarse_method,
+    coarse_steps bước mỗi lát, mặc định khoảng 1% số bước tinh và ít nhất 2;
+    Taylor dùng bậc coarse_order) chạy tuần tự; bộ
+    lan truyền tinh F (method/order như solve_ode, tổng N bước) chạy đồng
+    thời trên mọi lát trong một process pool. Mỗi vòng:
+        U[n+1] = G(U[n]) + F(U_cũ[n]) - G(U_cũ[n]),
+    dừng khi max |U_mới - U_cũ| tại các mốc <= tol * max(1, max |U|), hoặc
+    sau max_iter vòng (mặc định n_slices: khi đó kết quả trùng lời giải tinh
+    tuần tự). Sau vòng k, k lát đầu đã chính xác nên chỉ các lát sau được
+    giải lại. workers=1 chạy tuần tự trong tiến trình hiện tại. Trả về
+    PararealResult.
+    """
+    instrument = instrument or NULL_INSTRUMENT
+    if n_slices < 1 or N < n_slices:
+        raise ValueError(f"Cần 1 <= số lát <= N, nhận được {n_slices} lát với N = {N}.")
+    fine = _spec(func_str, indep_var, dep_var, params, method, order, taylor_backend, fused=fused)
+    coarse = _spec(func_str, indep_var, dep_var, params, coarse_method, coarse_order, "symbolic", fused=fused)
+    marks = np.linspace(0, N, n_slices + 1).round().astype(int)
+    n_fine = np.diff(marks)
+    if method == "abm4" and n_fine.min() < 4:
+        raise ValueError("ABM4 cần ít nhất 4 bước tinh mỗi lát.")
+    if coarse_steps is None:
+        coarse_steps = max(2, ceil(N / n_slices / 100))
+    if coarse_steps < 1:
+        raise ValueError("Bộ lan truyền thô cần ít nhất 1 bước mỗi lát.")
+    if coarse_method == "abm4" and coarse_steps < 4:
+        raise ValueError("ABM4 cần ít nhất 4 bước mỗi lát.")
+    h = (tend - t0) / N
+    t_marks = marks * h + t0
+    t_marks[-1] = tend
+    max_iter = n_slices if max_iter is None else max(1, min(max_iter, n_slices))
+    workers = min(workers or os.cpu_count() or 1, n_slices)
+    start = time.perf_counter()
+    processor = _propagator(coarse, instrument)
+    y0 = ensemble_initial_state(y0, params, processor.n_components if processor.is_system else None)
+    def G(n, y):
+        with instrument.phase("coarse"):
+            return _propagate(coarse, processor, t_marks[n], y, t_marks[n + 1], coarse_steps)[1][-1]
+    U = [y0]
+    for n in range(n_slices):
+        U.append(G(n, U[n]))
+    G_old = U[1:]
+    segments = [None] * n_slices
+    slice_times = np.zeros(n_slices)
+    history = []
+    converged = False
+    pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_fine, initargs=(fine,)) if workers != 1 else None
+    if pool is None:
+        _init_fine(fine)
+    try:
+        for k in range(1, max_iter + 1):
+            first = k - 1
+            tasks = [(t_marks[n], U[n], t_marks[n + 1], int(n_fine[n])) for n in range(first, n_slices)]
+            with instrument.phase("fine"):
+                results = list(pool.map(_fine_slice, tasks)) if pool is not None else [_fine_slice(t) for t in tasks]
+            for n, (t_values, y_values, seconds) in enumerate(results, start=first):
+                segments[n] = (t_values, y_values)
+                if k == 1:
+                    slice_times[n] = seconds
+            U_new = U[:first + 1]
+            for n in range(first, n_slices):
+                G_new = G(n, U_new[n])
+                U_new.append(segments[n][1][-1] + (G_new - G_old[n]))
+                G_old[n] = G_new
+            delta = max(float(np.max(np.abs(a - b))) for a, b in zip(U_new[1:], U[1:]))
+            scale = max(1.0, max(float(np.max(np.abs(u))) for u in U_new))
+            history.append(delta)
+            U = U_new
+            if delta <= tol * scale:
+                converged = True
+                break
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    converged = converged or k == n_slices
+    t_values = np.concatenate([segments[0][0]] + [seg[0][1:] for seg in segments[1:]])
+    y_values = np.concatenate([segments[0][1]] + [seg[1][1:] for seg in segments[1:]])
+    elapsed = time.perf_counter() - start
+    return PararealResult(t_values, y_values, solution_label(method, order), method, processor, elapsed, k, converged,
+                          history, n_slices, workers, slice_times, instrument=instrument)
@@ -1,42 +1,143 @@
 import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
-import streamlit as st
-def create_plot(df_results, title):
+import warnings
+import os
+from .runner import exact_values
+MAX_PLOT_POINTS = 2000
+DOWNSAMPLE_METHODS = ("lttb", "minmax")
+def lttb_indices(x, y, n_out):
     """
-    Tạo một đồ thị Matplotlib so sánh tất cả các giải pháp.
+    Largest-Triangle-Three-Buckets: chọn n_out điểm giữ hình dạng đường
+    cong (luôn giữ điểm đầu và cuối). Mỗi nhóm chọn điểm tạo tam giác lớn
+    nhất với điểm đã chọn trước đó và trung bình của nhóm kế tiếp.
+    """
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    edges = np.append(edges, n)
+    idx = np.empty(n_out, dtype=int)
+    idx[0], idx[-1] = 0, n - 1
+    a = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        nxt = slice(edges[b + 1], edges[b + 2])
+        avg_x, avg_y = x[nxt].mean(), y[nxt].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(np.nan_to_num(area, nan=-np.inf)))
+        idx[b + 1] = a
+    return idx
+def minmax_indices(y, n_out):
+    """
+    Gom theo nhóm chỉ số và giữ điểm nhỏ nhất, lớn nhất của mỗi nhóm (cộng
+    điểm đầu, cuối): giữ nguyên biên độ dao động, tính hoàn toàn bằng vector.
+    """
+    n = len(y)
+    n_bins = (n_out - 2) // 2
+    if n_out >= n or n_bins < 1:
+        return np.arange(n)
+    width = -(-n // n_bins)
+    blocks = np.pad(np.nan_to_num(y, nan=0.0), (0, n_bins * width - n), mode="edge").reshape(n_bins, width)
+    offsets = np.arange(n_bins) * width
+    idx = np.concatenate([[0, n - 1], offsets + np.argmin(blocks, axis=1), offsets + np.argmax(blocks, axis=1)])
+    return np.unique(np.minimum(idx, n - 1))
+def downsample_indices(x, y, max_points=MAX_PLOT_POINTS, method="lttb"):
+    """Chỉ số các điểm cần vẽ cho một chuỗi (tất cả nếu không vượt max_points)."""
+    if method not in DOWNSAMPLE_METHODS:
+        raise ValueError(f"Phương pháp rút gọn không hợp lệ: {method!r}. Chọn một trong {DOWNSAMPLE_METHODS}.")
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if method == "minmax":
+        return minmax_indices(y, max_points)
+    return lttb_indices(x, y, max_points)
+def create_plot(df_results, title, max_points=MAX_PLOT_POINTS, method="lttb"):
+    """
+    Tạo một đồ thị Matplotlib so sánh tất cả các giải pháp. Khi có hơn
+    max_points điểm, mỗi chuỗi được rút gọn riêng (LTTB hoặc min/max) trước
+    khi vẽ và bỏ marker.
     """
     fig, ax = plt.subplots(figsize=(10, 6))
-    if 'y_Exact' in df_results.columns:
-        ax.plot(df_results['t'], df_results['y_Exact'], 'k-', label='y_Exact (Giải tích)', linewidth=2, zorder=10)
+    t = df_results['t'].to_numpy()
+    reduced = len(t) > max_points
+    def points(col):
+        y = df_results[col].to_numpy()
+        if not reduced:
+            return t, y
+        idx = downsample_indices(t, y, max_points, method)
+        return t[idx], y[idx]
+    for col in df_results.columns:
+        if col.startswith('y_Exact'):
+            ax.plot(*points(col), 'k-', label=f'{col} (Giải tích)', linewidth=2, zorder=10)
     for col in df_results.columns:
-        if col.startswith('y_') and col != 'y_Exact':
-            ax.plot(df_results['t'], df_results[col], 'o-', label=col, markersize=4, alpha=0.8)
-        elif col.startswith('Error_'):
-            pass 
+        if col.startswith('y_') and not col.startswith('y_Exact'):
+            ax.plot(*points(col), '-' if reduced else 'o-', label=col, markersize=4, alpha=0.8)
     ax.set_title(title, fontsize=16)
     ax.set_xlabel('Biến độc lập (t)', fontsize=12)
     ax.set_ylabel('Biến phụ thuộc (y)', fontsize=12)
     ax.legend()
     ax.grid(True, linestyle=':')
     return fig
-def create_results_dataframe(t_values, solutions, exact_func=None):
+def solution_columns(name, data, components=None):
+    """
+    Tách nghiệm dạng (N + 1, m) thành m cột '{name}[thành phần]'.
+    """
+    data = np.asarray(data)
+    if data.ndim == 1:
+        return {name: data}
+    names = components or [str(j) for j in range(data.shape[1])]
+    return {f'{name}[{comp}]': data[:, j] for j, comp in enumerate(names)}
+def create_results_dataframe(t_values, solutions, exact_func=None, components=None):
     """
     Tạo một DataFrame để tóm tắt và phân tích lỗi.
     solutions là một dict: {'y_Taylor': y_taylor_data,...}
+    Với hệ phương trình, mỗi nghiệm (N + 1, m) được tách thành m cột,
+    đặt tên theo components (ví dụ ['x', 'v']).
     """
-    df = pd.DataFrame({'t': t_values})
+    columns = {'t': t_values}
     for name, data in solutions.items():
         if len(data) == len(t_values):
-            df[name] = data
+            columns.update(solution_columns(name, data, components))
     if exact_func:
         try:
-            y_exact = exact_func(t_values)
-            df['y_Exact'] = y_exact
+            y_exact = exact_values(exact_func, t_values)
+            columns.update(solution_columns('y_Exact', y_exact, components))
             for name, data in solutions.items():
                 if len(data) == len(t_values):
                     if name.startswith('y_') and name != 'y_Exact':
-                        df[f'Error_{name}'] = np.abs(data - y_exact)
+                        columns.update(solution_columns(f'Error_{name}', np.abs(data - y_exact), components))
         except Exception as e:
-            st.warning(f"Không thể tính toán giải pháp giải tích: {e}")  
-    return df
\ No newline at end of file
+            warnings.warn(f"Không thể tính toán giải pháp giải tích: {e}")
+    return pd.DataFrame(columns)
+def error_summary(df_results):
+    """
+    Thống kê sai số của mọi cột Error_ trong một lần tính vector trên toàn bộ
+    dữ liệu: sai số lớn nhất (và t tương ứng), RMS và sai số tại tend.
+    """
+    cols = [col for col in df_results.columns if col.startswith('Error_')]
+    if not cols:
+        return pd.DataFrame()
+    errors = df_results[cols].to_numpy(dtype=float)
+    t = df_results['t'].to_numpy()
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", RuntimeWarning)
+        max_idx = np.argmax(np.nan_to_num(errors, nan=-np.inf), axis=0)
+        summary = pd.DataFrame({
+            'Sai số lớn nhất': errors[max_idx, np.arange(len(cols))],
+            't tại sai số lớn nhất': t[max_idx],
+            'RMS': np.sqrt(np.nanmean(errors ** 2, axis=0)),
+            'Sai số tại tend': errors[-1],
+        }, index=[col[len('Error_'):] for col in cols])
+    return summary
+def export_results(df_results, path):
+    """Ghi toàn bộ bảng kết quả (đủ độ phân giải) ra .csv, .parquet hoặc .npz."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        df_results.to_csv(path, index=False)
+    elif ext == ".parquet":
+        df_results.to_parquet(path, index=False)
+    elif ext == ".npz":
+        np.savez_compressed(path, **{col: df_results[col].to_numpy() for col in df_results.columns})
+    else:
+        raise ValueError(f"Định dạng đầu ra không hỗ trợ: {ext!r} (dùng .csv, .parquet hoặc .npz).")
+    return path
@@ -0,0 +1,347 @@
+import time
+import numpy as np
+from .symbolic import SymbolicProcessor, split_list
+from .cache import make_key
+from .instrument import NULL_INSTRUMENT
+from .codegen import FUSED_MODES
+from solvers.taylor import TaylorSolver
+from solvers.rk import RKF45Solver
+from solvers.multistep import ABM4Solver, AdamsSolver
+from solvers.implicit import BDFSolver, RosenbrockSolver
+from solvers.stream import BLOCK_SIZE
+METHODS = ("taylor", "rkf45", "abm4", "adams", "bdf", "rosenbrock")
+IMPLICIT_SOLVERS = {"bdf": BDFSolver, "rosenbrock": RosenbrockSolver}
+TAYLOR_BACKENDS = ("symbolic", "ad")
+STREAM_METHODS = ("taylor", "rkf45", "abm4")
+RESUME_METHODS = ("taylor", "rkf45")
+class RunResult:
+    """
+    Kết quả của một lần giải: lưới t, nghiệm y, nhãn cột, cùng với bộ xử lý
+    tượng trưng và bộ giải đã dùng (để lấy thống kê, đạo hàm, ...).
+    cached là None, "hit" (lấy nguyên từ bộ nhớ đệm) hoặc "resumed" (giải
+    tiếp từ trạng thái cuối đã lưu); khi lấy từ đĩa, solver là None.
+    """
+    def __init__(self, t_values, y_values, label, method, processor, solver, elapsed, trace=None, cached=None,
+                 instrument=None):
+        self.t_values = t_values
+        self.y_values = y_values
+        self.label = label
+        self.method = method
+        self.processor = processor
+        self.solver = solver
+        self.elapsed = elapsed
+        self.trace = trace
+        self.cached = cached
+        self.instrument = instrument
+def solution_label(method, order=4):
+    if method == "taylor":
+        return f"y_Taylor(Bậc {order})"
+    if method == "rkf45":
+        return "y_RKF45"
+    if method == "abm4":
+        return "y_ABM4"
+    if method == "adams":
+        return "y_Adams(VSVO)"
+    if method == "bdf":
+        return "y_BDF"
+    if method == "rosenbrock":
+        return "y_Rosenbrock"
+    raise ValueError(f"Phương pháp không hợp lệ: {method!r}. Chọn một trong {METHODS}.")
+def build_processor(func_str, indep_var="t", dep_var="y", order=None, params=None, taylor_backend="symbolic",
+                    jacobian=False, cache=None, instrument=None):
+    """
+    Phân tích chuỗi hàm, tạo hàm số học và (nếu có order) các đạo hàm
+    toàn phần cho phương pháp Taylor: kernel tượng trưng ("symbolic") hoặc
+    băng chuỗi lũy thừa ("ad"), và (nếu jacobian) Jacobian chính xác cho
+    các bộ giải ẩn. params gán giá trị (số hoặc mảng) cho các
+    tham số tự do trong f. Ném ValueError nếu có lỗi.
+    Với cache (SolveCache), biểu thức đã phân tích và cả bộ xử lý (kèm các
+    kernel đã lambdify) được dùng lại giữa các lần gọi. Với instrument
+    (utils.instrument.Instrumentation), thời gian các giai đoạn parse,
+    lambdify, taylor_derivatives, jacobian được ghi lại.
+    """
+    instrument = instrument or NULL_INSTRUMENT
+    if taylor_backend not in TAYLOR_BACKENDS:
+        raise ValueError(f"Chế độ Taylor không hợp lệ: {taylor_backend!r}. Chọn một trong {TAYLOR_BACKENDS}.")
+    if cache is not None:
+        processor_key = make_key("processor", func_str, indep_var, dep_var, order, taylor_backend, jacobian, params or {})
+        processor = cache.processors.get(processor_key)
+        if processor is not None:
+            return processor
+        expr_key = make_key("expression", func_str, indep_var, dep_var)
+    processor = SymbolicProcessor(indep_var, dep_var, func_str)
+    parsed = cache.expressions.get(expr_key) if cache is not None else None
+    if parsed is None:
+        with instrument.phase("parse"):
+            processor.standardize_expression()
+        if cache is not None and processor.f_expr is not None:
+            cache.expressions.put(expr_key, (processor.f_expr, processor.params))
+    else:
+        processor.f_expr, processor.params = parsed
+    processor.set_parameters(params)
+    with instrument.phase("lambdify"):
+        processor.get_numeric_function()
+    if processor.f_numeric is None:
+        raise ValueError(processor.error)
+    if order is not None and taylor_backend == "ad":
+        with instrument.phase("taylor_derivatives"):
+            processor.build_series_tape()
+        if processor.series_tape is None:
+            raise ValueError(processor.error)
+    elif order is not None:
+        with instrument.phase("taylor_derivatives"):
+            processor.generate_total_derivatives(order)
+        if processor.deriv_kernel is None:
+            raise ValueError(processor.error)
+    if jacobian:
+        with instrument.phase("jacobian"):
+            processor.get_jacobian_function()
+        if processor.jac_numeric is None:
+            raise ValueError(processor.error)
+    if cache is not None:
+        cache.processors.put(processor_key, processor, persist=False)
+    return processor
+def ensemble_initial_state(y0, params=None, n_components=None):
+    """
+    Mở rộng y0 theo hình dạng chung của y0 và các mảng tham số, để cả
+    ensemble được tiến một bước bằng một lời gọi NumPy cho mỗi stage.
+    Với hệ m phương trình, trục đầu của y0 là các thành phần: (m, *ensemble).
+    """
+    y0 = np.asarray(y0, dtype=float)
+    param_shapes = [np.shape(v) for v in (params or {}).values()]
+    if n_components is None:
+        return np.array(np.broadcast_to(y0, np.broadcast_shapes(y0.shape, *param_shapes)))
+    if y0.ndim == 0 or y0.shape[0] != n_components:
+        raise ValueError(f"Hệ có {n_components} phương trình nhưng y0 có hình dạng {y0.shape}.")
+    shape = (n_components,) + np.broadcast_shapes(y0.shape[1:], *param_shapes)
+    y0 = y0.reshape(y0.shape + (1,) * (len(shape) - y0.ndim))
+    return np.array(np.broadcast_to(y0, shape))
+def ensemble_grid(y0, params=None, n_components=None):
+    """
+    Lưới ngoài cho ensemble: mỗi tham số dạng mảng một chiều được đặt trên
+    một trục riêng (theo thứ tự trong params), các trục của y0 (với hệ: sau
+    trục thành phần) đứng cuối. Ví dụ k (2,) và y0 (10000,) cho ensemble
+    (2, 10000) gồm mọi cặp (k, y0), thay vì ghép từng phần tử như khi
+    truyền thẳng cho ensemble_initial_state. Trả về params đã đổi hình dạng.
+    """
+    y0_axes = np.ndim(y0) - (0 if n_components is None else 1)
+    swept = [name for name, value in (params or {}).items() if np.ndim(value) == 1]
+    grid = dict(params or {})
+    for i, name in enumerate(swept):
+        grid[name] = np.reshape(grid[name], (-1,) + (1,) * (len(swept) - 1 - i + y0_axes))
+    return grid
+def make_exact_function(exact_str, indep_var="t"):
+    """
+    Tạo hàm nghiệm giải tích từ chuỗi dùng cú pháp 'np.' (ví dụ: np.exp(t)).
+    Với hệ phương trình, các thành phần cách nhau bởi dấu chấm phẩy và hàm
+    trả về một tuple.
+    """
+    parts = split_list(exact_str, ";")
+    body = parts[0] if len(parts) == 1 else f"({', '.join(parts)},)"
+    try:
+        exact_func = eval(f"lambda {indep_var}: {body}", {"np": np})
+        exact_func(np.array([0.0, 1.0]))
+    except Exception as e:
+        raise ValueError(f"Lỗi khi phân tích giải pháp giải tích: {e}")
+    return exact_func
+def exact_values(exact_func, t_values):
+    """
+    Tính nghiệm giải tích trên lưới t; với hệ trả về mảng (len(t), m).
+    """
+    values = exact_func(t_values)
+    if isinstance(values, tuple):
+        return np.stack(np.broadcast_arrays(*values, t_values)[:-1], axis=-1)
+    return np.broadcast_to(values, np.shape(t_values))
+def fused_kernels(method, processor, fused=None, adaptive=False, taylor_backend="symbolic", instrument=None):
+    """
+    Kernel hợp nhất cho bộ giải bước cố định: {"fused_step": ...} hoặc
+    {"fused_loop": ...} theo fused ("step": một lời gọi mỗi bước, "loop":
+    một lời gọi mỗi khối), bọc bộ đếm "fused_kernel". Trả về {} khi fused
+    là None hoặc method không hỗ trợ (thích nghi, Taylor AD, phương pháp ẩn).
+    """
+    if fused is None:
+        return {}
+    if fused not in FUSED_MODES:
+        raise ValueError(f"Chế độ hợp nhất không hợp lệ: {fused!r}. Chọn một trong {FUSED_MODES}.")
+    if method not in STREAM_METHODS or adaptive or (method == "taylor" and taylor_backend != "symbolic"):
+        return {}
+    instrument = instrument or NULL_INSTRUMENT
+    with instrument.phase("codegen"):
+        kernel = processor.generate_step_kernel(method)
+    return {f"fused_{fused}": instrument.count("fused_kernel", kernel.loop if fused == "loop" else kernel.step)}
+def run_solver(method, processor, t0, y0, tend, N, order=4, adaptive=False, rtol=1e-6, atol=1e-9, trace=None,
+               taylor_backend="symbolic", instrument=None, fused=None):
+    """
+    Tạo bộ giải cho method và giải; trả về (solver, t_values, y_values).
+    Với instrument, các hàm số học được bọc bộ đếm (f, taylor_kernel,
+    jacobian, dfdt, fused_kernel) và vòng lặp được đo trong giai đoạn "solve".
+    fused ("step" hoặc "loop") dùng kernel hợp nhất (xem fused_kernels).
+    """
+    instrument = instrument or NULL_INSTRUMENT
+    kernels = fused_kernels(method, processor, fused, adaptive, taylor_backend, instrument)
+    f = instrument.count("f", processor.f_numeric) if method != "taylor" else None
+    if method == "taylor":
+        if taylor_backend == "ad":
+            solver = TaylorSolver(processor.series_tape, order)
+        else:
+            solver = TaylorSolver(processor.deriv_kernel, order, **kernels)
+        if adaptive:
+            run, kwargs = solver.solve_adaptive, {"rtol": rtol, "atol": atol}
+        else:
+            solver.kernel = instrument.count("taylor_kernel", solver.kernel)
+            run, kwargs = solver.solve, {}
+    elif method == "rkf45":
+        solver = RKF45Solver(f, **kernels)
+        run = solver.solve_adaptive if adaptive else solver.solve
+        kwargs = {"rtol": rtol, "atol": atol} if adaptive else {}
+    elif method in IMPLICIT_SOLVERS:
+        solver = IMPLICIT_SOLVERS[method](f, instrument.count("jacobian", processor.jac_numeric),
+                                          instrument.count("dfdt", processor.dfdt_numeric), processor.is_system)
+        run, kwargs = solver.solve, {"rtol": rtol, "atol": atol}
+    elif method == "adams":
+        solver = AdamsSolver(f)
+        run, kwargs = solver.solve, {"rtol": rtol, "atol": atol}
+    else:
+        solver = ABM4Solver(f, **kernels)
+        run, kwargs = solver.solve, {}
+    with instrument.phase("solve"):
+        t_values, y_values = run(t0, y0, tend, N, trace=trace, **kwargs)
+    if kwargs:
+        instrument.record_solver(solver)
+    return solver, t_values, y_values
+def solve_ode(func_str, t0, y0, tend, N, method="rkf45", order=4, indep_var="t", dep_var="y",
+              adaptive=False, rtol=1e-6, atol=1e-9, trace=None, processor=None, params=None,
+              taylor_backend="symbolic", cache=None, instrument=None, fused=None):
+    """
+    Giải bài toán y' = f(t, y), y(t0) = y0 trên [t0, tend] bằng một phương
+    pháp trong METHODS mà không phụ thuộc giao diện. Trả về RunResult.
+    Chế độ ensemble: y0 là mảng và/hoặc params chứa mảng giá trị tham số;
+    khi đó y_values có hình dạng (N + 1, *shape). Với hệ m phương trình
+    (dep_var 'x, v', func_str 'v; -x'), y0 có m thành phần và y_values có
+    hình dạng (N + 1, m).
+    Với Taylor, taylor_backend="ad" tính hệ số bằng số học chuỗi lũy thừa
+    (bậc 20-30 vẫn nhanh) và cho phép adaptive (bậc/bước Jorba-Zou).
+    "adams" (Adams PECE bậc/bước thay đổi) và các bộ giải ẩn cho bài toán
+    cứng "bdf", "rosenbrock" (dùng Jacobian tượng trưng) luôn dùng bước
+    thích nghi theo rtol/atol.
+    Với cache (SolveCache), kết quả được tra theo toàn bộ định nghĩa bài
+    toán; với taylor/rkf45 bước cố định, nếu chỉ tend tăng (cùng t0 và cùng
+    bước lưới), lời giải được tiếp tục từ trạng thái cuối của lần giải từ
+    đầu dài nhất đã lưu thay vì giải lại. Kết quả giải tiếp được lưu theo
+    cả mốc xuất phát, không lẫn với kết quả giải từ đầu. Lần chạy có ghi
+    vết chỉ được lưu trong bộ nhớ, kèm vết của nó (result.trace).
+    Với instrument (utils.instrument.Instrumentation), thời gian từng giai
+    đoạn, số lần gọi f và thống kê bước có trong result.instrument; khi
+    không truyền, không có chi phí đo đạc.
+    Với fused ("step" hoặc "loop"), taylor/rkf45/abm4 bước cố định dùng
+    một hàm bước sinh riêng cho f (mọi stage chép thẳng vào một hàm) thay
+    vì gọi f từng stage; kết quả không đổi.
+    """
+    label = solution_label(method, order)
+    if method == "abm4" and N < 4:
+        raise ValueError("ABM4 cần N >= 4.")
+    is_taylor = method == "taylor"
+    if processor is None:
+        processor = build_processor(func_str, indep_var, dep_var, order if is_taylor else None, params,
+                                    taylor_backend, jacobian=method in IMPLICIT_SOLVERS, cache=cache,
+                                    instrument=instrument)
+    y0 = ensemble_initial_state(y0, params, processor.n_components if processor.is_system else None)
+    if y0.ndim == 0:
+        y0 = float(y0)
+    tracing = trace is not None and trace.active
+    if cache is not None:
+        problem = make_key("problem", func_str, indep_var, dep_var, method, order if is_taylor else None,
+                           taylor_backend if is_taylor else None, float(t0), np.asarray(y0),
+                           bool(adaptive), float(rtol), float(atol), params or {})
+        trace_key = (trace.mode, trace.every, trace.head, trace.tail, trace.page_size) if tracing else None
+        result_key = make_key("result", problem, float(tend), N, trace_key)
+        final = cache.finals.get(problem) if not tracing and N else None
+        if final is not None and not _resumable(final, method, t0, tend, N, adaptive):
+            final = None
+        hit = cache.results.get(result_key)
+        if hit is None and final is not None:
+            result_key = make_key("resumed", problem, float(tend), N, final["tend"], final["N"])
+            hit = cache.results.get(result_key)
+        if isinstance(hit, RunResult):
+            hit.cached = "hit"
+            hit.instrument = instrument
+            return hit
+        if hit is not None:
+            return RunResult(hit["t"], hit["y"], label, method, processor, None, hit["elapsed"], cached="hit",
+                             instrument=instrument)
+    start = time.perf_counter()
+    resumed = None
+    if cache is not None and final is not None:
+        resumed = _resume(final, method, processor, t0, tend, N, order, adaptive, rtol, atol, taylor_backend,
+                          instrument, fused)
+    if resumed is not None:
+        solver, t_values, y_values = resumed
+    else:
+        solver, t_values, y_values = run_solver(method, processor, t0, y0, tend, N, order, adaptive, rtol, atol,
+                                                trace, taylor_backend, instrument, fused)
+    elapsed = time.perf_counter() - start
+    result = RunResult(t_values, y_values, label, method, processor, solver, elapsed,
+                       trace=trace, cached="resumed" if resumed is not None else None, instrument=instrument)
+    if cache is not None:
+        if tracing:
+            cache.results.put(result_key, result, persist=False)
+        else:
+            cache.results.put(result_key, {"t": t_values, "y": y_values, "elapsed": elapsed})
+            longest = cache.finals.get(problem) if N and resumed is None else None
+            if N and resumed is None and (longest is None or longest["tend"] < tend):
+                cache.finals.put(problem, {"tend": float(tend), "N": int(N), "t": t_values, "y": y_values})
+    return result
+def _resumable(final, method, t0, tend, N, adaptive):
+    """
+    Chỉ giải tiếp được với phương pháp một bước, bước cố định (RESUME_METHODS,
+    không thích nghi) khi lưới mới kéo dài đúng lưới cũ (cùng bước
+    (tend - t0) / N): trạng thái cuối y là toàn bộ trạng thái của bộ giải.
+    Phương pháp đa bước (lịch sử f) và thích nghi (bước h hiện tại) cần thêm
+    trạng thái nên giải tiếp sẽ lệch khỏi lời giải từ đầu.
+    """
+    if adaptive or method not in RESUME_METHODS:
+        return False
+    h_old = (final["tend"] - t0) / final["N"]
+    h_new = (tend - t0) / N
+    return N > final["N"] and abs(h_new - h_old) <= 1e-12 * max(1.0, abs(h_old))
+def _resume(final, method, processor, t0, tend, N, order, adaptive, rtol, atol, taylor_backend, instrument=None,
+            fused=None):
+    """
+    Giải tiếp từ trạng thái cuối của một lần giải đã lưu trên [t0, tend_cũ]
+    (đã kiểm tra bằng _resumable).
+    """
+    n_extra = N - final["N"]
+    y_last = final["y"][-1]
+    solver, t_ext, y_ext = run_solver(method, processor, final["t"][-1], y_last if np.ndim(y_last) else float(y_last),
+                                      tend, n_extra, order, adaptive, rtol, atol, None, taylor_backend, instrument,
+                                      fused)
+    return solver, np.concatenate([final["t"], t_ext[1:]]), np.concatenate([final["y"], y_ext[1:]])
+def stream_ode(func_str, t0, y0, tend, N, method="rkf45", order=4, indep_var="t", dep_var="y",
+               block_size=BLOCK_SIZE, trace=None, processor=None, params=None, taylor_backend="symbolic", fused=None):
+    """
+    Như solve_ode với bước cố định, nhưng trả về generator các khối
+    (t_block, y_block) tối đa block_size điểm thay vì cả quỹ đạo: dùng với
+    solvers.stream.Reduction (chỉ tính giá trị cuối, min/max, sai số) hoặc
+    solvers.stream.spill_blocks (ghi ra .npy ánh xạ bộ nhớ) để N rất lớn
+    chạy với bộ nhớ không đổi. Chỉ hỗ trợ STREAM_METHODS. fused như
+    trong solve_ode ("loop" tính cả khối trong một lời gọi).
+    """
+    if method not in STREAM_METHODS:
+        raise ValueError(f"Chế độ luồng chỉ hỗ trợ bước cố định: {STREAM_METHODS}.")
+    if method == "abm4" and N < 4:
+        raise ValueError("ABM4 cần N >= 4.")
+    if processor is None:
+        processor = build_processor(func_str, indep_var, dep_var, order if method == "taylor" else None, params,
+                                    taylor_backend)
+    y0 = ensemble_initial_state(y0, params, processor.n_components if processor.is_system else None)
+    if y0.ndim == 0:
+        y0 = float(y0)
+    kernels = fused_kernels(method, processor, fused, taylor_backend=taylor_backend)
+    if method == "taylor":
+        solver = TaylorSolver(processor.series_tape if taylor_backend == "ad" else processor.deriv_kernel, order,
+                              **kernels)
+    elif method == "rkf45":
+        solver = RKF45Solver(processor.f_numeric, **kernels)
+    else:
+        solver = ABM4Solver(processor.f_numeric, **kernels)
+    return solver.iter_blocks(t0, y0, tend, N, block_size=block_size, trace=trace)
@@ -1,30 +1,218 @@
-import streamlit as st
 import sympy as sp
 import numpy as np
 from sympy.parsing.sympy_parser import parse_expr
+from solvers.series import SeriesTape
+from .codegen import StepKernelBuilder
+def split_list(text, sep):
+    if isinstance(text, (list, tuple)):
+        return [str(item).strip() for item in text]
+    return [item.strip() for item in str(text).split(sep) if item.strip()]
+def vector_function(func, system=True):
+    """
+    Bọc hàm lambdify trả về danh sách m thành phần thành hàm trả về một
+    mảng NumPy (m, ...). Mọi thành phần (kể cả thành phần hằng) được
+    broadcast theo các trục ensemble của trạng thái Y: (m, ...) với hệ,
+    cả Y với phương trình vô hướng (system=False).
+    """
+    def F(t, Y):
+        shape = np.shape(Y)[1:] if system else np.shape(Y)
+        values = [np.broadcast_to(value, shape) for value in func(t, Y)]
+        try:
+            return np.array(values, dtype=float)
+        except TypeError:
+            return np.stack(values)
+    return F
+class TotalDerivativeProgram:
+    """
+    Chương trình (dãy phép gán) tính các đạo hàm toàn phần D^k f dọc
+    nghiệm, D = d/dt + f * d/dy, với k = 0..order-1.
+    f được hạ thành các nút ba địa chỉ: tổ hợp tuyến tính, tích hai nút,
+    hoặc một hàm sơ cấp g(a) có quy tắc đạo hàm bậc 1 theo các nút khác
+    (D sin(a) = cos(a) Da, D exp(a) = exp(a) Da, D a**p = p a**p / a Da, ...).
+    Đạo hàm bậc k của mỗi nút được lấy từ các bậc thấp hơn (công thức
+    Leibniz cho tích), nên mỗi phép gán chỉ có O(k) số hạng thay vì biểu
+    thức phình to theo cấp số nhân như khi lặp sp.diff. Ký hiệu của bậc j
+    của nút a cũng là một nút: đạo hàm bậc k của nó là bậc j + k của a.
+    """
+    def __init__(self, t, y_syms, components, order):
+        self.order = order
+        self.assignments = []
+        self._kind = {t: ("t",)}
+        self._kind.update((y_sym, ("y", i)) for i, y_sym in enumerate(y_syms))
+        self._levels = {sym: [sym] for sym in self._kind}
+        self._value = {}
+        self._node_of = {}
+        self._lowered = {}
+        self._first = {}
+        self.f_terms = [self._lower(expr) for expr in components]
+        self.outputs = [[self._level_term(term, k) for term in self.f_terms] for k in range(order)]
+    def _assign(self, value):
+        sym = sp.Dummy(f"w{len(self.assignments)}")
+        self.assignments.append((sym, value))
+        return sym
+    def _define(self, kind, value):
+        if value not in self._node_of:
+            sym = self._assign(value)
+            self._kind[sym] = kind
+            self._levels[sym] = [sym]
+            self._value[sym] = value
+            self._node_of[value] = sym
+        return self._node_of[value]
+    def _is_constant(self, expr):
+        return not any(sym in self._kind for sym in expr.free_symbols)
+    def _lower(self, expr):
+        """
+        Hạ expr (theo t, y và các nút) thành số hạng (hệ số, nút); nút là
+        None nếu expr là hằng (số hoặc tham số).
+        """
+        expr = sp.sympify(expr)
+        if expr in self._lowered:
+            return self._lowered[expr]
+        if expr in self._kind:
+            term = (sp.S.One, expr)
+        elif self._is_constant(expr):
+            term = (expr, None)
+        elif isinstance(expr, sp.Add):
+            terms = [self._lower(arg) for arg in expr.args]
+            const = sp.Add(*[coef for coef, sym in terms if sym is None])
+            terms = [term for term in terms if term[1] is not None]
+            if const == 0 and len(terms) == 1:
+                term = terms[0]
+            else:
+                term = (sp.S.One, self._define(("add", terms), const + sp.Add(*[c * s for c, s in terms])))
+        elif isinstance(expr, sp.Mul):
+            coef, node = sp.S.One, None
+            for arg in expr.args:
+                arg_coef, sym = self._lower(arg)
+                coef *= arg_coef
+                if sym is not None:
+                    node = sym if node is None else self._define(("mul", node, sym), node * sym)
+            term = (coef, node)
+        elif isinstance(expr, sp.Pow) and not self._is_constant(expr.exp):
+            term = self._lower(sp.exp(expr.exp * sp.log(expr.base)))
+        elif isinstance(expr, sp.Pow) and expr.exp.is_Integer and expr.exp > 0:
+            coef, sym = self._lower(expr.base)
+            node = sym
+            for _ in range(int(expr.exp) - 1):
+                node = self._define(("mul", node, sym), node * sym)
+            term = (coef ** expr.exp, node)
+        else:
+            args = [self._as_node(self._lower(arg)) for arg in expr.args]
+            term = (sp.S.One, self._define(("func",), expr.func(*args)))
+        self._lowered[expr] = term
+        return term
+    def _as_node(self, term):
+        coef, sym = term
+        if sym is None:
+            return coef
+        if coef == 1:
+            return sym
+        return self._define(("add", [term]), coef * sym)
+    def _first_derivative(self, sym):
+        """Số hạng D w của nút hàm w = g(a, ...), theo quy tắc của g."""
+        expr = self._value[sym]
+        da = [self._level_expr(arg, 1) for arg in expr.args]
+        if isinstance(expr, sp.exp):
+            rule = sym * da[0]
+        elif isinstance(expr, sp.sin):
+            rule = sp.cos(expr.args[0]) * da[0]
+        elif isinstance(expr, sp.cos):
+            rule = -sp.sin(expr.args[0]) * da[0]
+        elif isinstance(expr, sp.sinh):
+            rule = sp.cosh(expr.args[0]) * da[0]
+        elif isinstance(expr, sp.cosh):
+            rule = sp.sinh(expr.args[0]) * da[0]
+        elif isinstance(expr, sp.tan):
+            rule = (1 + sym**2) * da[0]
+        elif isinstance(expr, sp.tanh):
+            rule = (1 - sym**2) * da[0]
+        elif isinstance(expr, sp.log) and len(expr.args) == 1:
+            rule = expr.args[0] ** -1 * da[0]
+        elif isinstance(expr, sp.Pow) and expr.exp == -1:
+            rule = -sym**2 * da[0]
+        elif isinstance(expr, sp.Pow):
+            rule = expr.exp * sym * expr.base ** -1 * da[0]
+        else:
+            dummies = [sp.Dummy() for _ in expr.args]
+            generic = expr.func(*dummies)
+            rule = sp.Add(*[sp.diff(generic, dummy).xreplace(dict(zip(dummies, expr.args))) * d
+                            for dummy, d in zip(dummies, da)])
+        return self._lower(rule)
+    def _level_expr(self, expr, k):
+        """Đạo hàm toàn phần bậc k của một nút hoặc hằng."""
+        if expr not in self._kind:
+            return expr if k == 0 else sp.S.Zero
+        if self._kind[expr][0] == "level":
+            return self._level_expr(self._kind[expr][1], self._kind[expr][2] + k)
+        levels = self._levels[expr]
+        while len(levels) <= k:
+            levels.append(self._next_level(expr, len(levels)))
+        return levels[k]
+    def _level_term(self, term, k):
+        coef, sym = term
+        if sym is None:
+            return coef if k == 0 else sp.S.Zero
+        return coef * self._level_expr(sym, k)
+    def _next_level(self, sym, k):
+        kind = self._kind[sym]
+        if kind[0] == "t":
+            return sp.S.One if k == 1 else sp.S.Zero
+        if kind[0] == "y":
+            value = self._level_term(self.f_terms[kind[1]], k - 1)
+        elif kind[0] == "add":
+            value = sp.Add(*[self._level_term(term, k) for term in kind[1]])
+        elif kind[0] == "mul":
+            a, b = kind[1], kind[2]
+            value = sp.Add(*[sp.binomial(k, j) * self._level_expr(a, j) * self._level_expr(b, k - j)
+                             for j in range(k + 1)])
+        else:
+            if sym not in self._first:
+                self._first[sym] = self._first_derivative(sym)
+            value = self._level_term(self._first[sym], k - 1)
+        if value.is_Atom:
+            return value
+        level = self._assign(value)
+        self._kind[level] = ("level", sym, k)
+        return level
 class SymbolicProcessor:
     """
     Xử lý tất cả logic tượng trưng: phân tích chuỗi, tiêu chuẩn hóa
     biến, và tạo đạo hàm.
+    Hệ phương trình Y' = F(t, Y): các biến phụ thuộc cách nhau bởi dấu
+    phẩy (ví dụ 'x, v') và các thành phần của F cách nhau bởi dấu chấm
+    phẩy (ví dụ 'v; -x'). Khi đó self.y là bộ ký hiệu (y_0, ..., y_{m-1})
+    và self.f_expr là một sp.Matrix cột.
     """
     def __init__(self, indep_var_str, dep_var_str, func_str):
         self.indep_var_str = indep_var_str
         self.dep_var_str = dep_var_str
         self.func_str = func_str
+        self.dep_var_names = split_list(dep_var_str, ",")
+        self.n_components = len(self.dep_var_names)
+        self.is_system = self.n_components > 1
         self.t = sp.symbols('t')
-        self.y = sp.symbols('y') 
+        if self.is_system:
+            self.y = sp.symbols(f'y_0:{self.n_components}')
+        else:
+            self.y = sp.symbols('y')
+        self.y_syms = self.y if self.is_system else (self.y,)
         self.f_expr = None
         self.f_numeric = None
-        self.deriv_exprs = None
-        self.deriv_funcs = None
+        self.deriv_program = None
+        self.deriv_kernel = None
+        self.series_tape = None
+        self.jac_numeric = None
+        self.dfdt_numeric = None
+        self.params = []
+        self.param_values = {}
+        self.step_kernels = {}
+        self.error = None
     def standardize_expression(self):
         """
         Chuyển đổi chuỗi hàm của người dùng (ví dụ: 'x+y') thành một
         biểu thức SymPy tiêu chuẩn hóa sử dụng (t, y).
         """
         try:
-            user_t = sp.symbols(self.indep_var_str)
-            user_y = sp.symbols(self.dep_var_str)
             local_dict = {
                 "sin": sp.sin,
                 "cos": sp.cos,
@@ -35,15 +223,43 @@ class SymbolicProcessor:
                 "pi": sp.pi,
                 "np": sp  
             }
-            expr = parse_expr(self.func_str, local_dict=local_dict, global_dict=None)
-            self.f_expr = expr.subs([
-                (user_t, self.t),
-                (user_y, self.y)
-            ])
+            func_strs = split_list(self.func_str, ";")
+            if len(func_strs) != self.n_components:
+                raise ValueError(f"có {self.n_components} biến phụ thuộc nhưng {len(func_strs)} thành phần của f")
+            local_dict[self.indep_var_str] = self.t
+            local_dict.update(zip(self.dep_var_names, self.y_syms))
+            if self.is_system:
+                exprs = list(parse_expr(f"[{', '.join(func_strs)}]", local_dict=local_dict, global_dict=None))
+            else:
+                exprs = [parse_expr(func_strs[0], local_dict=local_dict, global_dict=None)]
+            self.f_expr = sp.Matrix(exprs) if self.is_system else exprs[0]
+            self.params = sorted(str(s) for s in self.f_expr.free_symbols - {self.t, *self.y_syms})
         except Exception as e:
-            st.error(f"Lỗi phân tích phương trình: {e}. "
-                     f"Hãy chắc chắn sử dụng cú pháp Python (ví dụ: 'y**2').")
+            self.error = (f"Lỗi phân tích phương trình: {e}. "
+                          f"Hãy chắc chắn sử dụng cú pháp Python (ví dụ: 'y**2').")
             self.f_expr = None
+    def set_parameters(self, values):
+        """
+        Gán giá trị cho các tham số tự do trong f (các ký hiệu khác t, y).
+        Giá trị có thể là số hoặc mảng NumPy để quét cả một ensemble.
+        """
+        self.param_values = dict(values or {})
+        self.step_kernels = {}
+    def _lambdify(self, expr, cse=False):
+        as_vector = self.is_system and isinstance(expr, sp.MatrixBase)
+        if as_vector:
+            expr = list(expr)
+        missing = [name for name in self.params if name not in self.param_values]
+        if missing:
+            raise ValueError(f"Thiếu giá trị cho tham số: {', '.join(missing)}")
+        symbols = [sp.Symbol(name) for name in self.params]
+        func = sp.lambdify((self.t, self.y, *symbols), expr, modules='numpy', cse=cse)
+        if self.params:
+            values = [np.asarray(self.param_values[name], dtype=float) for name in self.params]
+            bound = lambda t, y: func(t, y, *values)
+        else:
+            bound = func
+        return vector_function(bound) if as_vector else bound
     def get_numeric_function(self):
         """
         Chuyển đổi biểu thức SymPy tiêu chuẩn hóa thành một hàm Python
@@ -52,39 +268,202 @@ class SymbolicProcessor:
         if self.f_expr is None:
             return
         try:
-            self.f_numeric = sp.lambdify(
-                (self.t, self.y), 
-                self.f_expr, 
-                modules='numpy'
-            )
+            self.f_numeric = self._lambdify(self.f_expr)
         except Exception as e:
-            st.error(f"Lỗi khi tạo hàm số học: {e}")
+            self.error = f"Lỗi khi tạo hàm số học: {e}"
             self.f_numeric = None
+    def get_jacobian_function(self):
+        """
+        Tạo hàm số học cho Jacobian chính xác df/dy và df/dt (cho các bộ
+        giải ẩn). Với hệ m phương trình, jac_numeric trả về mảng (m, m, ...);
+        với phương trình vô hướng, df/dy có cùng hình dạng với y.
+        """
+        if self.f_expr is None:
+            return
+        try:
+            if self.is_system:
+                m = self.n_components
+                jac = self._lambdify(list(self.f_expr.jacobian(self.y)))
+                jac_vec = vector_function(jac)
+                def jac_matrix(t, y):
+                    J = jac_vec(t, y)
+                    return J.reshape((m, m) + J.shape[1:])
+                self.jac_numeric = jac_matrix
+                self.dfdt_numeric = self._lambdify(sp.diff(self.f_expr, self.t))
+            else:
+                self.jac_numeric = self._lambdify(sp.diff(self.f_expr, self.y))
+                self.dfdt_numeric = self._lambdify(sp.diff(self.f_expr, self.t))
+        except Exception as e:
+            self.error = f"Lỗi khi tạo Jacobian: {e}"
+            self.jac_numeric = None
     def generate_total_derivatives(self, order):
         """
-        Tạo ra các đạo hàm toàn phần bậc cao của f một cách tượng trưng.
-        f^(k) = d/dt [f^(k-1)] = (df^(k-1)/dt) + (df^(k-1)/dy) * f
+        Tạo một kernel duy nhất trả về f, f', ..., f^(order-1) (đạo hàm toàn
+        phần theo t dọc nghiệm) tại (t, y) trong một lần gọi.
+        Thay vì lặp sp.diff trên biểu thức ngày càng phình to, f được phân
+        rã thành các biến trung gian (xem TotalDerivativeProgram); đạo hàm
+        bậc k của mỗi biến là tổ hợp Leibniz của các biến bậc thấp hơn, nên
+        kích thước và thời gian sinh tăng đa thức theo bậc, và các biểu thức
+        con được dùng chung giữa mọi bậc.
         """
         if self.f_expr is None:
             return
-        self.deriv_exprs = [self.f_expr]
         try:
-            for i in range(1, order):
-                prev_deriv = self.deriv_exprs[-1]
-                df_dt = sp.diff(prev_deriv, self.t)
-                df_dy = sp.diff(prev_deriv, self.y)
-                total_deriv = df_dt + df_dy * self.f_expr
-                self.deriv_exprs.append(total_deriv)
-            self.deriv_funcs = [
-                sp.lambdify((self.t, self.y), expr, modules='numpy') 
-                for expr in self.deriv_exprs
-            ]
-            st.success(f"Đã tạo thành công {order} đạo hàm tượng trưng.")
-            with st.expander("Xem các đạo hàm tượng trưng đã được tạo"):
-                st.markdown("Hệ thống đã tự động tính toán các đạo hàm toàn phần sau (sử dụng quy tắc chuỗi):")
-                st.latex(f"f(t, y) = {sp.latex(self.f_expr)}")
-                for i, expr in enumerate(self.deriv_exprs[1:], start=1):
-                    st.latex(f"f^{{({i})}}(t, y) = \\frac{{d^{i}f}}{{dt^{i}}} = {sp.latex(expr)}")
+            components = list(self.f_expr) if self.is_system else [self.f_expr]
+            self.deriv_program = TotalDerivativeProgram(self.t, self.y_syms, components, order)
+            outputs = [expr for level in self.deriv_program.outputs for expr in level]
+            assignments = self.deriv_program.assignments
+            func = self._lambdify(outputs, cse=lambda exprs: (assignments, exprs))
+            kernel = vector_function(func, self.is_system)
+            if self.is_system:
+                m = self.n_components
+                self.deriv_kernel = lambda t, y: kernel(t, y).reshape((order, m) + np.shape(y)[1:])
+            else:
+                self.deriv_kernel = kernel
         except Exception as e:
-            st.error(f"Lỗi khi tạo đạo hàm Taylor: {e}")
-            self.deriv_funcs = None
\ No newline at end of file
+            self.error = f"Lỗi khi tạo đạo hàm Taylor: {e}"
+            self.deriv_kernel = None
+    def generate_step_kernel(self, method):
+        """
+        Sinh và biên dịch một hàm bước hợp nhất (utils.codegen.StepKernel)
+        cho method ("rkf45", "abm4", hoặc "taylor" sau
+        generate_total_derivatives): mọi stage được chép thẳng vào một hàm,
+        kèm một vòng lặp chạy nhiều bước mỗi lần gọi. Kernel được lưu lại
+        theo (method, bậc) cho tới khi tham số thay đổi.
+        """
+        if method == "taylor" and self.deriv_program is None:
+            raise ValueError("Cần tạo đạo hàm Taylor trước khi sinh kernel bước.")
+        key = (method, self.deriv_program.order if method == "taylor" else None)
+        kernel = self.step_kernels.get(key)
+        if kernel is None:
+            kernel = self.step_kernels[key] = StepKernelBuilder(self).build(method)
+        return kernel
+    def build_series_tape(self):
+        """
+        Dịch cây biểu thức f_expr thành một SeriesTape để tính hệ số Taylor
+        bằng số học chuỗi lũy thừa (chế độ AD), thay cho đạo hàm tượng trưng.
+        Hằng số và tham số được tính một lần; tan, sinh, cosh, tanh được
+        viết lại qua sin/cos/exp.
+        """
+        if self.f_expr is None:
+            return
+        try:
+            missing = [name for name in self.params if name not in self.param_values]
+            if missing:
+                raise ValueError(f"Thiếu giá trị cho tham số: {', '.join(missing)}")
+            param_syms = [sp.Symbol(name) for name in self.params]
+            param_vals = [np.asarray(self.param_values[name], dtype=float) for name in self.params]
+            variables = {self.t, *self.y_syms}
+            slots = {self.t: 0}
+            slots.update((sym, i + 1) for i, sym in enumerate(self.y_syms))
+            ops = []
+            n_slots = [len(slots)]
+            def emit(name, *args):
+                out = n_slots[0]
+                n_slots[0] += 1
+                ops.append((name, out) + args)
+                return out
+            def const(value):
+                return emit("const", np.asarray(sp.lambdify(param_syms, value, modules="numpy")(*param_vals), dtype=float))
+            def fold(name, items):
+                out = items[0]
+                for item in items[1:]:
+                    out = emit(name, out, item)
+                return out
+            def power(base, n):
+                out = None
+                while n:
+                    if n & 1:
+                        out = base if out is None else emit("mul", out, base)
+                    n >>= 1
+                    if n:
+                        base = emit("mul", base, base)
+                return out
+            def visit(expr):
+                if expr in slots:
+                    return slots[expr]
+                if not expr.free_symbols & variables:
+                    out = const(expr)
+                elif isinstance(expr, sp.Add):
+                    out = fold("add", [visit(arg) for arg in expr.args])
+                elif isinstance(expr, sp.Mul):
+                    consts = [arg for arg in expr.args if not arg.free_symbols & variables]
+                    nums, dens = [], []
+                    for arg in expr.args:
+                        if arg in consts:
+                            continue
+                        if isinstance(arg, sp.Pow) and arg.exp.is_Number and arg.exp < 0:
+                            dens.append(visit(arg.base ** -arg.exp))
+                        else:
+                            nums.append(visit(arg))
+                    out = fold("mul", nums) if nums else const(sp.S.One)
+                    if dens:
+                        out = emit("div", out, fold("mul", dens))
+                    if consts:
+                        out = emit("scale", out, const(sp.Mul(*consts)))
+                elif isinstance(expr, sp.Pow):
+                    base, exponent = expr.args
+                    if exponent.free_symbols & variables:
+                        out = visit(sp.exp(exponent * sp.log(base)))
+                    elif exponent.is_Integer and exponent > 0:
+                        out = power(visit(base), int(exponent))
+                    elif exponent.is_Integer:
+                        out = emit("div", const(sp.S.One), power(visit(base), int(-exponent)))
+                    else:
+                        out = emit("pow", visit(base), float(exponent))
+                elif isinstance(expr, sp.exp):
+                    out = emit("exp", visit(expr.args[0]))
+                elif isinstance(expr, sp.log) and len(expr.args) == 1:
+                    out = emit("log", visit(expr.args[0]))
+                elif isinstance(expr, (sp.sin, sp.cos)):
+                    arg = expr.args[0]
+                    a = visit(arg)
+                    out_s = emit("sincos", a, n_slots[0] + 1)
+                    out_c = n_slots[0]
+                    n_slots[0] += 1
+                    slots[sp.sin(arg)], slots[sp.cos(arg)] = out_s, out_c
+                    out = slots[expr]
+                elif isinstance(expr, sp.tan):
+                    out = visit(sp.sin(expr.args[0]) / sp.cos(expr.args[0]))
+                elif isinstance(expr, (sp.sinh, sp.cosh, sp.tanh)):
+                    out = visit(expr.rewrite(sp.exp))
+                else:
+                    raise ValueError(f"chế độ chuỗi lũy thừa chưa hỗ trợ hàm {expr.func.__name__}")
+                slots[expr] = out
+                return out
+            components = list(self.f_expr) if self.is_system else [self.f_expr]
+            outputs = [visit(expr) for expr in components]
+            self.series_tape = SeriesTape(self.n_components, ops, outputs, n_slots[0], self.is_system)
+        except Exception as e:
+            self.error = f"Lỗi khi tạo băng chuỗi lũy thừa: {e}"
+            self.series_tape = None
+    def naive_total_derivatives(self, order):
+        """
+        Đạo hàm toàn phần dạng biểu thức đầy đủ (lặp sp.diff), chỉ dùng để
+        hiển thị các bậc thấp vì kích thước tăng rất nhanh theo bậc.
+        f^(k) = d/dt [f^(k-1)] = (df^(k-1)/dt) + (df^(k-1)/dy) * f
+        """
+        deriv_exprs = [self.f_expr]
+        for i in range(1, order):
+            prev_deriv = deriv_exprs[-1]
+            df_dt = sp.diff(prev_deriv, self.t)
+            if self.is_system:
+                df_dy = prev_deriv.jacobian(self.y)
+            else:
+                df_dy = sp.diff(prev_deriv, self.y)
+            deriv_exprs.append(df_dt + df_dy * self.f_expr)
+        return deriv_exprs
+    def derivatives_latex(self, max_orders=4):
+        """
+        Trả về danh sách chuỗi LaTeX của f và các đạo hàm toàn phần
+        (tối đa max_orders bậc đầu).
+        """
+        if self.deriv_program is None:
+            return []
+        names = {sym: sp.Symbol(name) for sym, name in zip(self.y_syms, self.dep_var_names)}
+        names[self.t] = sp.Symbol(self.indep_var_str)
+        deriv_exprs = self.naive_total_derivatives(min(self.deriv_program.order, max_orders))
+        lines = [f"f(t, y) = {sp.latex(self.f_expr.subs(names, simultaneous=True))}"]
+        for i, expr in enumerate(deriv_exprs[1:], start=1):
+            lines.append(f"f^{{({i})}}(t, y) = \\frac{{d^{i}f}}{{dt^{i}}} = {sp.latex(expr.subs(names, simultaneous=True))}")
+        return lines
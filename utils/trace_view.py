@@ -0,0 +1,51 @@
+import streamlit as st
+from .instrument import NULL_INSTRUMENT
+def render_trace(trace, title, key, instrument=NULL_INSTRUMENT):
+    """
+    Hiển thị vết các bước (StepTrace) trong một expander với hai tab:
+    giải thích từng bước và bảng dữ liệu. Chuỗi giải thích chỉ được định
+    dạng cho các hàng đang hiển thị (một trang ở chế độ "paged"); thời gian
+    định dạng được ghi vào giai đoạn "trace_format" của instrument.
+    """
+    if trace is None or not trace.active:
+        return
+    with st.expander(title):
+        for note in trace.notes:
+            st.markdown(note)
+        if len(trace) == 0:
+            st.info("Không có dữ liệu bước để hiển thị.")
+            return
+        if trace.mode == "headtail" and trace.total_steps > len(trace):
+            st.caption(f"Hiển thị {trace.head} bước đầu và {trace.tail} bước cuối trong tổng số {trace.total_steps} bước.")
+        elif trace.mode == "every" and trace.every > 1:
+            st.caption(f"Hiển thị mỗi {trace.every} bước trong tổng số {trace.total_steps} bước.")
+        rows = trace.rows()
+        if trace.mode == "paged":
+            page = st.number_input(f"Trang (1 - {trace.n_pages})", min_value=1, max_value=trace.n_pages,
+                                   value=1, step=1, key=f"{key}_page")
+            rows = trace.page(int(page) - 1)
+        tab1, tab2 = st.tabs(["Giải thích từng bước", "Bảng dữ liệu chi tiết"])
+        with tab1:
+            with instrument.phase("trace_format"):
+                explanations = trace.explanations(rows)
+            tab1.markdown("\n".join(explanations))
+        with tab2:
+            df_steps = trace.dataframe(rows)
+            tab2.dataframe(df_steps.style.format("{:.6f}", subset=df_steps.select_dtypes("number").columns))
+def render_instrumentation(instrument, profiler=None):
+    """
+    Bảng hiệu năng: thời gian từng giai đoạn (parse, lambdify, đạo hàm
+    Taylor, vòng lặp, định dạng vết, bảng, đồ thị), số lần gọi các hàm số
+    học, thống kê bước của bộ giải và (nếu có) báo cáo cProfile.
+    """
+    with st.expander("Hiệu năng (instrumentation)", expanded=True):
+        df_phases = instrument.dataframe()
+        st.dataframe(df_phases.style.format({"seconds": "{:.6f}", "share": "{:.1%}"}))
+        evaluations = instrument.evaluations()
+        if evaluations:
+            st.markdown("Số lần gọi: " + ", ".join(f"`{name}` = {count}" for name, count in evaluations.items()))
+        if instrument.stats:
+            st.markdown("Thống kê bộ giải: " + ", ".join(f"`{name}` = {value}" for name, value in instrument.stats.items()))
+        st.caption("Giai đoạn bảng, đồ thị và định dạng vết được cộng dồn qua các lần hiển thị lại.")
+        if profiler is not None:
+            st.code(profiler.report(20), language="text")